@@ -0,0 +1,331 @@
+# benchmarks/run_benchmarks.py
+"""
+离线基准测试
+
+启动本地模型桩服务（src/ai_agent/model_stub_server.py）与主应用，把智谱 / OpenRouter / CogVideoX
+的请求全部指向桩服务，对主要接口施加并发负载，统计吞吐量与 p50/p95/p99 延迟，结果写为 JSON。
+
+用法:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scenarios deduction_simulate game_battle --concurrency 32
+    python -m benchmarks.run_benchmarks --zhipu-failure-rate 0.3 --cache-mode warm
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+
+--compare 指定基线结果时，任一场景 p95 退化超过 --regression-threshold 则以非零状态退出。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+
+@dataclass
+class Scenario:
+    """一个被测接口"""
+    name: str
+    method: str
+    path: str
+    # 请求序号 -> 请求体；cache_mode 为 warm 时序号固定为 0，所有请求相同
+    make_body: Optional[Callable[[int], Dict[str, Any]]] = None
+    # 响应 JSON -> 是否为降级结果（上游失败后返回的兜底数据）
+    is_degraded: Optional[Callable[[Dict[str, Any]], bool]] = None
+    # 默认请求数（视频等慢接口较少）
+    requests: int = 200
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(
+            "military_analysis", "POST", "/api/v1/llm/military-analysis",
+            make_body=lambda i: {"prompt": f"分析赤壁之战中火攻取胜的关键因素（基准 {i}）"},
+            is_degraded=lambda data: str(data.get("response", "")).startswith("服务暂时不可用"),
+        ),
+        Scenario(
+            "deduction_simulate", "POST", "/api/v1/deduction/simulate",
+            make_body=lambda i: {"prompt": f"基准测试虚构战役 {i}"},
+            is_degraded=lambda data: "演示数据" in str(data.get("title", "")),
+        ),
+        Scenario("game_battle", "GET", "/api/v1/game/battle/chibi_208", requests=2000),
+        Scenario("dynasty_quick_search", "GET", "/api/v1/dynasty/quick-search?query=长安", requests=2000),
+        Scenario(
+            "generate_video", "POST", "/api/v1/multimodal/generate-video",
+            make_body=lambda i: {
+                "text": f"赤壁之战火烧连营（基准 {i}）",
+                "steps": [{"description": f"基准阶段 {i}", "actions": [{"type": "path", "label": "渡江"}]}]
+            },
+            is_degraded=lambda data: "stub-video" not in str(data.get("video_url", "")),
+            requests=40,
+        ),
+    )
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], wall_seconds: float, statuses: Dict[str, int], degraded: int) -> Dict[str, Any]:
+    values = sorted(latencies)
+    completed = len(values)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": completed,
+        "errors": errors,
+        "degraded": degraded,
+        "statuses": dict(sorted(statuses.items())),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(completed / wall_seconds, 2) if wall_seconds > 0 else None,
+        "latency_ms": {
+            "min": ms(values[0]) if values else None,
+            "mean": ms(sum(values) / completed) if values else None,
+            "p50": ms(percentile(values, 50)),
+            "p95": ms(percentile(values, 95)),
+            "p99": ms(percentile(values, 99)),
+            "max": ms(values[-1]) if values else None,
+        }
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int,
+                       cache_mode: str) -> Dict[str, Any]:
+    """以固定并发发送 requests 个请求"""
+    counter = itertools.count()
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    degraded = 0
+
+    async def worker():
+        nonlocal degraded
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            body = scenario.make_body(0 if cache_mode == "warm" else i) if scenario.make_body else None
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, scenario.path, json=body)
+                status = str(response.status_code)
+                if scenario.is_degraded and response.status_code == 200 and scenario.is_degraded(response.json()):
+                    degraded += 1
+            except ValueError:
+                status = "invalid_json"
+            except httpx.HTTPError as e:
+                status = f"error:{type(e).__name__}"
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, requests)))))
+    return summarize(latencies, time.perf_counter() - start, statuses, degraded)
+
+
+def _spawn(module_app: str, port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module_app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+async def _wait_until(url: str, timeout: float, expect_status: int = 200):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == expect_status:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"等待 {url} 就绪超时")
+
+
+def _stub_env(args) -> Dict[str, str]:
+    env = {"MODEL_STUB_LATENCY_MS": str(args.latency_ms), "MODEL_STUB_JITTER_MS": str(args.jitter_ms)}
+    for backend in ("zhipu", "openrouter", "video"):
+        rate = getattr(args, f"{backend}_failure_rate")
+        if rate is not None:
+            env[f"{backend.upper()}_STUB_FAILURE_RATE"] = str(rate)
+    env["MODEL_STUB_MALFORMED_RATE"] = str(args.malformed_rate)
+    env["VIDEO_STUB_TASK_DURATION_MS"] = str(args.video_task_ms)
+    return env
+
+
+def _app_env(args, stub_url: str, cache_dir: str) -> Dict[str, str]:
+    return {
+        "ZHIPUAI_API_KEY": "bench.stubsecret",
+        "ZHIPUAI_BASE_URL": f"{stub_url}/api/paas/v4",
+        "OPENROUTER_API_KEY": "bench-stub",
+        "OPENROUTER_ENDPOINT": f"{stub_url}/api/v1/chat/completions",
+        "VIDEO_POLL_INTERVAL": str(args.video_poll_interval),
+        # 每次运行使用独立的缓存，结果不受上次运行影响
+        "CACHE_BACKEND": args.cache_backend,
+        "CACHE_DIR": cache_dir,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """返回 p95 退化超过阈值（百分比）的场景说明"""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        now_p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if now_p95 is None or not base_p95:
+            continue
+        change = (now_p95 - base_p95) / base_p95 * 100
+        result["p95_change_pct"] = round(change, 1)
+        if change > threshold:
+            regressions.append(f"{name}: p95 {base_p95} ms -> {now_p95} ms (+{change:.1f}%)")
+    return regressions
+
+
+async def run(args) -> Dict[str, Any]:
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = args.base_url or f"http://127.0.0.1:{args.app_port}"
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache_dir = os.path.join(args.output_dir, f".cache-{run_id}")
+
+    processes = []
+    try:
+        if not args.base_url:
+            base_env = dict(os.environ)
+            stub_env = {**base_env, **_stub_env(args)}
+            processes.append(_spawn("src.ai_agent.model_stub_server:app", args.stub_port, stub_env,
+                                    os.path.join(args.output_dir, "stub.log")))
+            await _wait_until(f"{stub_url}/v1/stats", args.startup_timeout)
+
+            app_env = {**base_env, **_app_env(args, stub_url, cache_dir)}
+            processes.append(_spawn("src.main:app", args.app_port, app_env, os.path.join(args.output_dir, "app.log")))
+            # 预热完成后再开始计时，避免首批请求承担数据加载开销
+            await _wait_until(f"{app_url}/readyz", args.startup_timeout)
+
+        results = {}
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=app_url, timeout=args.request_timeout, limits=limits) as client:
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                requests = args.requests or scenario.requests
+                print(f"[{name}] {requests} 个请求，并发 {args.concurrency} ...", flush=True)
+                results[name] = await run_scenario(client, scenario, requests, args.concurrency, args.cache_mode)
+                latency = results[name]["latency_ms"]
+                print(f"[{name}] {results[name]['throughput_rps']} req/s, p50 {latency['p50']} ms, "
+                      f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, 错误 {results[name]['errors']}, "
+                      f"降级 {results[name]['degraded']}", flush=True)
+
+        upstream_stats = None
+        if not args.base_url:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                upstream_stats = (await client.get(f"{stub_url}/v1/stats")).json()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "run_id": run_id,
+        "git_commit": _git_commit(),
+        "config": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "cache_mode": args.cache_mode,
+            "cache_backend": args.cache_backend,
+            "upstream_latency_ms": args.latency_ms,
+            "upstream_jitter_ms": args.jitter_ms,
+            "failure_rates": {
+                backend: getattr(args, f"{backend}_failure_rate") for backend in ("zhipu", "openrouter", "video")
+            },
+            "malformed_rate": args.malformed_rate,
+            "video_task_ms": args.video_task_ms,
+        },
+        "scenarios": results,
+        "upstream_stats": upstream_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地模型桩服务的离线基准测试")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=None, help="每个场景的请求数（缺省按场景）")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cache-mode", choices=("cold", "warm"), default="cold",
+                        help="cold: 每个请求的提示词不同；warm: 所有请求相同，测缓存命中路径")
+    parser.add_argument("--cache-backend", default="memory", help="被测应用的 CACHE_BACKEND")
+    parser.add_argument("--latency-ms", type=float, default=300, help="桩服务的上游延迟")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--zhipu-failure-rate", type=float, default=None)
+    parser.add_argument("--openrouter-failure-rate", type=float, default=None)
+    parser.add_argument("--video-failure-rate", type=float, default=None)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="推演请求返回非法 JSON 的比例")
+    parser.add_argument("--video-task-ms", type=float, default=2000, help="视频任务从提交到完成的耗时")
+    parser.add_argument("--video-poll-interval", type=float, default=0.5)
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--base-url", default=None, help="压测已在运行的服务（不启动桩服务与应用）")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--output-dir", default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--output", default=None, help="结果文件路径（缺省为 <output-dir>/bench-<时间>.json）")
+    parser.add_argument("--compare", default=None, help="基线结果 JSON，用于检测退化")
+    parser.add_argument("--regression-threshold", type=float, default=20.0, help="p95 退化阈值（百分比）")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.regression_threshold)
+        report["regressions"] = regressions
+
+    output = args.output or os.path.join(args.output_dir, f"bench-{report['run_id']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
+
+    if regressions:
+        print("检测到性能退化:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+# src/ai_agent/battle_engine.py
+"""
+固定时间步长的确定性战役模拟引擎
+
+以 BattleLOD 的初始部署（团级单位）为起点，逐 tick 推进：
+1. 每个单位寻找最近的敌方单位
+2. 未进入射程的单位按兵种速度、队形 movement_speed、地形与天气修正向目标移动；溃散单位背离敌军撤退
+3. 进入射程的单位造成伤亡，按兵种攻防、队形 combat_bonus、地形与冲锋加成结算；
+   提供高程网格时，远程单位只在与目标通视时射击，高处一方获得攻击加成
+4. 伤亡降低士气，士气耗尽的单位溃散；参战方的有效兵力低于阈值时全军溃散
+
+单位状态以结构数组（structure-of-arrays）的 NumPy 数组保存，每个 tick 对所有单位做向量运算，
+20 万人（约 200 个团级单位）数小时的战斗在数秒内即可模拟完成。
+同一输入与随机种子的结果完全一致，输出的回放轨迹与 /battle/{id}/tracks 格式相同（TrackSet）。
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.ai_agent.battle_lod import METERS_PER_DEGREE, BattleLOD
+from src.ai_agent.battle_tracks import DEFAULT_SAMPLES, MAX_SAMPLES, TrackSet
+from src.ai_agent.formations import resolve_formation
+from src.ai_agent.terrain import ElevationGrid
+
+# 兵种属性换算：速度每点 0.3 m/s（步兵 3 点约为 3 km/h 行军），射程每点 25 m
+SPEED_M_S_PER_POINT = 0.3
+RANGE_M_PER_POINT = 25.0
+MELEE_RANGE_M = 50.0
+# 队形 combat_bonus 每点的加成比例；地形不满足 terrain_requirements 时加成减半
+BONUS_PER_POINT = 0.05
+# 每名士兵每秒按攻击力造成的伤亡
+LETHALITY = 1e-4
+# 伤亡比例对士气的冲击倍数，以及脱离接触后每秒恢复的士气
+MORALE_SHOCK = 25.0
+MORALE_RECOVERY = 0.002
+# 冲锋加成持续时间（秒）
+CHARGE_DURATION_S = 60.0
+# 溃散单位撤退速度倍数，以及距离敌军多远后停止撤退
+ROUT_SPEED_FACTOR = 1.2
+ESCAPE_DISTANCE_M = 5000.0
+# 参战方有效兵力（未溃散）低于初始兵力的该比例时全军溃散
+FORCE_BREAK_RATIO = 0.25
+# 兵力低于该值的单位视为已被消灭
+MIN_STRENGTH = 1.0
+# 高差每米的攻击加成比例，以及加成倍数的上下限
+HEIGHT_ADVANTAGE_PER_M = 0.005
+HEIGHT_ADVANTAGE_LIMITS = (0.8, 1.25)
+# 远程单位的观察高度（米，离地）
+RANGED_EYE_HEIGHT = 3.0
+
+# 地形：标签（与队形 terrain_requirements 对应）与移动、防御、冲锋、远程修正
+TERRAIN_MODIFIERS: Dict[str, Dict[str, Any]] = {
+    "plains": {"tags": ("flat", "open", "clear_los"), "movement": 1.0, "defense": 1.0, "charge": 1.2, "ranged": 1.0},
+    "river_bank": {"tags": ("flat", "defensive_position"), "movement": 0.7, "defense": 1.2, "charge": 0.8, "ranged": 1.0},
+    "hill_plains": {"tags": ("elevated", "open", "defensive_position"), "movement": 0.85, "defense": 1.15, "charge": 0.9, "ranged": 1.1},
+    "rolling_hills": {"tags": ("elevated", "open"), "movement": 0.9, "defense": 1.1, "charge": 1.0, "ranged": 1.1},
+    "hills_and_plains": {"tags": ("elevated", "flat", "open"), "movement": 0.9, "defense": 1.1, "charge": 1.0, "ranged": 1.05},
+}
+DEFAULT_TERRAIN = {"tags": ("open",), "movement": 1.0, "defense": 1.0, "charge": 1.0, "ranged": 1.0}
+
+# 天气对移动与远程攻击的修正
+WEATHER_MODIFIERS: Dict[str, Dict[str, float]] = {
+    "clear": {"movement": 1.0, "ranged": 1.0},
+    "windy": {"movement": 1.0, "ranged": 0.8},
+    "rain": {"movement": 0.8, "ranged": 0.6},
+    "fog": {"movement": 0.9, "ranged": 0.5},
+    "snow": {"movement": 0.7, "ranged": 0.7},
+}
+
+# 兵种目录中没有的兵种按名称关键字取默认属性：(速度, 攻击, 防御, 射程, 冲锋, 士气)
+_FALLBACK_STATS = (
+    ("cavalry", (8.0, 10.0, 6.0, 1.0, 12.0, 7.0)),
+    ("artillery", (2.0, 18.0, 4.0, 8.0, 0.0, 6.0)),
+    ("archer", (5.0, 6.0, 3.0, 8.0, 1.0, 5.0)),
+)
+_DEFAULT_STATS = (4.0, 7.0, 6.0, 1.0, 3.0, 6.0)
+
+
+@dataclass
+class SimulationConfig:
+    """模拟参数"""
+    time_step: float = 5.0
+    max_duration: float = 6 * 3600.0
+    samples: int = DEFAULT_SAMPLES
+    seed: int = 0
+    # 缺省取时间线第一个事件的天气
+    weather: Optional[str] = None
+
+
+@dataclass
+class SimulationResult:
+    """模拟结果：回放轨迹、事件时间线与各参战方统计"""
+    tracks: TrackSet
+    events: List[Dict[str, Any]]
+    forces: Dict[str, Dict[str, Any]]
+    winner: Optional[str]
+    ticks: int
+    simulated_seconds: float
+    wall_ms: float
+    terrain: str
+    weather: str
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "winner": self.winner,
+            "ticks": self.ticks,
+            "simulated_seconds": self.simulated_seconds,
+            "wall_ms": round(self.wall_ms, 1),
+            "terrain": self.terrain,
+            "weather": self.weather,
+            "forces": self.forces,
+            "events": self.events,
+        }
+
+
+def _unit_stats(unit_type: str, unit_stats: Callable[[str], Any] = None) -> Tuple[float, ...]:
+    unit = unit_stats(unit_type) if unit_stats else None
+    if unit is not None:
+        return (unit.speed, unit.attack_power, unit.defense_rating, unit.range, unit.charge_bonus, unit.morale)
+    for keyword, stats in _FALLBACK_STATS:
+        if keyword in unit_type:
+            return stats
+    return _DEFAULT_STATS
+
+
+def _formation_modifiers(name: str, terrain_tags: Tuple[str, ...]) -> Tuple[float, float, float, float, float]:
+    """(速度倍数, 近战倍数, 远程倍数, 防御倍数, 冲锋加成点数)"""
+    formation = resolve_formation(name)
+    if formation is None:
+        return (0.5 + 3 / 8, 1.0, 1.0, 1.0, 0.0)
+    data = formation["animation_data"]
+    bonus = data.get("combat_bonus", {})
+    requirements = data.get("terrain_requirements", [])
+    factor = 1.0 if not requirements or set(requirements) & set(terrain_tags) else 0.5
+    speed = (0.5 + data.get("movement_speed", 3) / 8) * (1 + BONUS_PER_POINT * bonus.get("speed", 0) * factor)
+    melee = 1 + BONUS_PER_POINT * (bonus.get("melee", 0) + bonus.get("discipline", 0)) * factor
+    ranged = 1 + BONUS_PER_POINT * (bonus.get("ranged", 0) + bonus.get("volley_fire", 0) + bonus.get("area_damage", 0)) * factor
+    defense = 1 + BONUS_PER_POINT * bonus.get("defense", 0) * factor
+    return (speed, melee, ranged, defense, bonus.get("charge", 0) * factor)
+
+
+def _battle_weather(battle_data: Dict[str, Any]) -> str:
+    for event in battle_data.get("battle_timeline", []):
+        weather = (event.get("effects") or {}).get("weather")
+        if weather:
+            return weather
+    return "clear"
+
+
+def _nearest_enemy(x: np.ndarray, y: np.ndarray, force: np.ndarray, present: np.ndarray,
+                   chunk: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """每个单位最近的敌方单位序号与距离；没有敌方单位时序号为 -1、距离为 inf"""
+    n = len(x)
+    target = np.full(n, -1, dtype=np.int64)
+    dist = np.full(n, np.inf)
+    candidates = np.flatnonzero(present)
+    if len(candidates) == 0:
+        return target, dist
+    cx, cy, cf = x[candidates], y[candidates], force[candidates]
+    for start in range(0, n, chunk):
+        rows = slice(start, min(start + chunk, n))
+        d2 = (x[rows, None] - cx[None, :]) ** 2 + (y[rows, None] - cy[None, :]) ** 2
+        d2[force[rows, None] == cf[None, :]] = np.inf
+        best = np.argmin(d2, axis=1)
+        best_d2 = d2[np.arange(d2.shape[0]), best]
+        found = np.isfinite(best_d2)
+        target[rows] = np.where(found, candidates[best], -1)
+        dist[rows] = np.sqrt(best_d2)
+    return target, dist
+
+
+def simulate_battle(battle_data: Dict[str, Any], config: SimulationConfig = None,
+                    unit_stats: Callable[[str], Any] = None,
+                    unit_name: Callable[[str], str] = None,
+                    elevation: ElevationGrid = None) -> SimulationResult:
+    """
+    模拟一场战役
+
+    Args:
+        battle_data: historical_battles.json 中的战役数据（可先经 apply_scenario_modifications 修改）
+        config: 模拟参数
+        unit_stats: 兵种类型 -> UnitDefinition（兵种目录），缺省按名称关键字取默认属性
+        unit_name: 兵种类型 -> 显示名称
+        elevation: 战役范围的高程网格（terrain.build_battle_terrain），缺省不考虑高差与通视
+
+    Returns:
+        SimulationResult
+    """
+    config = config or SimulationConfig()
+    wall_start = time.perf_counter()
+    unit_name = unit_name or (lambda unit_type: unit_type)
+    rng = np.random.default_rng(config.seed)
+
+    terrain_type = battle_data.get("location", {}).get("terrain_type", "")
+    terrain = TERRAIN_MODIFIERS.get(terrain_type, DEFAULT_TERRAIN)
+    weather_name = config.weather or _battle_weather(battle_data)
+    if not isinstance(weather_name, str) or weather_name not in WEATHER_MODIFIERS:
+        # 战役数据中未收录的天气按晴天模拟，结果中的天气与实际使用的一致
+        weather_name = "clear"
+    weather = WEATHER_MODIFIERS[weather_name]
+
+    lod = BattleLOD(battle_data)
+    regiments = lod.frames[0]
+    force_ids = list(lod.participants)
+    n = len(regiments)
+
+    # ---- 结构数组：每个数组一个属性，下标为单位序号 ----
+    origin_lon = sum(r.lon for r in regiments) / n if n else 0.0
+    origin_lat = sum(r.lat for r in regiments) / n if n else 0.0
+    cos_lat = max(math.cos(math.radians(origin_lat)), 1e-6)
+    x = np.array([(r.lon - origin_lon) * METERS_PER_DEGREE * cos_lat for r in regiments], dtype=np.float64)
+    y = np.array([(r.lat - origin_lat) * METERS_PER_DEGREE for r in regiments], dtype=np.float64)
+    force = np.array([force_ids.index(r.force_id) for r in regiments], dtype=np.int64)
+    strength = np.array([r.count for r in regiments], dtype=np.float64)
+    initial_strength = strength.copy()
+
+    stats = np.array([_unit_stats(r.unit_type, unit_stats) for r in regiments], dtype=np.float64).reshape(n, 6)
+    modifiers = np.array([_formation_modifiers(r.formation, terrain["tags"]) for r in regiments], dtype=np.float64).reshape(n, 5)
+    speed = stats[:, 0] * SPEED_M_S_PER_POINT * modifiers[:, 0] * terrain["movement"] * weather["movement"]
+    attack = stats[:, 1]
+    range_m = np.maximum(stats[:, 3] * RANGE_M_PER_POINT, MELEE_RANGE_M)
+    is_ranged = stats[:, 3] > 1
+    attack_mult = np.where(is_ranged, modifiers[:, 2] * terrain["ranged"] * weather["ranged"], modifiers[:, 1])
+    charge_mult = 1 + BONUS_PER_POINT * (stats[:, 4] + modifiers[:, 4]) * terrain["charge"]
+    defense_factor = 1 + 0.1 * stats[:, 2] * modifiers[:, 3] * terrain["defense"]
+    force_morale = np.array([float(lod.participants[fid].get("morale", 5)) for fid in force_ids])
+    morale = (stats[:, 5] + force_morale[force]) / 2
+    initial_morale = morale.copy()
+    routed = np.zeros(n, dtype=bool)
+    contact_time = np.zeros(n, dtype=np.float64)
+    force_initial = np.bincount(force, weights=initial_strength, minlength=len(force_ids))
+    force_broken = np.zeros(len(force_ids), dtype=bool)
+
+    use_elevation = elevation is not None and elevation.source != "flat"
+
+    dt = float(config.time_step)
+    max_ticks = max(1, int(math.ceil(config.max_duration / dt)))
+    samples = max(1, min(int(config.samples), MAX_SAMPLES))
+    record_every = max(1, max_ticks // (samples * 2))
+
+    recorded_t = [0.0]
+    recorded = [(x.copy(), y.copy(), strength.copy())]
+    events: List[Dict[str, Any]] = []
+    first_contact = None
+    tick = 0
+    t = 0.0
+
+    for tick in range(1, max_ticks + 1):
+        t = tick * dt
+        present = strength > MIN_STRENGTH
+        fighting = present & ~routed
+        target, dist = _nearest_enemy(x, y, force, present)
+        has_target = target >= 0
+        safe_target = np.where(has_target, target, 0)
+        dx = np.where(has_target, x[safe_target] - x, 0.0)
+        dy = np.where(has_target, y[safe_target] - y, 0.0)
+        norm = np.where(dist > 0, dist, 1.0)
+
+        # 移动：未进入射程的作战单位接近目标（不越过射程），溃散单位背离最近敌军
+        advancing = fighting & has_target & (dist > range_m)
+        step = np.where(advancing, np.minimum(speed * dt, dist - range_m * 0.9), 0.0)
+        fleeing = present & routed & has_target & (dist < ESCAPE_DISTANCE_M)
+        step = np.where(fleeing, -speed * ROUT_SPEED_FACTOR * dt, step)
+        x += dx / norm * step
+        y += dy / norm * step
+
+        # 战斗：射程内的作战单位对目标造成伤亡（冲锋加成只在接敌后的前 CHARGE_DURATION_S 秒内生效）
+        engaged = fighting & has_target & (dist <= range_m * 1.001)
+        in_melee = engaged & (dist <= MELEE_RANGE_M * 1.001)
+        contact_time = np.where(in_melee, contact_time + dt, 0.0)
+        if first_contact is None and engaged.any():
+            first_contact = t
+            events.append({"time": t, "type": "contact", "description": "两军接敌"})
+        power = strength * attack * attack_mult * LETHALITY * dt
+        if use_elevation and engaged.any():
+            power *= _elevation_factor(elevation, x, y, safe_target, engaged, in_melee, is_ranged,
+                                       (origin_lon, origin_lat), cos_lat)
+        power = np.where(in_melee & (contact_time <= CHARGE_DURATION_S), power * charge_mult, power)
+        power *= rng.uniform(0.9, 1.1, size=n)
+        raw = np.zeros(n)
+        np.add.at(raw, target[engaged], power[engaged])
+        # 溃散单位无法组织防御
+        losses = np.minimum(raw / np.where(routed, defense_factor * 0.5, defense_factor), strength)
+        strength -= losses
+
+        # 士气：伤亡带来冲击，脱离接触后缓慢恢复
+        hit = losses > 0
+        morale -= losses / np.maximum(initial_strength, 1.0) * MORALE_SHOCK
+        recovering = ~hit & ~engaged & ~routed
+        morale = np.where(recovering, np.minimum(initial_morale, morale + MORALE_RECOVERY * dt), morale)
+        newly_routed = fighting & (morale <= 0) & (strength > MIN_STRENGTH)
+        routed |= morale <= 0
+        for i in np.flatnonzero(newly_routed):
+            regiment = regiments[i]
+            events.append({
+                "time": t, "type": "rout", "force_id": regiment.force_id,
+                "unit_id": f"{regiment.force_id}/{regiment.corps_index}/{i}",
+                "description": f"{unit_name(regiment.unit_type)} 溃散"
+            })
+
+        # 参战方有效兵力低于阈值时全军溃散
+        effective = np.bincount(force, weights=np.where(routed, 0.0, strength), minlength=len(force_ids))
+        for f in np.flatnonzero(~force_broken & (effective < force_initial * FORCE_BREAK_RATIO)):
+            force_broken[f] = True
+            routed |= force == f
+            events.append({
+                "time": t, "type": "force_broken", "force_id": force_ids[f],
+                "description": f"{lod.participants[force_ids[f]].get('name', force_ids[f])} 全军溃败"
+            })
+            effective[f] = 0.0
+
+        if tick % record_every == 0:
+            recorded_t.append(t)
+            recorded.append((x.copy(), y.copy(), strength.copy()))
+        if np.count_nonzero(effective > MIN_STRENGTH) <= 1:
+            break
+
+    if recorded_t[-1] != t:
+        recorded_t.append(t)
+        recorded.append((x.copy(), y.copy(), strength.copy()))
+
+    effective = np.bincount(force, weights=np.where(routed, 0.0, strength), minlength=len(force_ids))
+    remaining = np.bincount(force, weights=strength, minlength=len(force_ids))
+    standing = np.flatnonzero(effective > MIN_STRENGTH)
+    winner = force_ids[standing[0]] if len(standing) == 1 else None
+    events.append({
+        "time": t, "type": "end",
+        "description": f"{lod.participants[winner].get('name', winner)} 获胜" if winner else "胜负未分"
+    })
+
+    forces = {
+        fid: {
+            "initial": int(round(force_initial[f])),
+            "remaining": int(round(remaining[f])),
+            "effective": int(round(effective[f])),
+            "casualties": int(round(force_initial[f] - remaining[f])),
+            "routed_units": int(np.count_nonzero(routed & (force == f))),
+            "broken": bool(force_broken[f]),
+        }
+        for f, fid in enumerate(force_ids)
+    }
+
+    tracks = _build_tracks(regiments, recorded_t, recorded, samples, (origin_lon, origin_lat), cos_lat,
+                           unit_name, battle_data, [e["time"] for e in events])
+    return SimulationResult(
+        tracks=tracks,
+        events=events,
+        forces=forces,
+        winner=winner,
+        ticks=tick,
+        simulated_seconds=t,
+        wall_ms=(time.perf_counter() - wall_start) * 1000,
+        terrain=terrain_type,
+        weather=weather_name,
+    )
+
+
+def _elevation_factor(grid: ElevationGrid, x: np.ndarray, y: np.ndarray, target: np.ndarray,
+                      engaged: np.ndarray, in_melee: np.ndarray, is_ranged: np.ndarray,
+                      origin: Tuple[float, float], cos_lat: float) -> np.ndarray:
+    """高差攻击倍数；远程射击与目标不通视时为 0"""
+    factor = np.ones(len(x))
+    rows = np.flatnonzero(engaged)
+    lon = origin[0] + x / (METERS_PER_DEGREE * cos_lat)
+    lat = origin[1] + y / METERS_PER_DEGREE
+    elevation = grid.heights_at(lon, lat)
+    dh = elevation[rows] - elevation[target[rows]]
+    factor[rows] = np.clip(1 + HEIGHT_ADVANTAGE_PER_M * dh, *HEIGHT_ADVANTAGE_LIMITS)
+    shooting = rows[is_ranged[rows] & ~in_melee[rows]]
+    if len(shooting):
+        visible = grid.line_of_sight(lon[shooting], lat[shooting], lon[target[shooting]], lat[target[shooting]],
+                                        height_a=RANGED_EYE_HEIGHT)
+        factor[shooting[~visible]] = 0.0
+    return factor
+
+
+def _build_tracks(regiments, recorded_t: List[float], recorded: List[Tuple[np.ndarray, ...]], samples: int,
+                  origin: Tuple[float, float], cos_lat: float, unit_name: Callable[[str], str],
+                  battle_data: Dict[str, Any], keyframe_times: List[float]) -> TrackSet:
+    """把记录的状态重采样为固定时间步长的 TrackSet（与战役时间线编译出的轨迹格式相同）"""
+    times = np.array(recorded_t)
+    # [记录点, 通道, 单位]
+    states = np.stack([np.stack(state) for state in recorded])
+    duration = float(times[-1])
+    if duration <= 0 or samples == 1:
+        samples, step = 1, 0.0
+        resampled = states[:1]
+    else:
+        step = duration / (samples - 1)
+        t = np.arange(samples) * step
+        # duration > 0 时至少有两个记录点
+        k = np.clip(np.searchsorted(times, t, side="right") - 1, 0, len(times) - 2)
+        w = np.clip((t - times[k]) / np.maximum(times[k + 1] - times[k], 1e-9), 0.0, 1.0)[:, None, None]
+        resampled = states[k] * (1 - w) + states[k + 1] * w
+
+    # 米 -> 相对 origin 的经纬度偏移；显式小端序 float32
+    channels = np.empty((len(regiments), samples, 3), dtype="<f4")
+    channels[:, :, 0] = (resampled[:, 0, :] / (METERS_PER_DEGREE * cos_lat)).T
+    channels[:, :, 1] = (resampled[:, 1, :] / METERS_PER_DEGREE).T
+    channels[:, :, 2] = resampled[:, 2, :].T
+
+    units = [{
+        "id": f"{r.force_id}/{r.corps_index}/{i}",
+        "tier": "regiment",
+        "force_id": r.force_id,
+        "unit_type": r.unit_type,
+        "name": unit_name(r.unit_type),
+        "formation": r.formation,
+    } for i, r in enumerate(regiments)]
+    timeline = battle_data.get("battle_timeline", [])
+    return TrackSet(
+        units=units,
+        origin=(round(origin[0], 6), round(origin[1], 6)),
+        start_time=timeline[0].get("timestamp") if timeline else None,
+        duration_seconds=duration,
+        time_step_seconds=step,
+        samples=samples,
+        keyframe_times=keyframe_times,
+        data=channels.tobytes(),
+    )
@@ -0,0 +1,292 @@
+# src/ai_agent/battle_lod.py
+"""
+大规模军队渲染的服务端细节层次（LOD）聚合
+
+把 historical_battles.json 中各参战方的兵力编成展开为团级单位，并沿战役时间线推算
+每个时间点的位置与剩余兵力，再按缩放级别聚合为：
+- regiment: 团级单位（近距离）
+- corps:    按兵种编成聚合的军团（中距离）
+- army:     整支参战方（远距离）
+同时按缩放级别对单位做网格聚类，生成客户端可直接绘制的兵力团块。
+
+客户端只需请求当前视野能显示的细节层次，不再为每个士兵创建实体。
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# 每个团级单位的人数（炮兵等按门数计的单位不足一团时算作一团）
+REGIMENT_SIZE = int(os.getenv("LOD_REGIMENT_SIZE", "1000"))
+# 团级单位之间的间距（米）
+REGIMENT_SPACING_M = 150.0
+# 军团之间的横向间隔（米）
+CORPS_GAP_M = 300.0
+# 参战方向事件地点移动的比例
+EVENT_PULL = 0.5
+# 缩放级别阈值：小于 CORPS_MIN_ZOOM 显示 army，小于 REGIMENT_MIN_ZOOM 显示 corps
+CORPS_MIN_ZOOM = 9
+REGIMENT_MIN_ZOOM = 12
+MAX_ZOOM = 20
+# 聚类网格：每个瓦片宽度划分的格数
+CLUSTER_CELLS_PER_TILE = 4
+
+METERS_PER_DEGREE = 111320.0
+
+LOD_TIERS = ("army", "corps", "regiment")
+
+
+@dataclass
+class Regiment:
+    """团级单位（LOD 的最小粒度）"""
+    force_id: str
+    corps_index: int
+    unit_type: str
+    formation: str
+    count: float
+    lon: float
+    lat: float
+
+
+def tier_for_zoom(zoom: int) -> str:
+    """根据缩放级别选择细节层次"""
+    if zoom < CORPS_MIN_ZOOM:
+        return "army"
+    if zoom < REGIMENT_MIN_ZOOM:
+        return "corps"
+    return "regiment"
+
+
+def cluster_cell_degrees(zoom: int) -> float:
+    """聚类网格的单元大小（经度），与 Web 墨卡托瓦片宽度对应"""
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+
+def _offset(lon: float, lat: float, east_m: float, north_m: float) -> Tuple[float, float]:
+    """在 (lon, lat) 处按米偏移，返回新的经纬度"""
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    return (
+        lon + east_m / (METERS_PER_DEGREE * cos_lat),
+        lat + north_m / METERS_PER_DEGREE
+    )
+
+
+def _distance_m(a: Sequence[float], b: Sequence[float]) -> float:
+    cos_lat = math.cos(math.radians((a[1] + b[1]) / 2))
+    dx = (a[0] - b[0]) * METERS_PER_DEGREE * cos_lat
+    dy = (a[1] - b[1]) * METERS_PER_DEGREE
+    return math.hypot(dx, dy)
+
+
+def _facing(center: Sequence[float], enemies: List[Sequence[float]]) -> Tuple[float, float]:
+    """参战方朝向敌军重心的单位向量（东, 北）；没有敌军时朝北"""
+    if not enemies:
+        return (0.0, 1.0)
+    ex = sum(p[0] for p in enemies) / len(enemies)
+    ey = sum(p[1] for p in enemies) / len(enemies)
+    cos_lat = math.cos(math.radians(center[1]))
+    dx = (ex - center[0]) * cos_lat
+    dy = ey - center[1]
+    norm = math.hypot(dx, dy)
+    if norm < 1e-9:
+        return (0.0, 1.0)
+    return (dx / norm, dy / norm)
+
+
+def _deploy_force(participant: Dict[str, Any], center: Sequence[float],
+                  facing: Tuple[float, float]) -> List[Regiment]:
+    """把一个参战方的兵种编成展开为团级单位，军团沿正面横向排开"""
+    fx, fy = facing
+    # 正面方向（朝向右手侧）
+    rx, ry = fy, -fx
+
+    corps_layouts = []
+    for corps_index, unit in enumerate(participant.get("unit_types", [])):
+        count = float(unit.get("count", 0))
+        if count <= 0:
+            continue
+        n_regiments = max(1, math.ceil(count / REGIMENT_SIZE))
+        cols = max(1, math.ceil(math.sqrt(n_regiments * 2)))
+        rows = math.ceil(n_regiments / cols)
+        corps_layouts.append((corps_index, unit, count, n_regiments, cols, rows))
+
+    total_width = sum(layout[4] * REGIMENT_SPACING_M for layout in corps_layouts)
+    total_width += CORPS_GAP_M * max(0, len(corps_layouts) - 1)
+
+    regiments = []
+    cursor = -total_width / 2
+    for corps_index, unit, count, n_regiments, cols, rows in corps_layouts:
+        per_regiment = count / n_regiments
+        for i in range(n_regiments):
+            row, col = divmod(i, cols)
+            across = cursor + (col + 0.5) * REGIMENT_SPACING_M
+            depth = -(row - (rows - 1) / 2) * REGIMENT_SPACING_M
+            lon, lat = _offset(center[0], center[1], rx * across + fx * depth, ry * across + fy * depth)
+            regiments.append(Regiment(
+                force_id=participant["force_id"],
+                corps_index=corps_index,
+                unit_type=unit.get("type", "unknown"),
+                formation=unit.get("formation", ""),
+                count=per_regiment,
+                lon=lon,
+                lat=lat
+            ))
+        cursor += cols * REGIMENT_SPACING_M + CORPS_GAP_M
+    return regiments
+
+
+class BattleLOD:
+    """单场战役的 LOD 数据：每个时间点一帧团级单位"""
+
+    def __init__(self, battle_data: Dict[str, Any]):
+        self.battle_id = battle_data.get("battle_id", "")
+        self.participants = {p["force_id"]: p for p in battle_data.get("participants", [])}
+        self.events = battle_data.get("battle_timeline", [])
+        # 帧 0 为初始部署，之后每个时间线事件一帧
+        self.frames: List[List[Regiment]] = self._build_frames()
+
+    def _build_frames(self) -> List[List[Regiment]]:
+        centers = {fid: tuple(p.get("initial_position", (0.0, 0.0))) for fid, p in self.participants.items()}
+        strength = {fid: 1.0 for fid in self.participants}
+
+        frames = [self._layout(centers, strength)]
+        for event in self.events:
+            location = event.get("location")
+            if location and len(location) >= 2:
+                for fid in event.get("participants", []):
+                    if fid in centers:
+                        cx, cy = centers[fid]
+                        centers[fid] = (cx + (location[0] - cx) * EVENT_PULL, cy + (location[1] - cy) * EVENT_PULL)
+            for fid, ratio in (event.get("casualties") or {}).items():
+                if fid in strength:
+                    strength[fid] = max(0.0, 1.0 - float(ratio))
+            frames.append(self._layout(centers, strength))
+        return frames
+
+    def _layout(self, centers: Dict[str, Tuple[float, float]], strength: Dict[str, float]) -> List[Regiment]:
+        regiments = []
+        for fid, participant in self.participants.items():
+            enemies = [c for other, c in centers.items() if other != fid]
+            force_regiments = _deploy_force(participant, centers[fid], _facing(centers[fid], enemies))
+            for regiment in force_regiments:
+                regiment.count *= strength[fid]
+            # 兵力为 0 的团也保留，保证各帧之间单位序号一致
+            regiments.extend(force_regiments)
+        return regiments
+
+    def frame_index(self, event: Optional[str]) -> Optional[int]:
+        """按事件 ID 或序号（0 为初始部署）定位帧；找不到返回 None"""
+        if event is None or event == "":
+            return 0
+        for i, timeline_event in enumerate(self.events):
+            if timeline_event.get("event_id") == event:
+                return i + 1
+        if event.isdigit() and int(event) < len(self.frames):
+            return int(event)
+        return None
+
+    def aggregate(self, frame: int, tier: str, unit_name: Callable[[str], str] = None,
+                  include_empty: bool = False) -> List[Dict[str, Any]]:
+        """
+        把一帧团级单位聚合到指定细节层次
+
+        Args:
+            include_empty: 是否保留兵力已为 0 的团（逐帧对齐单位时需要）
+        """
+        unit_name = unit_name or (lambda unit_type: unit_type)
+        regiments = self.frames[frame]
+
+        if tier == "regiment":
+            return [{
+                "id": f"{r.force_id}/{r.corps_index}/{i}",
+                "tier": tier,
+                "force_id": r.force_id,
+                "unit_type": r.unit_type,
+                "name": unit_name(r.unit_type),
+                "formation": r.formation,
+                "count": round(r.count),
+                "position": [round(r.lon, 6), round(r.lat, 6)],
+                "radius_m": REGIMENT_SPACING_M / 2
+            } for i, r in enumerate(regiments) if include_empty or r.count > 0]
+
+        groups: Dict[Tuple, List[Regiment]] = {}
+        for r in regiments:
+            key = (r.force_id,) if tier == "army" else (r.force_id, r.corps_index)
+            groups.setdefault(key, []).append(r)
+
+        units = []
+        for key, members in groups.items():
+            center, total, radius = _weighted_center(members)
+            first = members[0]
+            unit = {
+                "id": "/".join(str(k) for k in key),
+                "tier": tier,
+                "force_id": first.force_id,
+                "count": round(total),
+                "position": [round(center[0], 6), round(center[1], 6)],
+                "radius_m": round(radius, 1),
+                "regiments": len(members)
+            }
+            if tier == "army":
+                participant = self.participants[first.force_id]
+                unit["name"] = participant.get("name", first.force_id)
+                unit["commander"] = participant.get("commander", "")
+            else:
+                unit["unit_type"] = first.unit_type
+                unit["name"] = unit_name(first.unit_type)
+                unit["formation"] = first.formation
+            units.append(unit)
+        return units
+
+
+def _weighted_center(regiments: List[Regiment]) -> Tuple[Tuple[float, float], float, float]:
+    """兵力加权重心、总兵力与覆盖半径（米）"""
+    total = sum(r.count for r in regiments)
+    if total <= 0:
+        total_weight, weights = len(regiments), [1.0] * len(regiments)
+    else:
+        total_weight, weights = total, [r.count for r in regiments]
+    lon = sum(r.lon * w for r, w in zip(regiments, weights)) / total_weight
+    lat = sum(r.lat * w for r, w in zip(regiments, weights)) / total_weight
+    radius = max(_distance_m((lon, lat), (r.lon, r.lat)) for r in regiments) + REGIMENT_SPACING_M / 2
+    return (lon, lat), total, radius
+
+
+def cluster_units(units: List[Dict[str, Any]], zoom: int) -> List[Dict[str, Any]]:
+    """
+    按缩放级别对单位做网格聚类（不同参战方不合并），生成兵力团块
+
+    Returns:
+        团块列表: {force_id, position, count, members, radius_m}
+    """
+    cell = cluster_cell_degrees(zoom)
+    cells: Dict[Tuple[str, int, int], List[Dict[str, Any]]] = {}
+    for unit in units:
+        lon, lat = unit["position"]
+        key = (unit["force_id"], math.floor(lon / cell), math.floor(lat / cell))
+        cells.setdefault(key, []).append(unit)
+
+    clusters = []
+    for (force_id, _, _), members in cells.items():
+        total = sum(u["count"] for u in members) or 1
+        lon = sum(u["position"][0] * u["count"] for u in members) / total
+        lat = sum(u["position"][1] * u["count"] for u in members) / total
+        radius = max(_distance_m((lon, lat), u["position"]) + u["radius_m"] for u in members)
+        clusters.append({
+            "force_id": force_id,
+            "position": [round(lon, 6), round(lat, 6)],
+            "count": sum(u["count"] for u in members),
+            "members": [u["id"] for u in members],
+            "radius_m": round(radius, 1)
+        })
+    return clusters
+
+
+def filter_bbox(items: List[Dict[str, Any]], bbox: Tuple[float, float, float, float]) -> List[Dict[str, Any]]:
+    """只保留落在 (west, south, east, north) 范围内的单位/团块"""
+    west, south, east, north = bbox
+    return [
+        item for item in items
+        if west <= item["position"][0] <= east and south <= item["position"][1] <= north
+    ]
@@ -0,0 +1,228 @@
+# src/ai_agent/battle_sweep.py
+"""
+战役参数扫描（what-if 分析）
+
+对一到两个参数（兵力编成倍数、士气、天气）的取值网格逐点运行模拟引擎，
+网格点分发到进程池在多核上并行计算，结果整理为适合绘制热力图的矩阵。
+
+示例：曹操军兵力 1.0 ~ 1.5 倍 × 天气 晴 / 雨
+    {"parameters": [
+        {"name": "composition", "force_id": "cao_cao", "range": {"start": 1.0, "stop": 1.5, "steps": 6}},
+        {"name": "weather", "values": ["clear", "rain"]}
+    ]}
+"""
+
+import os
+import copy
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.ai_agent.battle_engine import WEATHER_MODIFIERS, SimulationConfig, simulate_battle
+from src.ai_agent.terrain import ElevationGrid
+
+logger = logging.getLogger(__name__)
+
+SWEEP_PARAMETERS = ("composition", "morale", "weather")
+MAX_SWEEP_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "100"))
+# 扫描只需要统计结果，不需要回放轨迹
+SWEEP_SAMPLES = 2
+
+
+@dataclass(frozen=True)
+class SweepParameter:
+    """一个扫描维度"""
+    name: str
+    values: Tuple[Any, ...]
+    force_id: Optional[str] = None
+    # composition 只缩放该兵种；缺省缩放该参战方全部兵种
+    unit_type: Optional[str] = None
+
+    def label(self) -> Dict[str, Any]:
+        return {"name": self.name, "force_id": self.force_id, "unit_type": self.unit_type, "values": list(self.values)}
+
+
+def _expand_values(spec: Dict[str, Any]) -> Tuple[Any, ...]:
+    if "values" in spec:
+        values = tuple(spec["values"])
+    elif "range" in spec:
+        rng = spec["range"]
+        start, stop, steps = float(rng["start"]), float(rng["stop"]), int(rng.get("steps", 5))
+        if steps < 1:
+            raise ValueError("range.steps 至少为 1")
+        values = tuple(round(start + (stop - start) * i / (steps - 1), 6) if steps > 1 else start for i in range(steps))
+    else:
+        raise ValueError("参数需要 values 或 range")
+    if not values:
+        raise ValueError("参数取值不能为空")
+    return values
+
+
+def parse_sweep_parameters(specs: Sequence[Dict[str, Any]], battle_data: Dict[str, Any]) -> List[SweepParameter]:
+    """
+    校验并展开扫描参数
+
+    Raises:
+        ValueError: 参数个数、名称、参战方或取值无效，或网格点数超过 SWEEP_MAX_POINTS
+    """
+    if not 1 <= len(specs) <= 2:
+        raise ValueError("需要一到两个扫描参数")
+    force_ids = {p["force_id"] for p in battle_data.get("participants", [])}
+    parameters = []
+    for spec in specs:
+        name = spec.get("name")
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f"不支持的扫描参数: {name}（可选 {', '.join(SWEEP_PARAMETERS)}）")
+        values = _expand_values(spec)
+        force_id = spec.get("force_id")
+        if name == "weather":
+            if not all(isinstance(v, str) for v in values):
+                raise ValueError("天气取值必须是字符串")
+            unknown = [v for v in values if v not in WEATHER_MODIFIERS]
+            if unknown:
+                raise ValueError(f"未知天气: {unknown}")
+        else:
+            if force_id not in force_ids:
+                raise ValueError(f"参数 {name} 需要有效的 force_id（可选 {', '.join(sorted(force_ids))}）")
+            values = tuple(float(v) for v in values)
+            if any(v < 0 for v in values):
+                raise ValueError(f"参数 {name} 的取值不能为负")
+        parameters.append(SweepParameter(name=name, values=values, force_id=force_id, unit_type=spec.get("unit_type")))
+
+    points = 1
+    for parameter in parameters:
+        points *= len(parameter.values)
+    if points > MAX_SWEEP_POINTS:
+        raise ValueError(f"网格点数 {points} 超过上限 {MAX_SWEEP_POINTS}")
+    return parameters
+
+
+def apply_sweep_point(battle_data: Dict[str, Any], config: SimulationConfig,
+                      assignments: Sequence[Tuple[SweepParameter, Any]]) -> Tuple[Dict[str, Any], SimulationConfig]:
+    """把一个网格点的参数取值应用到战役数据副本与模拟参数上"""
+    scenario = copy.deepcopy(battle_data)
+    participants = {p["force_id"]: p for p in scenario.get("participants", [])}
+    for parameter, value in assignments:
+        if parameter.name == "weather":
+            config = replace(config, weather=value)
+        elif parameter.name == "morale":
+            participants[parameter.force_id]["morale"] = value
+        elif parameter.name == "composition":
+            for unit in participants[parameter.force_id].get("unit_types", []):
+                if parameter.unit_type is None or unit.get("type") == parameter.unit_type:
+                    unit["count"] = round(float(unit.get("count", 0)) * value)
+    return scenario, config
+
+
+def run_sweep_point(battle_data: Dict[str, Any], config: SimulationConfig,
+                    assignments: Sequence[Tuple[SweepParameter, Any]],
+                    unit_table: Dict[str, Any], elevation: ElevationGrid = None) -> Dict[str, Any]:
+    """在工作进程中模拟一个网格点，只返回统计结果"""
+    scenario, config = apply_sweep_point(battle_data, config, assignments)
+    result = simulate_battle(scenario, config, unit_stats=unit_table.get, elevation=elevation)
+    return {
+        "winner": result.winner,
+        "duration_s": result.simulated_seconds,
+        "forces": {
+            fid: {
+                "casualty_ratio": round(stats["casualties"] / stats["initial"], 4) if stats["initial"] else 0.0,
+                "remaining": stats["remaining"],
+            }
+            for fid, stats in result.forces.items()
+        },
+    }
+
+
+class SweepUnavailableError(RuntimeError):
+    """进程池重建后仍无法完成扫描（如工作进程反复因内存不足退出）"""
+    pass
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_sweep_pool() -> ProcessPoolExecutor:
+    """
+    参数扫描使用的进程池（首次使用时创建）
+
+    进程数取 SWEEP_WORKERS，缺省为 CPU 核数；默认以 spawn 方式启动工作进程，
+    避免在有多个线程的服务进程中 fork
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = int(os.getenv("SWEEP_WORKERS", "0")) or os.cpu_count() or 1
+                context = multiprocessing.get_context(os.getenv("SWEEP_START_METHOD", "spawn"))
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                logger.info(f"参数扫描进程池已创建: {workers} 个进程")
+    return _pool
+
+
+def shutdown_sweep_pool():
+    """关闭参数扫描进程池"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_sweep(battle_data: Dict[str, Any], parameters: List[SweepParameter], config: SimulationConfig,
+                    unit_table: Dict[str, Any], elevation: ElevationGrid = None) -> Dict[str, Any]:
+    """
+    并行运行整个参数网格
+
+    Args:
+        unit_table: 兵种类型 -> UnitDefinition（传给工作进程，需可序列化）
+        elevation: 战役范围的高程网格，缺省不考虑高差与通视
+
+    Returns:
+        {parameters, shape, forces, winner, duration_s, casualty_ratio}；矩阵按参数顺序嵌套，
+        第一个参数为行、第二个参数为列
+
+    Raises:
+        SweepUnavailableError: 工作进程异常退出，重建进程池重试一次后仍然失败
+    """
+    config = replace(config, samples=SWEEP_SAMPLES)
+    loop = asyncio.get_running_loop()
+    grid = list(itertools.product(*[[(p, v) for v in p.values] for p in parameters]))
+    for attempt in range(2):
+        pool = get_sweep_pool()
+        try:
+            results = await asyncio.gather(*[
+                loop.run_in_executor(pool, run_sweep_point, battle_data, config, assignments, unit_table, elevation)
+                for assignments in grid
+            ])
+            break
+        except BrokenProcessPool as e:
+            # 损坏的进程池不会自行恢复，丢弃后下次使用时重建
+            logger.error(f"参数扫描进程池已损坏（第 {attempt + 1} 次）: {e}")
+            shutdown_sweep_pool()
+    else:
+        raise SweepUnavailableError("参数扫描工作进程异常退出")
+
+    shape = [len(p.values) for p in parameters]
+    force_ids = [p["force_id"] for p in battle_data.get("participants", [])]
+
+    def matrix(values: List[Any]) -> List[Any]:
+        if len(shape) == 1:
+            return values
+        return [values[i * shape[1]:(i + 1) * shape[1]] for i in range(shape[0])]
+
+    return {
+        "parameters": [p.label() for p in parameters],
+        "shape": shape,
+        "forces": force_ids,
+        "winner": matrix([r["winner"] for r in results]),
+        "duration_s": matrix([r["duration_s"] for r in results]),
+        "casualty_ratio": {fid: matrix([r["forces"][fid]["casualty_ratio"] for r in results]) for fid in force_ids},
+        "remaining": {fid: matrix([r["forces"][fid]["remaining"] for r in results]) for fid in force_ids},
+    }
@@ -0,0 +1,149 @@
+# src/ai_agent/battle_tracks.py
+"""
+战役回放关键帧轨迹编译
+
+把 BattleLOD 的逐事件帧按固定时间步长插值为稠密轨迹：
+每个单位每个采样点 3 个 float32 通道 (经度偏移, 纬度偏移, 兵力)，
+按 [单位][采样][通道] 顺序以小端序打包。经纬度相对 origin 存储以保证 float32 精度。
+
+客户端回放时按 floor(t / time_step) 直接索引，可以即时跳转到任意时刻。
+"""
+
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.ai_agent.battle_lod import BattleLOD
+
+TRACK_CHANNELS = ("d_lon", "d_lat", "count")
+DEFAULT_SAMPLES = 240
+MAX_SAMPLES = 2000
+
+_TIMESTAMP_RE = re.compile(r"^(-?\d+)-(\d{1,2})-(\d{1,2})(?:[T ](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+_DAYS_BEFORE_MONTH = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+@dataclass
+class TrackSet:
+    """一场战役在某一细节层次下的稠密轨迹"""
+    units: List[Dict[str, Any]]
+    origin: Tuple[float, float]
+    start_time: Optional[str]
+    duration_seconds: float
+    time_step_seconds: float
+    samples: int
+    keyframe_times: List[float]
+    data: bytes
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "units": self.units,
+            "origin": list(self.origin),
+            "start_time": self.start_time,
+            "duration_seconds": self.duration_seconds,
+            "time_step_seconds": self.time_step_seconds,
+            "samples": self.samples,
+            "keyframe_times": self.keyframe_times,
+            "channels": list(TRACK_CHANNELS),
+            "dtype": "float32",
+            "byte_order": "little",
+            "shape": [len(self.units), self.samples, len(TRACK_CHANNELS)]
+        }
+
+
+def timestamp_seconds(timestamp: str) -> Optional[float]:
+    """
+    把时间线时间戳换算为秒（按公历推算，支持 3 位或负数年份，如 "208-12-01T00:00:00"）
+
+    只用于计算事件之间的相对间隔；无法解析时返回 None
+    """
+    match = _TIMESTAMP_RE.match(timestamp or "")
+    if match is None:
+        return None
+    year, month, day = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    hour, minute, second = (int(g) if g else 0 for g in match.group(4, 5, 6))
+    if not 1 <= month <= 12:
+        return None
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    y = year - 1
+    days = y * 365 + y // 4 - y // 100 + y // 400
+    days += _DAYS_BEFORE_MONTH[month - 1] + (1 if leap and month > 2 else 0) + day - 1
+    return days * 86400.0 + hour * 3600 + minute * 60 + second
+
+
+def _keyframe_times(lod: BattleLOD) -> Tuple[List[int], List[float]]:
+    """
+    选出参与插值的帧及其相对时间
+
+    有时间线时以每个事件后的状态为关键帧（第一个事件时刻为 0）；
+    时间戳缺失或倒序时按事件序号等间隔排列
+    """
+    if not lod.events:
+        return [0], [0.0]
+    seconds = [timestamp_seconds(e.get("timestamp", "")) for e in lod.events]
+    frames = list(range(1, len(lod.frames)))
+    if any(s is None for s in seconds) or any(b < a for a, b in zip(seconds, seconds[1:])):
+        return frames, [float(i) for i in range(len(frames))]
+    return frames, [s - seconds[0] for s in seconds]
+
+
+def compile_tracks(lod: BattleLOD, tier: str, samples: int = DEFAULT_SAMPLES,
+                   unit_name: Callable[[str], str] = None) -> TrackSet:
+    """把战役时间线编译为固定时间步长的稠密轨迹"""
+    samples = max(1, min(int(samples), MAX_SAMPLES))
+    frames, times = _keyframe_times(lod)
+    keyframes = [lod.aggregate(f, tier, unit_name, include_empty=True) for f in frames]
+
+    units = [
+        {k: v for k, v in unit.items() if k not in ("position", "count", "radius_m", "regiments")}
+        for unit in keyframes[0]
+    ]
+    all_positions = [u["position"] for frame in keyframes for u in frame]
+    origin = (
+        round(sum(p[0] for p in all_positions) / len(all_positions), 4) if all_positions else 0.0,
+        round(sum(p[1] for p in all_positions) / len(all_positions), 4) if all_positions else 0.0
+    )
+
+    duration = times[-1]
+    step = duration / (samples - 1) if samples > 1 and duration > 0 else 0.0
+    if step == 0.0:
+        samples = 1
+
+    # 每个采样时刻所在的关键帧区间与插值权重，对所有单位共用
+    segments = []
+    for i in range(samples):
+        t = i * step
+        k = min(max(bisect_right(times, t) - 1, 0), len(times) - 1)
+        if k + 1 < len(times) and times[k + 1] > times[k]:
+            w = (t - times[k]) / (times[k + 1] - times[k])
+            segments.append((k, k + 1, min(max(w, 0.0), 1.0)))
+        else:
+            segments.append((k, k, 0.0))
+
+    values = array("f")
+    ox, oy = origin
+    for u in range(len(units)):
+        track = [(frame[u]["position"][0] - ox, frame[u]["position"][1] - oy, frame[u]["count"]) for frame in keyframes]
+        for a, b, w in segments:
+            pa, pb = track[a], track[b]
+            values.extend((
+                pa[0] + (pb[0] - pa[0]) * w,
+                pa[1] + (pb[1] - pa[1]) * w,
+                pa[2] + (pb[2] - pa[2]) * w
+            ))
+    if sys.byteorder != "little":
+        values.byteswap()
+
+    return TrackSet(
+        units=units,
+        origin=origin,
+        start_time=lod.events[0].get("timestamp") if lod.events else None,
+        duration_seconds=duration,
+        time_step_seconds=step,
+        samples=samples,
+        keyframe_times=times,
+        data=values.tobytes()
+    )
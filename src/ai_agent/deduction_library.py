@@ -0,0 +1,539 @@
+# src/ai_agent/deduction_library.py
+"""
+预生成推演库
+为知识库中的经典战役离线生成推演步骤，存盘并建立索引；
+推演接口命中索引时直接读盘返回，只有未知战役才调用大模型。
+
+离线批量生成:
+    python -m src.ai_agent.deduction_library --parallelism 4
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.cache import atomic_write_json
+from src.core.json_repair import JSONRepairError, iter_json_values
+from src.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HISTORICAL_BATTLES_FILE = os.path.join(BASE_DIR, "knowledge_base", "military_data", "historical_battles.json")
+BATTLES_FILE = os.path.join(BASE_DIR, "knowledge_base", "military_data", "battles.json")
+DEFAULT_LIBRARY_DIR = os.path.join(BASE_DIR, "knowledge_base", "deductions")
+
+# 推演结果至少应包含的步骤数，少于此数视为生成失败
+MIN_STEPS = 3
+VALID_ACTION_TYPES = {"marker", "path", "arrow", "circle"}
+
+
+class DeductionParseError(ValueError):
+    """模型输出中没有可用的推演数据"""
+    pass
+
+DEDUCTION_SYSTEM_PROMPT = (
+    "你是一个专业的军事历史战役推演引擎。"
+    "你的目标是生成一个结构化的JSON序列，用于在3D地图上可视化战役过程。"
+    "输出必须是有效的JSON格式。不要包含markdown格式（如 ```json ... ```）。"
+    "请基于真实的历史史料进行推演，确保地理位置、部队动向和时间节点的准确性。"
+    "【重要】阵营分类规则：\n"
+    "   - 必须将对战双方严格区分为【红方】（Red）和【蓝方】（Blue）。\n"
+    "   - 进攻方、侵略者或北方势力（如曹军、日军、国民党军）通常标记为 'color': 'red'。\n"
+    "   - 防守方、抵抗者或南方势力（如联军、大清、解放军）通常标记为 'color': 'blue'。\n"
+    "   - 第三方或中立势力可以使用 'orange' 或 'green'。\n"
+    "JSON结构如下：\n"
+    "{\n"
+    "  'title': '战役名称',\n"
+    "  'location': [经度, 纬度], // 战役中心点\n"
+    "  'zoom': 11,\n"
+    "  'steps': [\n"
+    "    {\n"
+    "      'time': '阶段 N: [时间/阶段名]',\n"
+    "      'description': '该阶段的详细战况描述(100-200字)，引用历史背景、兵力部署、关键决策和地理环境影响。',\n"
+    "      'actions': [\n"
+    "        {\n"
+    "          'type': 'marker', // 或 'path', 'arrow', 'circle'\n"
+    "          'label': '部队/地点名称',\n"
+    "          'coordinate': [经度, 纬度],\n"
+    "          'color': 'red', // 必须明确指定颜色: red, blue, green, orange\n"
+    "          'radius': 1000 // 仅适用于 circle\n"
+    "        }\n"
+    "      ]\n"
+    "    }\n"
+    "  ]\n"
+    "}"
+    "要求：\n"
+    "1. 生成至少 8-12 个详细步骤，完整覆盖战役的前奏、发展、高潮和结局。\n"
+    "2. 描述要生动、专业，体现军事战略和战术细节。\n"
+    "3. 充分利用地图动作(actions)来展示部队移动(path/arrow)、交战点(marker)和影响范围(circle)。\n"
+)
+
+
+def build_deduction_messages(query: str) -> List[Dict[str, str]]:
+    """构造战役推演的对话消息"""
+    user_prompt = f"请根据历史史料，详细推演这场战役：{query}。请模拟“正在检索历史数据库”的过程，并在生成的描述中体现史料依据。"
+    return [
+        {"role": "system", "content": DEDUCTION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def parse_deduction_content(content: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    解析模型输出的推演 JSON
+    容忍说明文字、代码块、单引号、注释、尾随逗号和被截断的结尾，
+    并按推演结构清洗，尽量保留完整的阶段。
+    说明文字中的括号（如 "[JSON格式]"）解析出的值不符合推演结构时，继续尝试后面的候选
+
+    Returns:
+        (推演数据, 修复与清洗记录)
+
+    Raises:
+        DeductionParseError: 输出中没有可用的推演数据
+    """
+    error: Optional[DeductionParseError] = None
+    try:
+        for data, fixes in iter_json_values(content, start_chars="{["):
+            try:
+                data, issues = sanitize_deduction(data)
+            except DeductionParseError as e:
+                error = error or e
+                continue
+            return data, fixes + issues
+    except JSONRepairError as e:
+        raise DeductionParseError(str(e)) from e
+    raise error
+
+
+def _as_coordinate(value: Any) -> Optional[List[float]]:
+    """把 [经度, 纬度] 或 {"lon":..., "lat":...} 规范化为 [float, float]"""
+    if isinstance(value, dict):
+        lon = value.get("lon", value.get("lng", value.get("longitude")))
+        lat = value.get("lat", value.get("latitude"))
+        value = [lon, lat]
+    if isinstance(value, (list, tuple)) and len(value) >= 2:
+        try:
+            return [float(value[0]), float(value[1])]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _sanitize_action(action: Any) -> Optional[Dict[str, Any]]:
+    """清洗单个地图动作，缺少必要几何信息时返回 None"""
+    if not isinstance(action, dict) or action.get("type") not in VALID_ACTION_TYPES:
+        return None
+
+    cleaned = dict(action)
+    if cleaned.get("label") is not None and not isinstance(cleaned["label"], str):
+        cleaned["label"] = str(cleaned["label"])
+    action_type = action["type"]
+    if action_type == "marker":
+        coordinate = _as_coordinate(action.get("coordinate"))
+        if coordinate is None:
+            return None
+        cleaned["coordinate"] = coordinate
+    elif action_type == "path":
+        raw_path = action.get("path")
+        path = [_as_coordinate(p) for p in raw_path] if isinstance(raw_path, list) else []
+        path = [p for p in path if p is not None]
+        if len(path) < 2:
+            return None
+        cleaned["path"] = path
+    elif action_type == "arrow":
+        start, end = _as_coordinate(action.get("from")), _as_coordinate(action.get("to"))
+        if start is None or end is None:
+            return None
+        cleaned["from"], cleaned["to"] = start, end
+    elif action_type == "circle":
+        center = _as_coordinate(action.get("center", action.get("coordinate")))
+        if center is None:
+            return None
+        cleaned["center"] = center
+        try:
+            cleaned["radius"] = float(action.get("radius", 1000))
+        except (TypeError, ValueError):
+            cleaned["radius"] = 1000.0
+    return cleaned
+
+
+def _first_coordinate(steps: List[Dict[str, Any]]) -> Optional[List[float]]:
+    for step in steps:
+        for action in step["actions"]:
+            for field in ("coordinate", "center", "from"):
+                if field in action:
+                    return action[field]
+            if "path" in action:
+                return action["path"][0]
+    return None
+
+
+def sanitize_deduction(data: Any) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    按推演结构清洗数据：丢弃缺少描述的阶段与几何信息不完整的动作，补全默认字段
+
+    Returns:
+        (清洗后的推演数据, 清洗记录)
+
+    Raises:
+        DeductionParseError: 没有任何可用的阶段
+    """
+    if isinstance(data, list):
+        data = {"steps": data}
+    if not isinstance(data, dict):
+        raise DeductionParseError("推演结果不是 JSON 对象")
+
+    issues = []
+    steps = []
+    raw_steps = data.get("steps")
+    if not isinstance(raw_steps, list):
+        raw_steps = []
+    for i, step in enumerate(raw_steps):
+        description = step.get("description") if isinstance(step, dict) else None
+        if not isinstance(description, str) or not description.strip():
+            issues.append(f"dropped_step_{i + 1}")
+            continue
+
+        raw_actions = step.get("actions")
+        if raw_actions is not None and not isinstance(raw_actions, list):
+            issues.append(f"dropped_actions_in_step_{i + 1}")
+            raw_actions = None
+        actions = []
+        for action in raw_actions or []:
+            cleaned = _sanitize_action(action)
+            if cleaned is None:
+                issues.append(f"dropped_action_in_step_{i + 1}")
+            else:
+                actions.append(cleaned)
+
+        steps.append({
+            **step,
+            "time": str(step.get("time") or f"阶段 {len(steps) + 1}"),
+            "description": description,
+            "actions": actions
+        })
+
+    if not steps:
+        raise DeductionParseError("推演结果中没有可用的阶段")
+
+    result = {**data, "steps": steps}
+    if not isinstance(result.get("title"), str) or not result["title"].strip():
+        result["title"] = "战役推演"
+        issues.append("default_title")
+
+    location = _as_coordinate(data.get("location")) or _first_coordinate(steps)
+    if location is not None:
+        result["location"] = location
+    else:
+        result.pop("location", None)
+        issues.append("missing_location")
+
+    try:
+        result["zoom"] = int(data.get("zoom", 11))
+    except (TypeError, ValueError):
+        result["zoom"] = 11
+
+    return result, issues
+
+
+def validate_deduction(data: Any) -> List[str]:
+    """
+    校验推演数据结构
+
+    Returns:
+        问题列表，为空表示通过
+    """
+    if not isinstance(data, dict):
+        return ["推演结果不是 JSON 对象"]
+
+    errors = []
+    if not isinstance(data.get("title"), str) or not data["title"].strip():
+        errors.append("缺少 title")
+    location = data.get("location")
+    if not (isinstance(location, list) and len(location) == 2
+            and all(isinstance(v, (int, float)) for v in location)):
+        errors.append("location 必须为 [经度, 纬度]")
+
+    steps = data.get("steps")
+    if not isinstance(steps, list) or len(steps) < MIN_STEPS:
+        errors.append(f"steps 至少需要 {MIN_STEPS} 个阶段")
+        return errors
+
+    for i, step in enumerate(steps):
+        if not isinstance(step, dict) or not step.get("description"):
+            errors.append(f"第 {i + 1} 个阶段缺少 description")
+            continue
+        for action in step.get("actions", []):
+            if not isinstance(action, dict) or action.get("type") not in VALID_ACTION_TYPES:
+                errors.append(f"第 {i + 1} 个阶段存在无效的 action")
+                break
+    return errors
+
+
+def normalize_battle_query(text: str) -> str:
+    """
+    规范化战役名称，用于索引匹配
+    "赤壁之战"、"赤壁 战役"、"Battle of Waterloo" 分别规范化为 "赤壁"、"赤壁"、"waterloo"
+    """
+    normalized = "".join(text.lower().split())
+    if normalized.startswith("battleof"):
+        normalized = normalized[len("battleof"):]
+    for suffix in ("之战", "战役", "会战", "战斗", "登陆", "battle"):
+        if normalized.endswith(suffix) and len(normalized) > len(suffix):
+            normalized = normalized[:-len(suffix)]
+    return normalized
+
+
+def load_curated_battles() -> List[Dict[str, Any]]:
+    """
+    读取知识库中的经典战役，返回待生成的条目列表
+    每个条目包含 key（存储文件名）、name、query（发给模型的查询）和 aliases
+    """
+    curated = {}
+
+    try:
+        with open(HISTORICAL_BATTLES_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for period_battles in data.get("battles", {}).values():
+            for battle_id, battle in period_battles.items():
+                location = battle.get("location", {})
+                aliases = {
+                    battle["name"],
+                    battle_id,
+                    battle_id.split("_")[0],
+                    location.get("historical_name", ""),
+                }
+                curated[battle_id] = {
+                    "key": battle_id,
+                    "name": battle["name"],
+                    "query": f"{battle['name']}（{battle.get('date', battle.get('year', ''))}，{location.get('modern_name', '')}）",
+                    "aliases": sorted(a for a in aliases if a)
+                }
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"读取战役数据失败: {e}")
+
+    try:
+        with open(BATTLES_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for index, battle in enumerate(data.get("major_battles", [])):
+            name = battle.get("name")
+            if not name:
+                continue
+            key = f"major_{index}"
+            curated[key] = {
+                "key": key,
+                "name": name,
+                "query": f"{name}（{battle.get('date', '')}）",
+                "aliases": [name]
+            }
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"读取战役数据失败: {e}")
+
+    return list(curated.values())
+
+
+class DeductionLibrary:
+    """
+    预生成推演库
+    目录结构: index.json + 每个战役一个 <key>.json
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("DEDUCTION_LIBRARY_DIR", DEFAULT_LIBRARY_DIR)
+        self._index: Optional[Dict[str, Any]] = None
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _load_index(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._index is None:
+                try:
+                    with open(self.index_path, "r", encoding="utf-8") as f:
+                        self._index = json.load(f)
+                    logger.info(f"推演库已加载: {len(self._index.get('entries', {}))} 个战役")
+                except FileNotFoundError:
+                    self._index = {"version": 1, "entries": {}, "aliases": {}}
+                except (OSError, json.JSONDecodeError) as e:
+                    logger.error(f"读取推演库索引失败: {e}")
+                    self._index = {"version": 1, "entries": {}, "aliases": {}}
+            return self._index
+
+    def reload(self):
+        """丢弃内存中的索引与文档，下次访问时重新读盘"""
+        with self._lock:
+            self._index = None
+            self._documents = {}
+
+    def entries(self) -> Dict[str, Any]:
+        return self._load_index().get("entries", {})
+
+    def resolve(self, query: str) -> Optional[str]:
+        """把查询解析为推演库条目 key，未收录返回 None"""
+        return self._load_index().get("aliases", {}).get(normalize_battle_query(query))
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        查找预生成推演
+
+        Returns:
+            推演数据；未收录时返回 None
+        """
+        with span("knowledge.deduction_lookup") as lookup_span:
+            document = self._lookup(query)
+            lookup_span.set_attribute("hit", document is not None)
+            return document
+
+    def _lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        key = self.resolve(query)
+        if key is None:
+            return None
+
+        document = self._documents.get(key)
+        if document is None:
+            entry = self.entries().get(key)
+            if entry is None:
+                return None
+            try:
+                with open(os.path.join(self.directory, entry["file"]), "r", encoding="utf-8") as f:
+                    document = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"读取预生成推演失败 {key}: {e}")
+                return None
+            self._documents[key] = document
+        return document
+
+    def store(self, battle: Dict[str, Any], data: Dict[str, Any]):
+        """保存一个战役的推演结果并更新索引"""
+        file_name = f"{battle['key']}.json"
+        atomic_write_json(os.path.join(self.directory, file_name), data)
+
+        index = self._load_index()
+        with self._lock:
+            index["entries"][battle["key"]] = {
+                "file": file_name,
+                "name": battle["name"],
+                "aliases": battle["aliases"],
+                "steps": len(data.get("steps", [])),
+                "generated_at": datetime.now(timezone.utc).isoformat()
+            }
+            for alias in battle["aliases"]:
+                index["aliases"][normalize_battle_query(alias)] = battle["key"]
+            self._documents[battle["key"]] = data
+            atomic_write_json(self.index_path, index)
+
+
+_library: Optional[DeductionLibrary] = None
+
+
+def get_deduction_library() -> DeductionLibrary:
+    """获取推演库实例（进程内单例）"""
+    global _library
+    if _library is None:
+        _library = DeductionLibrary()
+    return _library
+
+
+async def _generate_one(library: DeductionLibrary, model_service, battle: Dict[str, Any],
+                        semaphore: asyncio.Semaphore, retries: int) -> bool:
+    async with semaphore:
+        for attempt in range(1, retries + 1):
+            try:
+                logger.info(f"生成推演: {battle['name']} (第 {attempt} 次)")
+                content = await model_service.chat_completion(
+                    build_deduction_messages(battle["query"]), max_tokens=4000
+                )
+                data, fixes = parse_deduction_content(content)
+                if fixes:
+                    logger.info(f"推演输出已修复 {battle['name']}: {', '.join(fixes)}")
+                errors = validate_deduction(data)
+                if errors:
+                    logger.warning(f"推演校验未通过 {battle['name']}: {'; '.join(errors)}")
+                    continue
+                library.store(battle, data)
+                logger.info(f"已保存推演: {battle['name']} ({len(data['steps'])} 个阶段)")
+                return True
+            except DeductionParseError as e:
+                logger.warning(f"推演 JSON 解析失败 {battle['name']}: {e}")
+            except Exception as e:
+                logger.warning(f"推演生成失败 {battle['name']}: {e}")
+        logger.error(f"放弃生成推演: {battle['name']}")
+        return False
+
+
+async def generate_library(parallelism: int = 4, force: bool = False,
+                           only: List[str] = None, retries: int = 3,
+                           library: DeductionLibrary = None, model_service=None) -> Dict[str, List[str]]:
+    """
+    批量生成推演库
+
+    Args:
+        parallelism: 同时进行的模型调用上限
+        force: 为 True 时重新生成已收录的战役
+        only: 只生成指定 key 或名称的战役
+        retries: 每个战役的最大尝试次数
+
+    Returns:
+        {"generated": [...], "skipped": [...], "failed": [...]}
+    """
+    if model_service is None:
+        from src.ai_agent.model_service import get_model_service
+        model_service = get_model_service()
+    library = library or get_deduction_library()
+
+    battles = load_curated_battles()
+    if only:
+        battles = [b for b in battles if b["key"] in only or b["name"] in only]
+
+    existing = library.entries()
+    pending = [b for b in battles if force or b["key"] not in existing]
+    report = {
+        "generated": [],
+        "skipped": [b["key"] for b in battles if b not in pending],
+        "failed": []
+    }
+
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+    results = await asyncio.gather(*[
+        _generate_one(library, model_service, battle, semaphore, retries) for battle in pending
+    ])
+    for battle, ok in zip(pending, results):
+        report["generated" if ok else "failed"].append(battle["key"])
+    return report
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="为知识库中的经典战役批量生成推演库")
+    parser.add_argument("--parallelism", type=int,
+                        default=int(os.getenv("DEDUCTION_BATCH_PARALLELISM", "4")),
+                        help="同时进行的模型调用上限")
+    parser.add_argument("--force", action="store_true", help="重新生成已收录的战役")
+    parser.add_argument("--battle", action="append", dest="only", help="只生成指定战役（key 或名称，可重复）")
+    parser.add_argument("--retries", type=int, default=3, help="每个战役的最大尝试次数")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    report = asyncio.run(generate_library(
+        parallelism=args.parallelism, force=args.force, only=args.only, retries=args.retries
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
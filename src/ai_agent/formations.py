@@ -0,0 +1,111 @@
+# src/ai_agent/formations.py
+"""
+队形数据表
+
+/battle/{id}/formation/{name} 接口返回的队形动画数据与战役模拟引擎使用同一份表：
+movement_speed 决定移动速度，combat_bonus 决定战斗加成，terrain_requirements 决定加成是否完全生效。
+战役数据中的队形名称（wedge、volley_fire 等）通过 FORMATION_ALIASES 对应到表中的队形。
+"""
+
+from typing import Any, Dict, Optional
+
+FORMATIONS: Dict[str, Dict[str, Any]] = {
+    "phalanx": {
+        "description": "希腊方阵 - 密集的重装步兵队形",
+        "animation_data": {
+            "setup_time": 30,
+            "movement_speed": 2,
+            "combat_bonus": {"defense": 3, "melee": 2},
+            "terrain_requirements": ["flat", "open"]
+        },
+        "visual_effects": [
+            "shield_wall_formation",
+            "spear_pikes_display",
+            "coordinated_movement"
+        ]
+    },
+    "shield_wall": {
+        "description": "盾牌墙 - 防御性密集队形",
+        "animation_data": {
+            "setup_time": 20,
+            "movement_speed": 1,
+            "combat_bonus": {"defense": 5, "ranged": 2},
+            "terrain_requirements": ["defensive_position"]
+        },
+        "visual_effects": [
+            "shield_formation",
+            "defensive_posture",
+            "counter_attack_ready"
+        ]
+    },
+    "cavalry_wedge": {
+        "description": "骑兵楔形阵 - 突击队形",
+        "animation_data": {
+            "setup_time": 15,
+            "movement_speed": 8,
+            "combat_bonus": {"charge": 8, "speed": 5},
+            "terrain_requirements": ["open", "flat"]
+        },
+        "visual_effects": [
+            "charging_movement",
+            "dust_cloud",
+            "lance_charge"
+        ]
+    },
+    "linear_formation": {
+        "description": "线列阵 - 拿破仑时代的标准阵型",
+        "animation_data": {
+            "setup_time": 25,
+            "movement_speed": 3,
+            "combat_bonus": {"volley_fire": 4, "discipline": 3},
+            "terrain_requirements": ["open"]
+        },
+        "visual_effects": [
+            "drill_movement",
+            "volley_fire",
+            "bayonet_charge"
+        ]
+    },
+    "volley": {
+        "description": "齐射 - 弓箭手或火枪兵的攻击",
+        "animation_data": {
+            "setup_time": 10,
+            "movement_speed": 2,
+            "combat_bonus": {"ranged": 6, "area_damage": 3},
+            "terrain_requirements": ["elevated", "clear_los"]
+        },
+        "visual_effects": [
+            "projectile_rain",
+            "reload_animation",
+            "aim_adjustment"
+        ]
+    }
+}
+
+# 战役数据中出现的队形名称 -> FORMATIONS 中作用相近的队形
+FORMATION_ALIASES = {
+    "wedge": "cavalry_wedge",
+    "heavy_charge": "cavalry_wedge",
+    "cavalry_column": "cavalry_wedge",
+    "cavalry_command": "cavalry_wedge",
+    "reserve_cavalry": "cavalry_wedge",
+    "cavalry_reserve": "cavalry_wedge",
+    "formation_line": "linear_formation",
+    "battle_line": "linear_formation",
+    "triple_line": "linear_formation",
+    "defensive_formation": "shield_wall",
+    "defensive_line": "shield_wall",
+    "defensive_circle": "shield_wall",
+    "testudo": "shield_wall",
+    "volley_fire": "volley",
+    "skirmish_line": "volley",
+    "artillery_battery": "volley",
+    "artillery_batteries": "volley",
+    "artillery_defense": "volley",
+}
+
+
+def resolve_formation(name: str) -> Optional[Dict[str, Any]]:
+    """按队形名称（含别名）查找队形；未知队形返回 None"""
+    name = FORMATION_ALIASES.get(name, name)
+    return FORMATIONS.get(name)
@@ -0,0 +1,285 @@
+# src/ai_agent/geo_validation.py
+"""
+推演坐标的地理校验与吸附
+
+大模型生成的推演中，coordinate / path / from / to / center 常出现经纬度颠倒、落在海里或偏离战场数百千米。
+解析（含 JSON 修复）之后逐个检查这些坐标：
+1. 确定锚点：查询 / 标题匹配到 historical_battles.json 中的战役时取其位置，
+   否则取名称中出现的已知地名（朝代城市），都没有时取全部坐标的中位数
+2. 距锚点 GEO_VALID_RADIUS_KM 以内、或靠近某个已知地名（战略层面的标注可以远离战场）的坐标视为有效
+3. 经纬度颠倒的坐标交换后若有效则修正；其余离群坐标吸附到标签中提到的已知地名或附近的已知地名；
+   都没有时，距锚点 GEO_MAX_DISTANCE_KM 以内的只标记（可能是地名表没有收录的战略要地），更远的收拢到锚点
+4. 按需要修正的坐标比例给出质量分（0 ~ 1）
+
+已知地名来自 dynasties.json 的 majorCities、city_mappings.json 的 dynastyCities 与战役数据中的地点，
+用 GridSpatialIndex 按经纬度分桶索引。
+"""
+
+import os
+import json
+import logging
+import statistics
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.ai_agent.deduction_library import HISTORICAL_BATTLES_FILE, normalize_battle_query
+from src.ai_agent.knowledge_index import get_dynasty_index
+from src.core.spatial_mapper import GridSpatialIndex, haversine_km, is_valid_coordinate
+
+logger = logging.getLogger(__name__)
+
+# 距锚点多远以内的坐标视为有效（千米）
+GEO_VALID_RADIUS_KM = float(os.getenv("GEO_VALID_RADIUS_KM", "150"))
+# 标签提到的已知地名与坐标相距多远以内视为一致（千米）
+PLACE_MATCH_KM = 30.0
+# 离群坐标吸附到附近已知地名的最大距离（千米）
+SNAP_RADIUS_KM = 80.0
+# 无法吸附的离群坐标超过该距离（千米）时收拢到锚点，否则只标记
+GEO_MAX_DISTANCE_KM = 1000.0
+# 各类问题对质量分的扣分权重（交换经纬度只是格式问题，只标记的坐标不一定错误，扣分较少）
+# 缺失的战役位置用锚点补上（filled）不算错误，不扣分
+FIX_PENALTY = {"swapped": 0.5, "flagged": 0.5, "snapped": 1.0, "clamped": 1.0, "filled": 0.0}
+
+
+@dataclass
+class KnownPlace:
+    """已知地名"""
+    name: str
+    lon: float
+    lat: float
+    source: str
+
+
+def _coordinate_fields(deduction: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Any, str, Tuple[int, int]]]:
+    """
+    推演中的全部坐标，逐个产出 (所在容器, 键或下标, 字段名, (阶段序号, 动作序号))
+
+    容器为 action 字典或 path 列表，便于原地修正
+    """
+    for step_index, step in enumerate(deduction.get("steps") or []):
+        for action_index, action in enumerate(step.get("actions") or []):
+            where = (step_index, action_index)
+            for key in ("coordinate", "from", "to", "center"):
+                if key in action:
+                    yield action, key, key, where
+            for i in range(len(action.get("path") or [])):
+                yield action["path"], i, f"path[{i}]", where
+
+
+class PlaceGazetteer:
+    """已知地名表：名称查找 + 空间索引"""
+
+    def __init__(self, battles_file: str = HISTORICAL_BATTLES_FILE):
+        self.index: GridSpatialIndex[KnownPlace] = GridSpatialIndex(cell_degrees=0.5)
+        self.by_name: Dict[str, List[KnownPlace]] = {}
+        # (别名, 战役位置, 战役内地点)
+        self.battles: List[Tuple[List[str], KnownPlace, List[KnownPlace]]] = []
+        self._load_cities()
+        self._load_battles(battles_file)
+        self._names = sorted(self.by_name, key=len, reverse=True)
+        logger.info(f"地名表已加载: {len(self.index)} 个地点，{len(self.battles)} 个战役")
+
+    def _add(self, place: KnownPlace):
+        if not is_valid_coordinate(place.lon, place.lat) or not place.name:
+            return
+        self.index.insert(place.lon, place.lat, place)
+        self.by_name.setdefault(place.name, []).append(place)
+
+    def _load_cities(self):
+        index = get_dynasty_index()
+        seen = set()
+        cities = [city for dynasty in index.all_dynasties() for city in dynasty.get("majorCities", [])]
+        for dynasty_cities in (index.mappings.get("dynastyCities") or {}).values():
+            cities.extend(dynasty_cities)
+        for city in cities:
+            position = city.get("position") or []
+            if len(position) < 2 or (city.get("name"), tuple(position[:2])) in seen:
+                continue
+            seen.add((city.get("name"), tuple(position[:2])))
+            self._add(KnownPlace(city["name"], float(position[0]), float(position[1]), "city"))
+
+    def _load_battles(self, battles_file: str):
+        try:
+            with open(battles_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"读取战役数据失败: {e}")
+            return
+        for period_battles in data.get("battles", {}).values():
+            for battle_id, battle in period_battles.items():
+                location = battle.get("location") or {}
+                if "lon" not in location or "lat" not in location:
+                    continue
+                name = location.get("historical_name") or battle.get("name", battle_id)
+                anchor = KnownPlace(name, float(location["lon"]), float(location["lat"]), "battle")
+                places = [anchor]
+                for participant in battle.get("participants", []):
+                    position = participant.get("initial_position") or []
+                    if len(position) >= 2:
+                        places.append(KnownPlace(participant.get("name", ""), float(position[0]),
+                                                 float(position[1]), "battle"))
+                for place in places:
+                    self._add(place)
+                aliases = {battle.get("name", ""), battle_id.split("_")[0],
+                           location.get("historical_name", ""), location.get("modern_name", "")}
+                aliases = sorted({normalize_battle_query(a) for a in aliases if a} - {""})
+                self.battles.append((aliases, anchor, places))
+
+    def match_battle(self, *texts: str) -> Optional[Tuple[KnownPlace, List[KnownPlace]]]:
+        """按查询 / 标题匹配知识库中的战役，返回 (战役位置, 战役内地点)"""
+        for text in texts:
+            normalized = normalize_battle_query(text or "")
+            if not normalized:
+                continue
+            for aliases, anchor, places in self.battles:
+                if any(alias in normalized or normalized in alias for alias in aliases):
+                    return anchor, places
+        return None
+
+    def places_in(self, text: str) -> List[KnownPlace]:
+        """文本中提到的已知地名（长名称优先）"""
+        if not text:
+            return []
+        return [place for name in self._names if name in text for place in self.by_name[name]]
+
+
+@dataclass
+class _Anchor:
+    lon: float
+    lat: float
+    source: str
+    name: Optional[str] = None
+
+
+def _find_anchor(gazetteer: PlaceGazetteer, deduction: Dict[str, Any], query: str,
+                 points: List[Tuple[float, float]]) -> Optional[Tuple[_Anchor, List[KnownPlace]]]:
+    title = str(deduction.get("title") or "")
+    battle = gazetteer.match_battle(query, title)
+    if battle is not None:
+        anchor, places = battle
+        return _Anchor(anchor.lon, anchor.lat, "battle", anchor.name), places
+    for text in (query, title):
+        mentioned = gazetteer.places_in(text)
+        if mentioned:
+            place = mentioned[0]
+            return _Anchor(place.lon, place.lat, "place", place.name), []
+    if points:
+        # 坐标中位数对少量离群点不敏感
+        return _Anchor(statistics.median(p[0] for p in points), statistics.median(p[1] for p in points), "median"), []
+    return None
+
+
+def validate_coordinates(deduction: Dict[str, Any], query: str = "",
+                         gazetteer: "PlaceGazetteer" = None) -> Dict[str, Any]:
+    """
+    原地校验并修正推演中的坐标
+
+    Args:
+        deduction: sanitize_deduction 清洗后的推演（坐标已规范为 [经度, 纬度]）
+        query: 用户查询，用于匹配知识库中的战役
+
+    Returns:
+        {score, checked, fixed, flagged, anchor, fixes: [{step, action, field, reason, original, corrected, place}]}；
+        reason 为 swapped / snapped / clamped / filled（补上缺失的战役位置），或 flagged（只标记、未修改）；
+        没有任何坐标时 score 为 1
+    """
+    gazetteer = gazetteer or get_gazetteer()
+    fields = list(_coordinate_fields(deduction))
+    points = [
+        (container[key][0], container[key][1]) for container, key, _, _ in fields
+        if isinstance(container[key], list) and len(container[key]) >= 2
+        and is_valid_coordinate(container[key][0], container[key][1])
+    ]
+    found = _find_anchor(gazetteer, deduction, query, points)
+    if found is None:
+        # 没有锚点说明也没有任何有效坐标：完全没有坐标时无需修正，记满分；有坐标但全部无效时记 0 分
+        return {"score": 0.0 if fields else 1.0, "checked": len(fields), "fixed": 0, "flagged": 0,
+                "anchor": None, "fixes": []}
+    anchor, battle_places = found
+    # 战役内地点（部署位置等）可能距战役位置较远，放宽有效半径
+    radius = GEO_VALID_RADIUS_KM + max(
+        (haversine_km(anchor.lon, anchor.lat, p.lon, p.lat) for p in battle_places), default=0.0
+    )
+
+    def is_plausible(lon: float, lat: float, label: str) -> bool:
+        if not is_valid_coordinate(lon, lat):
+            return False
+        if haversine_km(anchor.lon, anchor.lat, lon, lat) <= radius:
+            return True
+        # 战略层面的标注（如“江东 (孙权)”）可以远离战场，但要落在标签提到的地名或某个已知地名附近
+        if any(haversine_km(p.lon, p.lat, lon, lat) <= PLACE_MATCH_KM for p in gazetteer.places_in(label)):
+            return True
+        return gazetteer.index.nearest(lon, lat, PLACE_MATCH_KM) is not None
+
+    fixes = []
+    steps = deduction.get("steps") or []
+    for container, key, field_name, (step_index, action_index) in fields:
+        value = container[key]
+        if not (isinstance(value, list) and len(value) >= 2):
+            continue
+        lon, lat = value[0], value[1]
+        label = str(steps[step_index]["actions"][action_index].get("label") or "")
+        if is_plausible(lon, lat, label):
+            continue
+
+        corrected, reason, place_name = None, None, None
+        if is_plausible(lat, lon, label):
+            corrected, reason = [lat, lon], "swapped"
+        else:
+            # 标签提到的地名取离战场最近的一个；否则取坐标附近、且在战场范围内的已知地名
+            mentioned = sorted(gazetteer.places_in(label),
+                               key=lambda p: haversine_km(anchor.lon, anchor.lat, p.lon, p.lat))
+            place = mentioned[0] if mentioned else None
+            if place is None and is_valid_coordinate(lon, lat):
+                nearby = gazetteer.index.nearest(
+                    lon, lat, SNAP_RADIUS_KM,
+                    predicate=lambda p: haversine_km(anchor.lon, anchor.lat, p.lon, p.lat) <= radius
+                )
+                place = nearby[0] if nearby is not None else None
+            if place is not None:
+                corrected, reason, place_name = [place.lon, place.lat], "snapped", place.name
+            elif is_valid_coordinate(lon, lat) and haversine_km(anchor.lon, anchor.lat, lon, lat) <= GEO_MAX_DISTANCE_KM:
+                corrected, reason = [lon, lat], "flagged"
+            else:
+                corrected, reason = [anchor.lon, anchor.lat], "clamped"
+
+        container[key] = [round(corrected[0], 6), round(corrected[1], 6)]
+        fixes.append({
+            "step": step_index, "action": action_index, "field": field_name, "reason": reason,
+            "original": value[:2], "corrected": container[key], "place": place_name
+        })
+
+    location = deduction.get("location")
+    if anchor.source != "median" and (not isinstance(location, list) or len(location) < 2
+                                      or not is_plausible(location[0], location[1], str(deduction.get("title") or ""))):
+        deduction["location"] = [anchor.lon, anchor.lat]
+        fixes.append({"step": None, "action": None, "field": "location",
+                      "reason": "clamped" if isinstance(location, list) else "filled",
+                      "original": location, "corrected": deduction["location"], "place": anchor.name})
+
+    checked = len(fields) + 1
+    penalty = sum(FIX_PENALTY[fix["reason"]] for fix in fixes)
+    return {
+        "score": round(max(0.0, 1.0 - penalty / checked), 3),
+        "checked": checked,
+        "fixed": sum(fix["reason"] != "flagged" for fix in fixes),
+        "flagged": sum(fix["reason"] == "flagged" for fix in fixes),
+        "anchor": {"position": [anchor.lon, anchor.lat], "source": anchor.source, "name": anchor.name,
+                   "radius_km": round(radius, 1)},
+        "fixes": fixes,
+    }
+
+
+_gazetteer: Optional[PlaceGazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> PlaceGazetteer:
+    """获取地名表（进程内单例，首次调用时加载）"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = PlaceGazetteer()
+    return _gazetteer
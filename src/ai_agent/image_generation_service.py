@@ -5,20 +5,297 @@
 """
 
 import os
+import asyncio
 import logging
-from typing import Optional, List, Dict
+from abc import ABC, abstractmethod
+from typing import Optional, List, Dict, Tuple
 import httpx
 import json
+from src.core.cache import CacheBackend, get_cache, stable_bucket, stable_hash
 
 logger = logging.getLogger(__name__)
 
+
+class ImageBackend(ABC):
+    """图像生成后端抽象基类"""
+
+    # 单次上游调用最多可携带的不同提示词数量（1 表示不支持批处理）
+    name = "base"
+    max_batch_size = 1
+
+    @abstractmethod
+    async def generate_batch(self, prompts: List[str], style: str, size: str) -> List[str]:
+        """
+        为一组提示词生成图像，返回与 prompts 一一对应的 URL 列表
+        """
+        pass
+
+    async def aclose(self):
+        """释放后端持有的连接资源"""
+        pass
+
+
+class DashScopeWanxBackend(ImageBackend):
+    """
+    阿里云百炼 - 通义万相 (wanx) 文生图后端
+    使用异步任务接口：先提交任务，再轮询任务结果
+    """
+
+    name = "dashscope"
+    # 万相每次任务只接受一个提示词（n 参数只能生成同一提示词的多张图）
+    max_batch_size = 1
+
+    STYLE_MAPPING = {
+        "realistic": "<photography>",
+        "oil-painting": "<oil painting>",
+        "sketch": "<sketch>",
+        "watercolor": "<watercolor>",
+        "chinese-painting": "<chinese painting>",
+        "anime": "<anime>",
+        "3d": "<3d cartoon>",
+    }
+
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = None,
+        endpoint: str = None,
+        poll_interval: float = 2.0,
+        timeout: float = 120.0
+    ):
+        self.api_key = api_key or os.getenv("ALIBABA_BAILIAN_API_KEY") or os.getenv("DASHSCOPE_API_KEY")
+        self.model = model or os.getenv("DASHSCOPE_IMAGE_MODEL", "wanx-v1")
+        self.endpoint = (endpoint or os.getenv("DASHSCOPE_ENDPOINT", "https://dashscope.aliyuncs.com")).rstrip("/")
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+        if not self.api_key:
+            logger.warning("ALIBABA_BAILIAN_API_KEY 环境变量未设置")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+        return self._client
+
+    async def generate_batch(self, prompts: List[str], style: str, size: str) -> List[str]:
+        if not self.api_key:
+            raise ValueError("DashScope API Key missing")
+        return [await self._generate_one(prompt, style, size) for prompt in prompts]
+
+    async def _generate_one(self, prompt: str, style: str, size: str) -> str:
+        client = self._get_client()
+        payload = {
+            "model": self.model,
+            "input": {"prompt": prompt},
+            "parameters": {
+                "style": self.STYLE_MAPPING.get(style, "<auto>"),
+                # 万相的尺寸格式为 1024*1024
+                "size": size.replace("x", "*"),
+                "n": 1
+            }
+        }
+        response = await client.post(
+            f"{self.endpoint}/api/v1/services/aigc/text2image/image-synthesis",
+            headers={"X-DashScope-Async": "enable"},
+            json=payload
+        )
+        response.raise_for_status()
+        task_id = response.json()["output"]["task_id"]
+        logger.info(f"万相图像任务已提交: {task_id}")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            result = await client.get(f"{self.endpoint}/api/v1/tasks/{task_id}")
+            result.raise_for_status()
+            output = result.json().get("output", {})
+            status = output.get("task_status")
+
+            if status == "SUCCEEDED":
+                for item in output.get("results", []):
+                    if item.get("url"):
+                        return item["url"]
+                raise Exception(f"Image task succeeded but no URL found. Task ID: {task_id}")
+            elif status in ("FAILED", "CANCELED", "UNKNOWN"):
+                raise Exception(f"Image generation failed: {output.get('message', status)}")
+
+        raise TimeoutError(f"Image generation timed out. Task ID: {task_id}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class StubImageBackend(ImageBackend):
+    """
+    本地桩服务后端（见 image_stub_server.py）
+    支持一次请求携带多个提示词，用于联调与压测
+    """
+
+    name = "stub"
+
+    def __init__(self, endpoint: str = None, max_batch_size: int = None):
+        self.endpoint = (endpoint or os.getenv("IMAGE_STUB_ENDPOINT", "http://127.0.0.1:8765")).rstrip("/")
+        self.max_batch_size = max_batch_size or int(os.getenv("IMAGE_BATCH_SIZE", "8"))
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def generate_batch(self, prompts: List[str], style: str, size: str) -> List[str]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        response = await self._client.post(
+            f"{self.endpoint}/v1/images/generations",
+            json={"prompts": prompts, "style": style, "size": size}
+        )
+        response.raise_for_status()
+        urls = [item["url"] for item in response.json()["data"]]
+        if len(urls) != len(prompts):
+            raise Exception(f"Stub backend returned {len(urls)} images for {len(prompts)} prompts")
+        return urls
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_image_backend(name: str = None) -> Optional[ImageBackend]:
+    """
+    根据名称创建图像后端，mock 或未知名称返回 None
+    """
+    name = (name or os.getenv("IMAGE_BACKEND", "mock")).lower()
+    if name == "dashscope":
+        backend = DashScopeWanxBackend()
+        if not backend.api_key:
+            logger.warning("DashScope 未配置 API Key，图像生成回退到占位图")
+            return None
+        return backend
+    if name == "stub":
+        return StubImageBackend()
+    if name != "mock":
+        logger.warning(f"未知的图像后端: {name}，使用占位图")
+    return None
+
+
+class ImageRequestPool:
+    """
+    有界异步工作池：
+    - 相同 (prompt, style, size) 的并发请求只发起一次上游调用
+    - 在短暂的聚合窗口内把多个请求合并为一次批量调用（后端支持时）
+    - 工作协程数量即上游最大并发数
+    """
+
+    def __init__(self, backend: ImageBackend, max_concurrency: int = 4, batch_window: float = 0.05):
+        self.backend = backend
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_window = batch_window
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如测试中多次 asyncio.run）时重建队列与工作协程
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_concurrency * self.backend.max_batch_size * 16)
+            self._inflight = {}
+            self._workers = [
+                loop.create_task(self._worker(), name=f"image-worker-{i}")
+                for i in range(self.max_concurrency)
+            ]
+
+    async def submit(self, prompt: str, style: str, size: str) -> str:
+        self._ensure_workers()
+        key = (prompt, style, size)
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._loop.create_future()
+            self._inflight[key] = future
+            await self._queue.put(key)
+        else:
+            logger.debug(f"合并重复的图像请求: {prompt[:30]}")
+
+        # shield: 单个调用方取消不影响其他等待同一结果的请求
+        return await asyncio.shield(future)
+
+    async def _collect_batch(self) -> List[Tuple[str, str, str]]:
+        batch = [await self._queue.get()]
+        if self.backend.max_batch_size <= 1:
+            return batch
+
+        deadline = self._loop.time() + self.batch_window
+        while len(batch) < self.backend.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect_batch()
+
+            # 同一批次内按 (style, size) 分组，每组一次上游调用
+            groups: Dict[Tuple[str, str], List[Tuple[str, str, str]]] = {}
+            for key in batch:
+                groups.setdefault(key[1:], []).append(key)
+
+            for (style, size), keys in groups.items():
+                try:
+                    urls = await self.backend.generate_batch([k[0] for k in keys], style, size)
+                    for key, url in zip(keys, urls):
+                        self._resolve(key, result=url)
+                except Exception as e:
+                    logger.error(f"图像后端 {self.backend.name} 调用失败: {e}")
+                    for key in keys:
+                        self._resolve(key, error=e)
+
+            for _ in batch:
+                self._queue.task_done()
+
+    def _resolve(self, key: Tuple[str, str, str], result: str = None, error: Exception = None):
+        future = self._inflight.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def aclose(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._loop = None
+        await self.backend.aclose()
+
+
 class ImageGenerationService:
     """
     军事历史图像生成服务
     支持多种图片源：历史图片库、艺术作品、地形图等
     """
 
-    def __init__(self):
+    # search_battle_images 支持的图片类别及其说明文字
+    CATEGORY_CAPTIONS = {
+        'terrain': '{}战场地形地貌',
+        'troops': '{}参战双方军队',
+        'tactics': '{}战术部署示意图',
+        'artifacts': '{}相关文物兵器',
+    }
+
+    def __init__(self, backend: Optional[ImageBackend] = None, cache: Optional[CacheBackend] = None):
         # 军事历史图片库
         self.military_image_sources = {
             'terrain': 'https://images.unsplash.com/photo-1578662996442-48f60103fc96',
@@ -30,9 +307,26 @@ class ImageGenerationService:
             'artillery': 'https://images.unsplash.com/photo-1578662996442-48f60103fc96',
             'cavalry': 'https://images.unsplash.com/photo-1578662996442-48f60103fc96'
         }
-        
-        # 历史图片的占位符服务
-        self.use_mock = True  # 设为 False 后可切换真实 API
+
+        # 通过 IMAGE_BACKEND 环境变量选择后端（mock / dashscope / stub）
+        self.backend = backend if backend is not None else create_image_backend()
+        self.use_mock = self.backend is None
+        self.pool = None
+        if self.backend is not None:
+            self.pool = ImageRequestPool(
+                self.backend,
+                max_concurrency=int(os.getenv("IMAGE_MAX_CONCURRENCY", "4")),
+                batch_window=float(os.getenv("IMAGE_BATCH_WINDOW_MS", "50")) / 1000
+            )
+
+        # 生成结果缓存（进程内 + 多 worker 共享层）
+        # 万相返回的图片链接 24 小时后失效，默认缓存 23 小时
+        self.cache = cache or get_cache("images", ttl=float(os.getenv("IMAGE_CACHE_TTL", "82800")))
+
+    async def aclose(self):
+        """停止工作池并关闭后端客户端（mock 模式下没有需要关闭的资源）"""
+        if self.pool is not None:
+            await self.pool.aclose()
 
     async def generate(
         self,
@@ -42,12 +336,12 @@ class ImageGenerationService:
     ) -> str:
         """
         生成图像并返回 URL
-        
+
         Args:
             prompt: 文生图提示词（中文战役描述）
             style: 风格（"realistic", "oil-painting", "sketch" 等）
             size: 图像尺寸
-            
+
         Returns:
             图像 URL 字符串
         """
@@ -58,7 +352,6 @@ class ImageGenerationService:
             # 返回军事历史相关的占位图
             return await self._generate_military_historical_image(prompt, style)
         else:
-            # TODO: 接入真实图像生成 API（见下方注释）
             return await self._call_real_image_api(prompt, style, size)
 
     async def _call_real_image_api(
@@ -68,115 +361,88 @@ class ImageGenerationService:
         size: str
     ) -> str:
         """
-        【预留】真实图像生成 API 调用
-        示例：阿里通义万相、Stability AI、DALL·E 等
+        真实图像生成 API 调用
+        请求经工作池去重、合并后交给配置的后端（通义万相 / 本地桩服务）
         """
-        # 示例：阿里云百炼（需安装 dashscope）
-        # import dashscope
-        # from dashscope import ImageSynthesis
-        # dashscope.api_key = os.getenv("ALIBABA_BAILIAN_API_KEY")
-        # 
-        # response = ImageSynthesis.call(
-        #     model="wanx-v1",
-        #     prompt=prompt,
-        #     size=size
-        # )
-        # if response.status_code == 200:
-        #     return response.output.results[0].url
-        # else:
-        #     raise Exception(f"Image generation failed: {response.message}")
-
-        # 示例：OpenAI DALL·E（需 httpx + API key）
-        # import httpx
-        # headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
-        # json_data = {"model": "dall-e-3", "prompt": prompt, "n": 1, "size": "1024x1024"}
-        # resp = await httpx.AsyncClient().post(
-        #     "https://api.openai.com/v1/images/generations",
-        #     headers=headers,
-        #     json=json_data
-        # )
-        # return resp.json()["data"][0]["url"]
-
-        raise NotImplementedError("Real image API not implemented yet")
+        cache_key = stable_hash(self.backend.name, style, size, prompt)
+        cached_url = await self.cache.aget(cache_key)
+        if cached_url:
+            return cached_url
+
+        image_url = await self.pool.submit(prompt, style, size)
+        await self.cache.aset(cache_key, image_url)
+        return image_url
 
     async def _generate_military_historical_image(self, prompt: str, style: str = "realistic") -> str:
         """
         根据战役内容智能生成历史图片URL
         """
         prompt_lower = prompt.lower()
-        
+
         # 地形地貌图片
         if any(keyword in prompt_lower for keyword in ['地形', '地貌', '平原', '山地', '河流', '海岸']):
-            return "https://picsum.photos/400/250?random=terrain" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=terrain" + str(stable_bucket(prompt))
+
         # 古代战争图片
         elif any(keyword in prompt_lower for keyword in ['古代', '三国', '赤壁', '罗马', '希腊', '弓箭手', '步兵']):
-            return "https://picsum.photos/400/250?random=ancient" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=ancient" + str(stable_bucket(prompt))
+
         # 中世纪战争图片
         elif any(keyword in prompt_lower for keyword in ['中世纪', '骑士', '城堡', '黑斯廷斯', '诺曼', '长剑']):
-            return "https://picsum.photos/400/250?random=medieval" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=medieval" + str(stable_bucket(prompt))
+
         # 近代战争图片
         elif any(keyword in prompt_lower for keyword in ['近代', '火枪', '大炮', '滑铁卢', '拿破仑', '步兵方阵']):
-            return "https://picsum.photos/400/250?random=modern" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=modern" + str(stable_bucket(prompt))
+
         # 水战图片
         elif any(keyword in prompt_lower for keyword in ['水战', '海军', '战船', '赤壁', '舰队']):
-            return "https://picsum.photos/400/250?random=naval" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=naval" + str(stable_bucket(prompt))
+
         # 战术图示
         elif any(keyword in prompt_lower for keyword in ['战术', '战略', '部署', '阵型']):
-            return "https://picsum.photos/400/250?random=tactical" + str(hash(prompt) % 1000)
-        
+            return "https://picsum.photos/400/250?random=tactical" + str(stable_bucket(prompt))
+
         # 默认军事图片
         else:
-            return "https://picsum.photos/400/250?random=military" + str(hash(prompt) % 1000)
+            return "https://picsum.photos/400/250?random=military" + str(stable_bucket(prompt))
 
     async def search_battle_images(self, battle_name: str, categories: List[str] = None) -> List[Dict]:
         """
         搜索战役相关的历史图片
-        
+
         Args:
             battle_name: 战役名称
             categories: 图片类别列表 ['terrain', 'troops', 'tactics', 'artifacts']
-            
+
         Returns:
             图片信息列表，每个元素包含url和caption
         """
         if not categories:
             categories = ['terrain', 'troops', 'tactics']
-        
-        images = []
-        
-        for category in categories:
-            if category == 'terrain':
-                # 地形地貌图片
-                images.append({
-                    'url': f"https://picsum.photos/400/250?random=terrain_{hash(battle_name) % 1000}",
-                    'caption': f'{battle_name}战场地形地貌',
-                    'category': 'terrain'
-                })
-            elif category == 'troops':
-                # 军队部署图片
-                images.append({
-                    'url': f"https://picsum.photos/400/250?random=troops_{hash(battle_name) % 1000}",
-                    'caption': f'{battle_name}参战双方军队',
-                    'category': 'troops'
-                })
-            elif category == 'tactics':
-                # 战术图示
-                images.append({
-                    'url': f"https://picsum.photos/400/250?random=tactics_{hash(battle_name) % 1000}",
-                    'caption': f'{battle_name}战术部署示意图',
-                    'category': 'tactics'
-                })
-            elif category == 'artifacts':
-                # 文物兵器图片
-                images.append({
-                    'url': f"https://picsum.photos/400/250?random=artifacts_{hash(battle_name) % 1000}",
-                    'caption': f'{battle_name}相关文物兵器',
-                    'category': 'artifacts'
-                })
-        
-        return images
\ No newline at end of file
+
+        # 各类别并发生成，结果顺序与 categories 保持一致
+        tasks = [
+            self._search_category_image(battle_name, category)
+            for category in categories
+            if category in self.CATEGORY_CAPTIONS
+        ]
+        return list(await asyncio.gather(*tasks))
+
+    async def _search_category_image(self, battle_name: str, category: str) -> Dict:
+        """生成单个类别的战役图片"""
+        caption = self.CATEGORY_CAPTIONS[category].format(battle_name)
+        placeholder = f"https://picsum.photos/400/250?random={category}_{stable_bucket(battle_name)}"
+
+        url = placeholder
+        if not self.use_mock:
+            try:
+                url = await self.generate(caption)
+            except Exception as e:
+                logger.warning(f"战役图片生成失败 ({category}): {e}，使用占位图")
+
+        return {
+            'url': url,
+            'caption': caption,
+            'category': category
+        }
@@ -0,0 +1,48 @@
+# src/ai_agent/image_stub_server.py
+"""
+本地图像生成桩服务
+模拟支持批量提示词的文生图上游，用于联调 StubImageBackend 和压测工作池
+
+启动方式:
+    python -m uvicorn src.ai_agent.image_stub_server:app --port 8765
+"""
+
+import os
+import asyncio
+import hashlib
+from typing import List
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+app = FastAPI(title="Image Stub Server")
+
+# 模拟的上游延迟（毫秒），批量请求与单个请求耗时相同
+STUB_LATENCY_MS = int(os.getenv("IMAGE_STUB_LATENCY_MS", "200"))
+
+# 已处理的上游调用次数，便于验证去重与批处理效果
+stats = {"calls": 0, "prompts": 0}
+
+
+class StubImageRequest(BaseModel):
+    prompts: List[str]
+    style: str = "realistic"
+    size: str = "1024x1024"
+
+
+@app.post("/v1/images/generations")
+async def generate_images(request: StubImageRequest):
+    stats["calls"] += 1
+    stats["prompts"] += len(request.prompts)
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+
+    data = []
+    for prompt in request.prompts:
+        digest = hashlib.blake2b(f"{request.style}|{request.size}|{prompt}".encode("utf-8"), digest_size=8).hexdigest()
+        width, _, height = request.size.partition("x")
+        data.append({"url": f"https://picsum.photos/seed/{digest}/{width or 1024}/{height or 1024}"})
+    return {"data": data}
+
+
+@app.get("/v1/stats")
+async def get_stats():
+    return stats
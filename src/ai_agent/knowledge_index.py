@@ -0,0 +1,158 @@
+# src/ai_agent/knowledge_index.py
+"""
+知识库内存索引
+启动时一次性解析 knowledge_base 下的朝代与地名数据，建立按 ID 与名称的查找结构，
+请求与健康检查不再逐次读取、解析数据文件。数据文件更新后按间隔自动重新加载。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+DYNASTIES_FILE = "knowledge_base/dynasties.json"
+CITY_MAPPINGS_FILE = "knowledge_base/city_mappings.json"
+
+# 检查数据文件是否更新的最小间隔（秒）
+DATA_VERSION_CHECK_INTERVAL = 5.0
+
+
+class DynastyIndex:
+    """朝代、城市与地名映射索引"""
+
+    def __init__(self, dynasties_file: str = DYNASTIES_FILE, mappings_file: str = CITY_MAPPINGS_FILE):
+        self.dynasties_file = dynasties_file
+        self.mappings_file = mappings_file
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._mtimes: Dict[str, Optional[int]] = {}
+        self.load()
+
+    def _mtime(self, path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logger.error(f"知识库数据文件不存在: {path}")
+        except json.JSONDecodeError as e:
+            logger.error(f"知识库数据文件格式错误 {path}: {e}")
+        return None
+
+    def load(self):
+        """解析数据文件并重建索引"""
+        mtimes = {path: self._mtime(path) for path in (self.dynasties_file, self.mappings_file)}
+        dynasties_data = self._read_json(self.dynasties_file)
+        mappings = self._read_json(self.mappings_file)
+
+        dynasties: List[Dict[str, Any]] = (dynasties_data or {}).get("dynasties", [])
+        by_id = {dynasty["id"]: dynasty for dynasty in dynasties}
+
+        # 城市搜索表：预先计算小写名称
+        cities = []
+        for dynasty in dynasties:
+            for city in dynasty.get("majorCities", []):
+                cities.append((city["name"].lower(), city.get("modernName", "").lower(), city, dynasty))
+
+        with self._lock:
+            self.dynasties_loaded = dynasties_data is not None
+            self.mappings_loaded = mappings is not None
+            self.dynasties = dynasties
+            self.by_id = by_id
+            self.cities = cities
+            self.mappings = mappings or {}
+            self.loaded_at = time.time()
+            self._mtimes = mtimes
+        logger.info(f"朝代索引已加载: {len(dynasties)} 个朝代，{len(cities)} 个城市")
+
+    def refresh_if_changed(self):
+        """数据文件变化时重新加载（带最小检查间隔）"""
+        now = time.monotonic()
+        if now - self._last_check < DATA_VERSION_CHECK_INTERVAL:
+            return
+        self._last_check = now
+        if any(self._mtime(path) != mtime for path, mtime in self._mtimes.items()):
+            logger.info("朝代数据已更新，重新加载索引")
+            self.load()
+
+    def get_dynasty(self, dynasty_id: str) -> Optional[Dict[str, Any]]:
+        self.refresh_if_changed()
+        return self.by_id.get(dynasty_id)
+
+    def all_dynasties(self) -> List[Dict[str, Any]]:
+        self.refresh_if_changed()
+        return self.dynasties
+
+    def search_cities(self, term: str) -> List[Dict[str, Any]]:
+        """按历史名称或现代名称模糊匹配城市，按城市名去重"""
+        with span("knowledge.city_search") as search_span:
+            results = self._search_cities(term)
+            search_span.set_attribute("results", len(results))
+            return results
+
+    def _search_cities(self, term: str) -> List[Dict[str, Any]]:
+        self.refresh_if_changed()
+        term = term.strip().lower()
+        results = []
+        seen_names = set()
+        for name, modern_name, city, dynasty in self.cities:
+            is_match = term in name or name in term or term in modern_name or modern_name in term
+            if not is_match or city["name"] in seen_names:
+                continue
+            seen_names.add(city["name"])
+            results.append({
+                "cityName": city["name"],
+                "modernName": city["modernName"],
+                "dynasty": dynasty["name"],
+                "dynastyId": dynasty["id"],
+                "position": city["position"],
+                "type": city["type"],
+                "importance": city["importance"],
+                "period": dynasty["period"]
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """索引状态（供健康检查使用，不访问文件系统）"""
+        return {
+            "data_files": {
+                "dynasties": self.dynasties_loaded,
+                "city_mappings": self.mappings_loaded
+            },
+            "data_counts": {
+                "dynasties": len(self.dynasties),
+                "historical_cities": len(self.mappings.get("allHistoricalCities", []))
+            },
+            "loaded_at": self.loaded_at
+        }
+
+
+_dynasty_index: Optional[DynastyIndex] = None
+_dynasty_index_lock = threading.Lock()
+
+
+def get_dynasty_index() -> DynastyIndex:
+    """获取朝代索引（进程内单例，首次调用时加载）"""
+    global _dynasty_index
+    if _dynasty_index is None:
+        with _dynasty_index_lock:
+            if _dynasty_index is None:
+                _dynasty_index = DynastyIndex()
+    return _dynasty_index
+
+
+def peek_dynasty_index() -> Optional[DynastyIndex]:
+    """返回已加载的朝代索引；尚未加载时返回 None（不触发加载）"""
+    return _dynasty_index
@@ -1,14 +1,40 @@
 # src/ai_agent/model_service.py
 import os
-import httpx
 import json
+import time
 import logging
+import threading
+from contextlib import contextmanager
 from typing import Dict, Any, List, Optional
 from abc import ABC, abstractmethod
-from zhipuai import ZhipuAI
+
+from src.core.http_client import get_http_client
+from src.core.loop_monitor import run_blocking
+from src.core.metrics import MODEL_FAILOVERS, MODEL_REQUEST_DURATION, MODEL_REQUEST_ERRORS
+from src.core.tracing import current_span, span
 
 logger = logging.getLogger(__name__)
 
+
+def _record_call(backend: str, start: float, error: Exception = None):
+    """记录一次上游模型调用的耗时与结果"""
+    MODEL_REQUEST_DURATION.observe(time.perf_counter() - start, backend=backend, outcome="error" if error else "ok")
+    if error is not None:
+        MODEL_REQUEST_ERRORS.inc(backend=backend, error=type(error).__name__)
+
+
+@contextmanager
+def _upstream_call(backend: str, model: str, message_count: int):
+    """包裹一次上游模型调用：记录指标并创建追踪 span"""
+    start = time.perf_counter()
+    with span("model.chat_completion", backend=backend, model=model, messages=message_count):
+        try:
+            yield
+        except Exception as e:
+            _record_call(backend, start, e)
+            raise
+        _record_call(backend, start)
+
 class ModelService(ABC):
     """大模型服务抽象基类"""
     
@@ -37,7 +63,10 @@ class ZhipuService(ModelService):
         # I will use "glm-4-flash" as it is the closest valid model name to "Flash".
         self.client = None
         if self.api_key:
-            self.client = ZhipuAI(api_key=self.api_key)
+            # SDK 导入较慢，只在确实需要时导入
+            from zhipuai import ZhipuAI
+            # ZHIPUAI_BASE_URL 可指向本地桩服务（见 model_stub_server.py），未设置时使用官方地址
+            self.client = ZhipuAI(api_key=self.api_key, base_url=os.getenv("ZHIPUAI_BASE_URL"))
         else:
             logger.warning("ZHIPUAI_API_KEY 未设置")
 
@@ -61,9 +90,10 @@ class ZhipuService(ModelService):
                 )
                 return response
 
-            import asyncio
-            response = await asyncio.to_thread(call_zhipu)
-            return response.choices[0].message.content
+            # ZHIPU_EXECUTOR_WORKERS 设置时使用专用线程池，不与其他阻塞调用争抢默认线程池
+            with _upstream_call(type(self).__name__, self.model, len(messages)):
+                response = await run_blocking("zhipu", call_zhipu)
+                return response.choices[0].message.content
         except Exception as e:
             logger.error(f"ZhipuAI API 调用失败: {e}")
             raise e
@@ -74,7 +104,7 @@ class OpenRouterService(ModelService):
     def __init__(self, api_key: str = None, model: str = None):
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.model = model or os.getenv("OPENROUTER_MODEL", "deepseek/deepseek-r1-0528:free")
-        self.endpoint = "https://openrouter.ai/api/v1/chat/completions"
+        self.endpoint = os.getenv("OPENROUTER_ENDPOINT", "https://openrouter.ai/api/v1/chat/completions")
         
         if not self.api_key:
             logger.warning("OPENROUTER_API_KEY 环境变量未设置")
@@ -105,7 +135,9 @@ class OpenRouterService(ModelService):
         }
         
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            with _upstream_call(type(self).__name__, self.model, len(messages)):
+                # 复用进程级连接池，避免每次调用重新建立 TLS 连接
+                client = get_http_client()
                 response = await client.post(self.endpoint, headers=headers, json=payload)
                 response.raise_for_status()
                 
@@ -122,24 +154,40 @@ class HybridModelService(ModelService):
         self.primary = primary
         self.backup = backup
 
+    def _record_failover(self, error: Exception):
+        primary, backup = type(self.primary).__name__, type(self.backup).__name__
+        MODEL_FAILOVERS.inc(primary=primary, backup=backup)
+        current_span().add_event("failover", primary=primary, backup=backup, error=type(error).__name__)
+
     async def generate_text(self, prompt: str, **kwargs) -> str:
-        try:
-            return await self.primary.generate_text(prompt, **kwargs)
-        except Exception as e:
-            logger.warning(f"Primary model failed: {e}. Switching to backup model.")
-            return await self.backup.generate_text(prompt, **kwargs)
+        with span("model.hybrid", operation="generate_text"):
+            try:
+                return await self.primary.generate_text(prompt, **kwargs)
+            except Exception as e:
+                logger.warning(f"Primary model failed: {e}. Switching to backup model.")
+                self._record_failover(e)
+                return await self.backup.generate_text(prompt, **kwargs)
 
     async def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        try:
-            return await self.primary.chat_completion(messages, **kwargs)
-        except Exception as e:
-            logger.warning(f"Primary model chat failed: {e}. Switching to backup model.")
-            return await self.backup.chat_completion(messages, **kwargs)
+        with span("model.hybrid", operation="chat_completion"):
+            try:
+                return await self.primary.chat_completion(messages, **kwargs)
+            except Exception as e:
+                logger.warning(f"Primary model chat failed: {e}. Switching to backup model.")
+                self._record_failover(e)
+                return await self.backup.chat_completion(messages, **kwargs)
+
+_model_service: Optional[ModelService] = None
+_model_service_lock = threading.Lock()
 
 def get_model_service() -> ModelService:
-    """获取模型服务实例"""
-    # 默认配置：智谱 (GLM-4-Flash) 为主，OpenRouter 为备
-    zhipu_service = ZhipuService(model="glm-4-flash")
-    openrouter_service = OpenRouterService()
-    
-    return HybridModelService(primary=zhipu_service, backup=openrouter_service)
\ No newline at end of file
+    """获取模型服务实例（进程内单例，SDK 客户端与连接在请求间复用）"""
+    global _model_service
+    if _model_service is None:
+        with _model_service_lock:
+            if _model_service is None:
+                # 默认配置：智谱 (GLM-4-Flash) 为主，OpenRouter 为备
+                zhipu_service = ZhipuService(model="glm-4-flash")
+                openrouter_service = OpenRouterService()
+                _model_service = HybridModelService(primary=zhipu_service, backup=openrouter_service)
+    return _model_service
\ No newline at end of file
@@ -0,0 +1,196 @@
+# src/ai_agent/model_stub_server.py
+"""
+本地大模型 / 视频生成桩服务
+模拟智谱（GLM 对话、CogVideoX 异步视频任务）与 OpenRouter 的上游接口，用于压测与故障演练
+
+- 智谱: ZHIPUAI_BASE_URL=http://127.0.0.1:8766/api/paas/v4
+- OpenRouter: OPENROUTER_ENDPOINT=http://127.0.0.1:8766/api/v1/chat/completions
+- 每个上游可分别配置延迟、抖动、失败率与非法 JSON 比例（环境变量或 POST /v1/config）
+
+启动方式:
+    python -m uvicorn src.ai_agent.model_stub_server:app --port 8766
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="Model Stub Server")
+
+BACKENDS = ("zhipu", "openrouter", "video")
+
+
+def _default_config(backend: str) -> Dict[str, float]:
+    prefix = f"{backend.upper()}_STUB_"
+
+    def env(name: str, default: str) -> float:
+        return float(os.getenv(prefix + name, os.getenv("MODEL_STUB_" + name, default)))
+
+    return {
+        # 模拟的上游延迟与抖动（毫秒）
+        "latency_ms": env("LATENCY_MS", "300"),
+        "jitter_ms": env("JITTER_MS", "50"),
+        # 返回 HTTP 错误的比例（0 ~ 1）
+        "failure_rate": env("FAILURE_RATE", "0"),
+        # 推演请求返回无法修复的文本的比例，用于观察解析失败路径
+        "malformed_rate": env("MALFORMED_RATE", "0"),
+        # 视频任务从提交到完成的耗时（毫秒）
+        "task_duration_ms": env("TASK_DURATION_MS", "2000"),
+    }
+
+
+config: Dict[str, Dict[str, float]] = {backend: _default_config(backend) for backend in BACKENDS}
+
+# 已处理的上游调用次数，便于核对主备切换与缓存效果
+stats: Dict[str, Dict[str, int]] = {backend: {"calls": 0, "failures": 0} for backend in BACKENDS}
+
+# 视频任务 ID -> 提交时间
+video_tasks: Dict[str, float] = {}
+
+STUB_DEDUCTION = {
+    "title": "桩服务推演",
+    "location": [113.9, 29.9],
+    "steps": [
+        {
+            "time": "第一阶段",
+            "description": "两军隔江对峙，联军于南岸集结。",
+            "actions": [{"type": "marker", "coordinate": [113.9, 29.9], "label": "联军大营"}]
+        },
+        {
+            "time": "第二阶段",
+            "description": "先锋顺风渡江，直逼敌方水寨。",
+            "actions": [{"type": "arrow", "from": [113.9, 29.9], "to": [113.8, 30.0], "label": "渡江"}]
+        },
+        {
+            "time": "第三阶段",
+            "description": "火攻得手，敌军沿陆路撤退。",
+            "actions": [
+                {"type": "circle", "center": [113.8, 30.0], "radius": 3000, "label": "火攻"},
+                {"type": "path", "path": [[113.8, 30.0], [113.5, 30.3], [113.2, 30.6]], "label": "撤退路线"}
+            ]
+        }
+    ]
+}
+
+
+class StubConfigUpdate(BaseModel):
+    backend: str
+    latency_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    failure_rate: Optional[float] = None
+    malformed_rate: Optional[float] = None
+    task_duration_ms: Optional[float] = None
+
+
+async def _simulate(backend: str) -> Optional[JSONResponse]:
+    """模拟上游延迟；按失败率返回错误响应，否则返回 None"""
+    cfg = config[backend]
+    stats[backend]["calls"] += 1
+    delay = max(0.0, cfg["latency_ms"] + random.uniform(-cfg["jitter_ms"], cfg["jitter_ms"]))
+    await asyncio.sleep(delay / 1000)
+    if random.random() < cfg["failure_rate"]:
+        stats[backend]["failures"] += 1
+        status = random.choice((429, 500, 503))
+        return JSONResponse({"error": {"code": str(status), "message": "injected failure"}}, status_code=status)
+    return None
+
+
+def _completion_content(backend: str, messages: List[Dict[str, Any]]) -> str:
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    if "推演" in system and "JSON" in system:
+        if random.random() < config[backend]["malformed_rate"]:
+            return "抱歉，我无法完成这次推演。"
+        return json.dumps(STUB_DEDUCTION, ensure_ascii=False)
+    question = messages[-1].get("content", "") if messages else ""
+    return f"[{backend} stub] 关于“{question[:40]}”的分析：兵贵神速，因地制宜。" * 8
+
+
+def _completion(backend: str, model: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    content = _completion_content(backend, messages)
+    return {
+        "id": f"stub-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)}
+    }
+
+
+@app.post("/api/paas/v4/chat/completions")
+async def zhipu_chat(request: Request):
+    body = await request.json()
+    error = await _simulate("zhipu")
+    if error is not None:
+        return error
+    return _completion("zhipu", body.get("model", "glm-4-flash"), body.get("messages", []))
+
+
+@app.post("/api/v1/chat/completions")
+async def openrouter_chat(request: Request):
+    body = await request.json()
+    error = await _simulate("openrouter")
+    if error is not None:
+        return error
+    return _completion("openrouter", body.get("model", "stub"), body.get("messages", []))
+
+
+@app.post("/api/paas/v4/videos/generations")
+async def video_generations(request: Request):
+    body = await request.json()
+    error = await _simulate("video")
+    if error is not None:
+        return error
+    task_id = uuid.uuid4().hex
+    video_tasks[task_id] = time.monotonic()
+    return {"id": task_id, "model": body.get("model", "cogvideox-flash"), "task_status": "PROCESSING", "request_id": task_id}
+
+
+@app.get("/api/paas/v4/async-result/{task_id}")
+async def video_result(task_id: str):
+    submitted = video_tasks.get(task_id)
+    if submitted is None:
+        return JSONResponse({"error": {"code": "404", "message": "task not found"}}, status_code=404)
+    if (time.monotonic() - submitted) * 1000 < config["video"]["task_duration_ms"]:
+        return {"id": task_id, "task_status": "PROCESSING", "request_id": task_id}
+    video_tasks.pop(task_id, None)
+    return {
+        "id": task_id,
+        "task_status": "SUCCESS",
+        "request_id": task_id,
+        "video_result": [{"url": f"https://example.com/stub-video/{task_id}.mp4", "cover_image_url": ""}]
+    }
+
+
+@app.get("/v1/config")
+async def get_config():
+    return config
+
+
+@app.post("/v1/config")
+async def update_config(update: StubConfigUpdate):
+    """运行时调整某个上游的延迟与故障注入（压测脚本在场景之间调用）"""
+    if update.backend not in config:
+        return JSONResponse({"error": f"unknown backend: {update.backend}"}, status_code=400)
+    for key, value in update.model_dump(exclude={"backend"}, exclude_none=True).items():
+        config[update.backend][key] = value
+    return config[update.backend]
+
+
+@app.get("/v1/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/v1/stats/reset")
+async def reset_stats():
+    for counters in stats.values():
+        counters.update(calls=0, failures=0)
+    return stats
@@ -0,0 +1,468 @@
+# src/ai_agent/pathfinding.py
+"""
+行军路线寻路
+
+在战役范围的代价网格上用 A* 计算两点之间的行军路线，代替推演 path / arrow 动作中的直线：
+- 代价网格由高程网格（坡度）、地形类型（battle_engine.TERRAIN_MODIFIERS 的移动修正）、
+  河流（terrain_data.rivers，只能高代价涉渡）与道路（terrain_data.roads，代价减半，可跨河视为桥梁）生成
+- 分层寻路：先在 4 倍降采样的粗网格上求出走廊，再只在走廊内做细网格 A*；走廊内无解时退回全图搜索。
+  启发式带 HEURISTIC_WEIGHT 权重，以略微偏离最优换取更少的节点扩展
+- 代价网格与路线查询都有进程内 LRU 缓存。批量路线按空间聚类，每个聚类共用一张代价网格，
+  聚类范围以格子边长不超过 PATHFINDING_MAX_CELL_M 为限，避免个别远处的路线把全部路线的网格拉粗
+
+路线以 [经度, 纬度] 列表返回，共线的中间点会被合并。
+"""
+
+import os
+import math
+import heapq
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.ai_agent.battle_engine import DEFAULT_TERRAIN, TERRAIN_MODIFIERS
+from src.ai_agent.terrain import METERS_PER_DEGREE, ElevationGrid, bbox_around, get_terrain_service
+from src.core.cache import MemoryLRUCache, stable_hash
+from src.core.spatial_mapper import is_valid_coordinate
+
+logger = logging.getLogger(__name__)
+
+# 代价网格长边格数、路线查询缓存条目数
+PATHFINDING_GRID_SIZE = int(os.getenv("PATHFINDING_GRID_SIZE", "128"))
+PATH_CACHE_ENTRIES = int(os.getenv("PATH_CACHE_ENTRIES", "4096"))
+# 代价网格格子边长上限（米）；单条路线超出 PATHFINDING_GRID_SIZE 格能覆盖的范围时网格加密，
+# 最多到 MAX_ROUTE_GRID_SIZE 格，再远的路线只能接受更粗的格子
+PATHFINDING_MAX_CELL_M = float(os.getenv("PATHFINDING_MAX_CELL_M", "250"))
+MAX_ROUTE_GRID_SIZE = 2 * PATHFINDING_GRID_SIZE
+# 单条路线范围长边的上限（米）：更远的行军不是战役尺度的寻路，且会让高程采样覆盖过多 DEM 瓦片
+MAX_ROUTE_EXTENT_M = 500_000.0
+# 路线端点所在范围外扩的距离（米），给绕行留出空间
+ROUTE_MARGIN_M = 3000.0
+# 每 100% 坡度增加的代价倍数，以及不可通行的坡度
+SLOPE_COST = 8.0
+MAX_SLOPE = 0.6
+# 涉渡河流与沿道路行军的代价倍数
+RIVER_COST = 25.0
+ROAD_COST = 0.5
+# 分层寻路的降采样倍数、粗网格走廊外扩格数，以及启用分层的最小格数
+COARSE_FACTOR = 4
+CORRIDOR_RADIUS = 1
+HIERARCHICAL_MIN_CELLS = 48 * 48
+# 启发式权重（weighted A*）：大于 1 时扩展的节点大幅减少，路线代价最多为最优解的该倍数
+HEURISTIC_WEIGHT = 1.2
+# 单次批量请求的最大路线数
+MAX_BATCH_ROUTES = 200
+
+_NEIGHBORS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+@dataclass
+class CostGrid:
+    """规则经纬度网格上每米行军的相对代价（行 0 为北边缘，inf 表示不可通行）"""
+    west: float
+    south: float
+    east: float
+    north: float
+    cost: np.ndarray
+    key: str
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.cost.shape
+
+    @property
+    def cell_size_m(self) -> Tuple[float, float]:
+        """(格宽, 格高)，单位米"""
+        rows, cols = self.shape
+        cos_lat = math.cos(math.radians((self.north + self.south) / 2))
+        return ((self.east - self.west) * METERS_PER_DEGREE * cos_lat / cols,
+                (self.north - self.south) * METERS_PER_DEGREE / rows)
+
+    def cell_of(self, lon: float, lat: float) -> Tuple[int, int]:
+        rows, cols = self.shape
+        col = int((lon - self.west) / (self.east - self.west) * cols)
+        row = int((self.north - lat) / (self.north - self.south) * rows)
+        return min(max(row, 0), rows - 1), min(max(col, 0), cols - 1)
+
+    def cell_center(self, row: int, col: int) -> List[float]:
+        rows, cols = self.shape
+        return [round(self.west + (col + 0.5) * (self.east - self.west) / cols, 6),
+                round(self.north - (row + 0.5) * (self.north - self.south) / rows, 6)]
+
+
+def _rasterize_lines(lines: Sequence[Sequence[Sequence[float]]], west: float, north: float,
+                     lon_step: float, lat_step: float, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    把折线栅格化为 4 连通的格子掩码
+
+    4 连通保证河流在 8 邻域寻路中不会被斜向穿过
+    """
+    rows, cols = shape
+    mask = np.zeros(shape, dtype=bool)
+    for line in lines:
+        points = [p for p in line if isinstance(p, (list, tuple)) and len(p) >= 2]
+        for (lon_a, lat_a), (lon_b, lat_b) in zip([p[:2] for p in points], [p[:2] for p in points[1:]]):
+            n = max(2, int(max(abs(lon_b - lon_a) / lon_step, abs(lat_b - lat_a) / lat_step) * 4) + 1)
+            f = np.linspace(0.0, 1.0, n)
+            r = np.floor((north - (lat_a + (lat_b - lat_a) * f)) / lat_step).astype(np.int64)
+            c = np.floor((lon_a + (lon_b - lon_a) * f - west) / lon_step).astype(np.int64)
+            # 相邻采样点只在对角方向相邻时，补上一个正交方向的格子
+            diagonal = np.flatnonzero((np.abs(np.diff(r)) == 1) & (np.abs(np.diff(c)) == 1))
+            r = np.concatenate([r, r[diagonal]])
+            c = np.concatenate([c, c[diagonal + 1]])
+            inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+            mask[r[inside], c[inside]] = True
+    return mask
+
+
+def _line_paths(features: Any) -> List[List[List[float]]]:
+    """
+    terrain_data.rivers / roads：[{"path": [[lon, lat], ...]}] 或直接为坐标列表
+
+    Raises:
+        ValueError: 结构或坐标格式不正确
+    """
+    if features is None:
+        return []
+    if not isinstance(features, list):
+        raise ValueError("河流 / 道路必须是数组")
+    paths = []
+    for feature in features:
+        path = feature.get("path") if isinstance(feature, dict) else feature
+        if not isinstance(path, list):
+            raise ValueError("河流 / 道路的 path 必须是坐标数组")
+        if len(path) < 2:
+            continue
+        try:
+            points = [[float(p[0]), float(p[1])] for p in path]
+        except (TypeError, ValueError, IndexError, KeyError):
+            raise ValueError("河流 / 道路坐标格式应为 [经度, 纬度]")
+        if not all(is_valid_coordinate(lon, lat) for lon, lat in points):
+            raise ValueError("河流 / 道路坐标超出经纬度范围")
+        paths.append(points)
+    return paths
+
+
+def build_cost_grid(elevation: ElevationGrid, terrain_type: str = "", rivers: Any = None,
+                    roads: Any = None) -> CostGrid:
+    """
+    由高程网格、地形类型、河流与道路生成代价网格
+
+    Args:
+        elevation: 高程网格（terrain.TerrainService.elevation_grid）
+        terrain_type: 战役地形类型，决定基础移动代价
+        rivers / roads: terrain_data 中的河流 / 道路折线
+    """
+    rivers, roads = _line_paths(rivers), _line_paths(roads)
+    heights = np.asarray(elevation.heights, dtype=np.float64)
+    rows, cols = heights.shape
+    lon_step = (elevation.east - elevation.west) / cols
+    lat_step = (elevation.north - elevation.south) / rows
+    cos_lat = math.cos(math.radians((elevation.north + elevation.south) / 2))
+
+    modifiers = TERRAIN_MODIFIERS.get(terrain_type, DEFAULT_TERRAIN)
+    cost = np.full(heights.shape, 1.0 / modifiers["movement"])
+    if rows > 1 and cols > 1:
+        d_row, d_col = np.gradient(heights, lat_step * METERS_PER_DEGREE, lon_step * METERS_PER_DEGREE * cos_lat)
+        slope = np.hypot(d_row, d_col)
+        cost *= 1 + SLOPE_COST * slope
+        cost[slope > MAX_SLOPE] = np.inf
+
+    if rivers:
+        cost[_rasterize_lines(rivers, elevation.west, elevation.north, lon_step, lat_step, heights.shape)] = RIVER_COST
+    if roads:
+        # 道路覆盖河流格子，即视为桥梁
+        road_mask = _rasterize_lines(roads, elevation.west, elevation.north, lon_step, lat_step, heights.shape)
+        cost[road_mask] = ROAD_COST
+
+    key = stable_hash(elevation.key or heights.astype("<f4").tobytes(), terrain_type, rivers, roads)
+    return CostGrid(elevation.west, elevation.south, elevation.east, elevation.north,
+                    cost.astype(np.float32), key)
+
+
+def _coarsen(cost: np.ndarray, factor: int) -> np.ndarray:
+    """按块降采样：可通行格子的平均代价；块内一半以上格子不可通行时整块不可通行"""
+    rows, cols = cost.shape
+    padded_rows, padded_cols = -(-rows // factor) * factor, -(-cols // factor) * factor
+    finite = np.zeros((padded_rows, padded_cols), dtype=bool)
+    finite[:rows, :cols] = np.isfinite(cost)
+    values = np.zeros((padded_rows, padded_cols))
+    values[finite] = cost[finite[:rows, :cols]]
+    shape = (padded_rows // factor, factor, padded_cols // factor, factor)
+    padding = np.ones((padded_rows, padded_cols), dtype=bool)
+    padding[:rows, :cols] = False
+    total = factor * factor - padding.reshape(shape).sum(axis=(1, 3))
+    counts = finite.reshape(shape).sum(axis=(1, 3))
+    coarse = values.reshape(shape).sum(axis=(1, 3)) / np.maximum(counts, 1)
+    return np.where(counts * 2 > total, coarse, np.inf)
+
+
+def _astar(cost: np.ndarray, start: Tuple[int, int], goal: Tuple[int, int], cell_w: float, cell_h: float,
+           allowed: Optional[np.ndarray] = None) -> Optional[Tuple[List[Tuple[int, int]], float]]:
+    """
+    8 邻域 weighted A*，步进代价 = 两格代价均值 × 步长（米）
+
+    Returns:
+        (格子序列, 总代价)；不可达时返回 None
+    """
+    rows, cols = cost.shape
+    passable = np.isfinite(cost)
+    if allowed is not None:
+        passable &= allowed
+    passable[start] = passable[goal] = True
+    cost_list = np.where(np.isfinite(cost), cost, 0.0).ravel().tolist()
+    passable_list = passable.ravel().tolist()
+    finite = cost[np.isfinite(cost)]
+    weight = (float(finite.min()) if finite.size else 1.0) * HEURISTIC_WEIGHT
+    steps = [(dr * cols + dc, dr, dc, math.hypot(dr * cell_h, dc * cell_w)) for dr, dc in _NEIGHBORS]
+    diag = math.hypot(cell_w, cell_h)
+    goal_r, goal_c = goal
+    goal_i = goal_r * cols + goal_c
+
+    def heuristic(r: int, c: int) -> float:
+        # 八方向距离（米）× 最小代价 × 权重
+        n_cols, n_rows = abs(c - goal_c), abs(r - goal_r)
+        n_diag = min(n_cols, n_rows)
+        return (n_cols * cell_w + n_rows * cell_h + n_diag * (diag - cell_w - cell_h)) * weight
+
+    start_i = start[0] * cols + start[1]
+    g = {start_i: 0.0}
+    parent = {start_i: -1}
+    heap = [(heuristic(*start), 0.0, start_i)]
+    closed = set()
+    while heap:
+        _, g_i, i = heapq.heappop(heap)
+        if i == goal_i:
+            path = []
+            while i != -1:
+                path.append(divmod(i, cols))
+                i = parent[i]
+            return path[::-1], g_i
+        if i in closed:
+            continue
+        closed.add(i)
+        r, c = divmod(i, cols)
+        cost_i = cost_list[i]
+        for offset, dr, dc, length in steps:
+            nr, nc = r + dr, c + dc
+            if nr < 0 or nr >= rows or nc < 0 or nc >= cols:
+                continue
+            j = i + offset
+            if not passable_list[j] or j in closed:
+                continue
+            if dr and dc and not (passable_list[i + dr * cols] and passable_list[i + dc]):
+                # 不允许斜向切过不可通行格子的角
+                continue
+            g_j = g_i + (cost_i + cost_list[j]) * 0.5 * length
+            if g_j < g.get(j, math.inf):
+                g[j] = g_j
+                parent[j] = i
+                heapq.heappush(heap, (g_j + heuristic(nr, nc), g_j, j))
+    return None
+
+
+def _simplify(cells: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """合并方向不变的中间格子"""
+    if len(cells) <= 2:
+        return cells
+    result = [cells[0]]
+    for prev, cell, nxt in zip(cells, cells[1:], cells[2:]):
+        if (cell[0] - prev[0], cell[1] - prev[1]) != (nxt[0] - cell[0], nxt[1] - cell[1]):
+            result.append(cell)
+    result.append(cells[-1])
+    return result
+
+
+def find_path(grid: CostGrid, start: Sequence[float], goal: Sequence[float]) -> Optional[Dict[str, Any]]:
+    """
+    计算两点之间的行军路线
+
+    Returns:
+        {path: [[lon, lat], ...], distance_m, cost, hierarchical}；不可达时返回 None
+    """
+    start_cell, goal_cell = grid.cell_of(*start[:2]), grid.cell_of(*goal[:2])
+    cell_w, cell_h = grid.cell_size_m
+    rows, cols = grid.shape
+
+    found, hierarchical = None, False
+    if rows * cols >= HIERARCHICAL_MIN_CELLS and start_cell != goal_cell:
+        coarse = _coarsen(grid.cost, COARSE_FACTOR)
+        coarse_found = _astar(coarse, (start_cell[0] // COARSE_FACTOR, start_cell[1] // COARSE_FACTOR),
+                              (goal_cell[0] // COARSE_FACTOR, goal_cell[1] // COARSE_FACTOR),
+                              cell_w * COARSE_FACTOR, cell_h * COARSE_FACTOR)
+        if coarse_found is not None:
+            corridor = np.zeros(coarse.shape, dtype=bool)
+            for r, c in coarse_found[0]:
+                corridor[max(r - CORRIDOR_RADIUS, 0):r + CORRIDOR_RADIUS + 1,
+                         max(c - CORRIDOR_RADIUS, 0):c + CORRIDOR_RADIUS + 1] = True
+            allowed = np.repeat(np.repeat(corridor, COARSE_FACTOR, axis=0), COARSE_FACTOR, axis=1)[:rows, :cols]
+            found = _astar(grid.cost, start_cell, goal_cell, cell_w, cell_h, allowed)
+            hierarchical = found is not None
+    if found is None:
+        found = _astar(grid.cost, start_cell, goal_cell, cell_w, cell_h)
+    if found is None:
+        return None
+
+    cells, total_cost = found
+    path = [grid.cell_center(r, c) for r, c in _simplify(cells)]
+    # 端点使用原始坐标
+    path[0] = [float(start[0]), float(start[1])]
+    if len(path) == 1:
+        path.append([float(goal[0]), float(goal[1])])
+    else:
+        path[-1] = [float(goal[0]), float(goal[1])]
+    distance = sum(
+        math.hypot((b[0] - a[0]) * METERS_PER_DEGREE * math.cos(math.radians(a[1])), (b[1] - a[1]) * METERS_PER_DEGREE)
+        for a, b in zip(path, path[1:])
+    )
+    return {"path": path, "distance_m": round(distance, 1), "cost": round(total_cost, 1), "hierarchical": hierarchical}
+
+
+def _extent_m(bbox: Tuple[float, float, float, float]) -> float:
+    """范围长边（米）"""
+    west, south, east, north = bbox
+    cos_lat = math.cos(math.radians((north + south) / 2))
+    return max((east - west) * METERS_PER_DEGREE * cos_lat, (north - south) * METERS_PER_DEGREE)
+
+
+def cluster_routes(routes: Sequence[Sequence[Sequence[float]]],
+                   max_extent_m: float) -> List[List[int]]:
+    """
+    按空间范围把路线分组：依次把路线并入第一个合并后（含 ROUTE_MARGIN_M 外扩）长边不超过 max_extent_m 的组
+
+    Returns:
+        每组路线在 routes 中的下标
+
+    Raises:
+        ValueError: 某条路线的范围超过 MAX_ROUTE_EXTENT_M
+    """
+    boxes = [bbox_around(waypoints, 0.0) for waypoints in routes]
+    for i, box in enumerate(boxes):
+        if _extent_m(box) > MAX_ROUTE_EXTENT_M:
+            raise ValueError(f"第 {i + 1} 条路线范围超过 {MAX_ROUTE_EXTENT_M / 1000:.0f} 千米")
+    clusters: List[Tuple[List[float], List[int]]] = []
+    # 按范围中心排序，相邻的路线先被归到一起
+    for i in sorted(range(len(routes)), key=lambda i: (boxes[i][0] + boxes[i][2], boxes[i][1] + boxes[i][3])):
+        box = boxes[i]
+        for cluster_box, indices in clusters:
+            merged = (min(cluster_box[0], box[0]), min(cluster_box[1], box[1]),
+                      max(cluster_box[2], box[2]), max(cluster_box[3], box[3]))
+            if _extent_m(merged) + 2 * ROUTE_MARGIN_M <= max_extent_m:
+                cluster_box[:] = merged
+                indices.append(i)
+                break
+        else:
+            clusters.append((list(box), [i]))
+    return [sorted(indices) for _, indices in clusters]
+
+
+class PathfindingService:
+    """代价网格与路线查询的缓存"""
+
+    def __init__(self):
+        self._grids = MemoryLRUCache(max_entries=32, metrics_name="path_cost_grids")
+        self._paths = MemoryLRUCache(max_entries=PATH_CACHE_ENTRIES, metrics_name="path_queries")
+
+    def cost_grid(self, points: Sequence[Sequence[float]], terrain_type: str = "",
+                  terrain_data: Dict[str, Any] = None, size: Optional[int] = None) -> CostGrid:
+        """
+        覆盖全部点的代价网格
+
+        Args:
+            size: 长边格数；缺省为 PATHFINDING_GRID_SIZE，范围较大时加密到格子边长不超过
+                  PATHFINDING_MAX_CELL_M（最多 MAX_ROUTE_GRID_SIZE 格）
+        """
+        terrain_data = terrain_data or {}
+        bbox = bbox_around(points, ROUTE_MARGIN_M)
+        if size is None:
+            needed = math.ceil(_extent_m(bbox) / PATHFINDING_MAX_CELL_M)
+            size = min(max(PATHFINDING_GRID_SIZE, needed), MAX_ROUTE_GRID_SIZE)
+        elevation = get_terrain_service().elevation_grid(bbox, size)
+        key = stable_hash(elevation.key, terrain_type, terrain_data.get("rivers"), terrain_data.get("roads"))
+        grid = self._grids.get(key)
+        if grid is None:
+            grid = build_cost_grid(elevation, terrain_type, terrain_data.get("rivers"), terrain_data.get("roads"))
+            self._grids.set(key, grid)
+        return grid
+
+    def route(self, grid: CostGrid, waypoints: Sequence[Sequence[float]]) -> Optional[Dict[str, Any]]:
+        """依次经过全部途经点的路线；任一段不可达时返回 None"""
+        path: List[List[float]] = []
+        distance = cost = 0.0
+        hierarchical = True
+        for start, goal in zip(waypoints, waypoints[1:]):
+            key = stable_hash(grid.key, [round(v, 6) for v in start[:2]], [round(v, 6) for v in goal[:2]])
+            leg = self._paths.get(key)
+            if leg is None:
+                leg = find_path(grid, start, goal) or {}
+                self._paths.set(key, leg)
+            if not leg:
+                return None
+            path.extend(leg["path"][1:] if path else leg["path"])
+            distance += leg["distance_m"]
+            cost += leg["cost"]
+            hierarchical &= leg["hierarchical"]
+        return {"path": path, "distance_m": round(distance, 1), "cost": round(cost, 1), "hierarchical": hierarchical}
+
+    def route_batch(self, routes: Sequence[Sequence[Sequence[float]]], terrain_type: str = "",
+                    terrain_data: Dict[str, Any] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量计算路线（按空间聚类，每个聚类共用一张代价网格）
+
+        Args:
+            routes: 每条路线的途经点列表 [[lon, lat], ...]（至少两个点）
+        """
+        if len(routes) > MAX_BATCH_ROUTES:
+            raise ValueError(f"路线数 {len(routes)} 超过上限 {MAX_BATCH_ROUTES}")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(routes)
+        if not any(routes):
+            return results
+        for indices in cluster_routes(routes, PATHFINDING_GRID_SIZE * PATHFINDING_MAX_CELL_M):
+            grid = self.cost_grid([p for i in indices for p in routes[i]], terrain_type, terrain_data)
+            for i in indices:
+                results[i] = self.route(grid, routes[i])
+        return results
+
+
+def deduction_routes(deduction: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    推演中全部 path / arrow 动作的途经点，附带所在阶段与动作序号
+
+    Raises:
+        ValueError: steps / actions 结构不正确
+    """
+    steps = deduction.get("steps") or []
+    if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+        raise ValueError("deduction.steps 必须是对象数组")
+    routes = []
+    for step_index, step in enumerate(steps):
+        actions = step.get("actions") or []
+        if not isinstance(actions, list) or not all(isinstance(action, dict) for action in actions):
+            raise ValueError(f"deduction.steps[{step_index}].actions 必须是对象数组")
+        for action_index, action in enumerate(actions):
+            if action.get("type") == "arrow" and action.get("from") and action.get("to"):
+                waypoints = [action["from"], action["to"]]
+            elif action.get("type") == "path" and len(action.get("path") or []) >= 2:
+                waypoints = action["path"]
+            else:
+                continue
+            routes.append({"step": step_index, "action": action_index, "label": action.get("label", ""),
+                           "waypoints": waypoints})
+    return routes
+
+
+_pathfinding_service: Optional[PathfindingService] = None
+_pathfinding_service_lock = threading.Lock()
+
+
+def get_pathfinding_service() -> PathfindingService:
+    """获取寻路服务（进程内单例）"""
+    global _pathfinding_service
+    if _pathfinding_service is None:
+        with _pathfinding_service_lock:
+            if _pathfinding_service is None:
+                _pathfinding_service = PathfindingService()
+    return _pathfinding_service
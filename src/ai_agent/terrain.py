@@ -0,0 +1,400 @@
+# src/ai_agent/terrain.py
+"""
+地形高程与通视分析
+
+- 从本地 DEM 目录读取 SRTM .hgt 瓦片（1°×1°，大端 int16，1201² 或 3601²），以 numpy.memmap 方式映射，
+  只有实际采样到的页面才会被读入内存
+- 按战役范围（参战方位置、时间线地点外扩一定距离）重采样为固定大小的高程网格，
+  网格按 (DEM 版本, 范围, 分辨率) 缓存到 generated_content/cache/terrain，重启后直接加载
+- 在高程网格上做向量化的通视（line of sight）与视域（viewshed）计算，供模拟引擎与 Cesium 视图使用
+
+DEM 目录取 DEM_DIR（默认 knowledge_base/terrain/dem），文件名如 N29E113.hgt。
+范围内没有 DEM 瓦片时返回平坦网格（source 为 flat），通视恒为可见。
+"""
+
+import os
+import math
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.core.cache import stable_hash
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_DEM_DIR = os.path.join(BASE_DIR, "knowledge_base", "terrain", "dem")
+DEFAULT_TERRAIN_CACHE_DIR = os.path.join(BASE_DIR, "generated_content", "cache", "terrain")
+
+METERS_PER_DEGREE = 111320.0
+# SRTM 无数据值
+HGT_VOID = -32768
+# 战役范围外扩距离（米）与默认网格边长（格数）
+BATTLE_MARGIN_M = float(os.getenv("TERRAIN_MARGIN_M", "5000"))
+DEFAULT_GRID_SIZE = int(os.getenv("TERRAIN_GRID_SIZE", "256"))
+MAX_GRID_SIZE = 1024
+# 同时保持映射的 DEM 瓦片数
+MAX_OPEN_TILES = 16
+# 通视计算每批处理的采样点数（控制中间数组的内存占用，float32 下约 1 MB / 数组）
+LOS_CHUNK_SAMPLES = 1 << 18
+# 视域计算的网格长边上限：更大的网格按整数倍抽稀计算，再放大回原尺寸
+VIEWSHED_MAX_GRID_SIZE = 256
+
+
+def hgt_tile_name(lat_floor: int, lon_floor: int) -> str:
+    """SRTM 瓦片文件名（不含扩展名），如 N29E113、S01W072"""
+    return f"{'N' if lat_floor >= 0 else 'S'}{abs(lat_floor):02d}{'E' if lon_floor >= 0 else 'W'}{abs(lon_floor):03d}"
+
+
+class DEMRepository:
+    """本地 SRTM .hgt 瓦片目录（内存映射读取）"""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("DEM_DIR", DEFAULT_DEM_DIR)
+        self._tiles: "OrderedDict[Tuple[int, int], Optional[np.memmap]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tile_path(self, lat_floor: int, lon_floor: int) -> Optional[str]:
+        name = hgt_tile_name(lat_floor, lon_floor)
+        for candidate in (f"{name}.hgt", f"{name}.HGT"):
+            path = os.path.join(self.directory, candidate)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def tile(self, lat_floor: int, lon_floor: int) -> Optional[np.memmap]:
+        """映射一个瓦片；目录中没有该瓦片时返回 None"""
+        key = (lat_floor, lon_floor)
+        with self._lock:
+            if key in self._tiles:
+                self._tiles.move_to_end(key)
+                return self._tiles[key]
+        path = self._tile_path(lat_floor, lon_floor)
+        tile = None
+        if path is not None:
+            size = int(math.isqrt(os.path.getsize(path) // 2))
+            if size * size * 2 != os.path.getsize(path):
+                logger.warning(f"DEM 瓦片尺寸异常，已忽略: {path}")
+            else:
+                tile = np.memmap(path, dtype=">i2", mode="r", shape=(size, size))
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > MAX_OPEN_TILES:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def version(self, lat_range: Iterable[int], lon_range: Iterable[int]) -> str:
+        """范围内瓦片的版本（文件名 + 修改时间），用作高程网格缓存键的一部分"""
+        parts = []
+        for lat_floor in lat_range:
+            for lon_floor in lon_range:
+                path = self._tile_path(lat_floor, lon_floor)
+                if path is not None:
+                    parts.append(f"{os.path.basename(path)}:{os.stat(path).st_mtime_ns}")
+        return stable_hash(*parts) if parts else ""
+
+    def sample(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """
+        双线性插值采样高程（米）；没有瓦片或无数据处为 NaN
+        """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        heights = np.full(lons.shape, np.nan)
+        lat_floor = np.floor(lats).astype(np.int64)
+        lon_floor = np.floor(lons).astype(np.int64)
+        for la, lo in set(zip(lat_floor.ravel().tolist(), lon_floor.ravel().tolist())):
+            tile = self.tile(la, lo)
+            if tile is None:
+                continue
+            mask = (lat_floor == la) & (lon_floor == lo)
+            n = tile.shape[0] - 1
+            # 行 0 为瓦片北边缘，列 0 为西边缘
+            row = (la + 1 - lats[mask]) * n
+            col = (lons[mask] - lo) * n
+            r0 = np.clip(np.floor(row).astype(np.int64), 0, n - 1)
+            c0 = np.clip(np.floor(col).astype(np.int64), 0, n - 1)
+            fr, fc = row - r0, col - c0
+            corners = [tile[r0 + dr, c0 + dc].astype(np.float64) for dr in (0, 1) for dc in (0, 1)]
+            for corner in corners:
+                corner[corner == HGT_VOID] = np.nan
+            top = corners[0] * (1 - fc) + corners[1] * fc
+            bottom = corners[2] * (1 - fc) + corners[3] * fc
+            heights[mask] = top * (1 - fr) + bottom * fr
+        return heights
+
+
+@dataclass
+class ElevationGrid:
+    """规则经纬度网格上的高程（行 0 为北边缘）"""
+    west: float
+    south: float
+    east: float
+    north: float
+    heights: np.ndarray
+    source: str
+    # 缓存键（DEM 版本 + 范围 + 分辨率），由 TerrainService 设置
+    key: str = ""
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.heights.shape
+
+    def cell_centers(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows, cols = self.shape
+        lons = self.west + (np.arange(cols) + 0.5) * (self.east - self.west) / cols
+        lats = self.north - (np.arange(rows) + 0.5) * (self.north - self.south) / rows
+        return np.meshgrid(lons, lats)
+
+    def heights_at(self, lons, lats, dtype=np.float64) -> np.ndarray:
+        """双线性插值查询高程，范围外按边缘取值"""
+        rows, cols = self.shape
+        col = (np.asarray(lons, dtype=dtype) - dtype(self.west)) * dtype(cols / (self.east - self.west)) - dtype(0.5)
+        row = (dtype(self.north) - np.asarray(lats, dtype=dtype)) * dtype(rows / (self.north - self.south)) - dtype(0.5)
+        col = np.clip(col, 0, cols - 1)
+        row = np.clip(row, 0, rows - 1)
+        c0 = np.minimum(np.floor(col).astype(np.int64), max(cols - 2, 0))
+        r0 = np.minimum(np.floor(row).astype(np.int64), max(rows - 2, 0))
+        c1 = np.minimum(c0 + 1, cols - 1)
+        r1 = np.minimum(r0 + 1, rows - 1)
+        fc, fr = col - c0, row - r0
+        h = self.heights
+        top = h[r0, c0] * (1 - fc) + h[r0, c1] * fc
+        bottom = h[r1, c0] * (1 - fc) + h[r1, c1] * fc
+        return top * (1 - fr) + bottom * fr
+
+    def line_of_sight(self, lon_a, lat_a, lon_b, lat_b, height_a: float = 2.0, height_b: float = 2.0,
+                      steps: int = 32) -> np.ndarray:
+        """
+        A、B 两点之间是否通视（向量化，参数可以是等长数组）
+
+        Args:
+            height_a / height_b: 观察者 / 目标离地高度（米）
+            steps: 沿视线的采样点数
+
+        视线按 LOS_CHUNK_SAMPLES 分批以 float32 计算，内存占用与视线条数无关
+        """
+        arrays = np.broadcast_arrays(*(np.atleast_1d(np.asarray(v, dtype=np.float64))
+                                       for v in (lon_a, lat_a, lon_b, lat_b)))
+        shape = arrays[0].shape
+        if self.source == "flat":
+            return np.ones(shape, dtype=bool)
+        lon_a, lat_a, lon_b, lat_b = (a.ravel() for a in arrays)
+        f = np.linspace(0.0, 1.0, steps, dtype=np.float32)[1:-1]
+        eye = self.heights_at(lon_a, lat_a).astype(np.float32) + np.float32(height_a)
+        target = self.heights_at(lon_b, lat_b).astype(np.float32) + np.float32(height_b)
+        visible = np.empty(lon_a.shape, dtype=bool)
+        chunk = max(1, LOS_CHUNK_SAMPLES // max(len(f), 1))
+        for start in range(0, len(lon_a), chunk):
+            part = slice(start, start + chunk)
+            lons = lon_a[part, None].astype(np.float32) + (lon_b[part] - lon_a[part]).astype(np.float32)[:, None] * f
+            lats = lat_a[part, None].astype(np.float32) + (lat_b[part] - lat_a[part]).astype(np.float32)[:, None] * f
+            ground = self.heights_at(lons, lats, dtype=np.float32)
+            sight = eye[part, None] + (target[part] - eye[part])[:, None] * f
+            visible[part] = np.all(ground <= sight + np.float32(0.5), axis=-1)
+        return visible.reshape(shape)
+
+    def viewshed(self, lon: float, lat: float, observer_height: float = 10.0, target_height: float = 2.0,
+                 steps: int = 64) -> np.ndarray:
+        """
+        从观察点可见的网格单元（与 heights 同形状的布尔数组）
+
+        网格长边超过 VIEWSHED_MAX_GRID_SIZE 时按整数倍抽稀计算，每个结果覆盖相邻的若干格
+        """
+        rows, cols = self.shape
+        factor = max(1, math.ceil(max(rows, cols) / VIEWSHED_MAX_GRID_SIZE))
+        lons, lats = self.cell_centers()
+        lons, lats = lons[::factor, ::factor], lats[::factor, ::factor]
+        visible = self.line_of_sight(
+            lon, lat, lons, lats,
+            height_a=observer_height, height_b=target_height, steps=steps
+        )
+        if factor > 1:
+            visible = np.repeat(np.repeat(visible, factor, axis=0), factor, axis=1)[:rows, :cols]
+        return visible
+
+    def summary(self) -> Dict[str, Any]:
+        rows, cols = self.shape
+        width_m = (self.east - self.west) * METERS_PER_DEGREE * math.cos(math.radians((self.north + self.south) / 2))
+        return {
+            "source": self.source,
+            "bbox": [self.west, self.south, self.east, self.north],
+            "width": cols,
+            "height": rows,
+            "cell_size_m": round(width_m / cols, 1),
+            "min": round(float(self.heights.min()), 1),
+            "max": round(float(self.heights.max()), 1),
+            "mean": round(float(self.heights.mean()), 1),
+            "relief": round(float(self.heights.max() - self.heights.min()), 1),
+        }
+
+    def encode(self) -> Dict[str, Any]:
+        """网格概要 + base64 编码的小端 float32 高程（行优先，行 0 为北边缘）"""
+        return {
+            **self.summary(),
+            "dtype": "float32",
+            "byte_order": "little",
+            "data": base64.b64encode(self.heights.astype("<f4").tobytes()).decode("ascii"),
+        }
+
+
+def bbox_around(points: Sequence[Sequence[float]], margin_m: float = BATTLE_MARGIN_M) -> Tuple[float, float, float, float]:
+    """包含全部 (lon, lat) 点并外扩 margin_m 的范围 (west, south, east, north)"""
+    if not points:
+        raise ValueError("没有任何坐标")
+    lons = [float(p[0]) for p in points]
+    lats = [float(p[1]) for p in points]
+    mid_lat = (min(lats) + max(lats)) / 2
+    d_lat = margin_m / METERS_PER_DEGREE
+    d_lon = margin_m / (METERS_PER_DEGREE * max(math.cos(math.radians(mid_lat)), 1e-6))
+    return (min(lons) - d_lon, min(lats) - d_lat, max(lons) + d_lon, max(lats) + d_lat)
+
+
+def battle_bbox(battle_data: Dict[str, Any], margin_m: float = BATTLE_MARGIN_M) -> Tuple[float, float, float, float]:
+    """战役范围：参战方初始位置、时间线地点与战役地点外扩 margin_m"""
+    points: List[Sequence[float]] = []
+    location = battle_data.get("location") or {}
+    if "lon" in location and "lat" in location:
+        points.append((location["lon"], location["lat"]))
+    points.extend(p["position"] for p in key_positions(battle_data))
+    return bbox_around(points, margin_m)
+
+
+class TerrainService:
+    """按范围生成并缓存高程网格"""
+
+    def __init__(self, dem: DEMRepository = None, cache_dir: str = None, max_memory_entries: int = 16):
+        self.dem = dem or DEMRepository()
+        self.cache_dir = cache_dir or os.getenv("TERRAIN_CACHE_DIR", DEFAULT_TERRAIN_CACHE_DIR)
+        self._grids: "OrderedDict[str, ElevationGrid]" = OrderedDict()
+        self._max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+
+    def elevation_grid(self, bbox: Tuple[float, float, float, float], size: int = DEFAULT_GRID_SIZE) -> ElevationGrid:
+        """
+        范围内的高程网格，长边为 size 格
+
+        依次查找内存缓存、磁盘缓存，都没有时从 DEM 重采样
+        """
+        west, south, east, north = bbox
+        size = max(2, min(int(size), MAX_GRID_SIZE))
+        aspect = (east - west) * math.cos(math.radians((north + south) / 2)) / max(north - south, 1e-9)
+        cols, rows = (size, max(2, round(size / aspect))) if aspect >= 1 else (max(2, round(size * aspect)), size)
+        version = self.dem.version(range(math.floor(south), math.floor(north) + 1),
+                                   range(math.floor(west), math.floor(east) + 1))
+        key = stable_hash(version, *(round(v, 6) for v in bbox), rows, cols)
+
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+                return grid
+
+        grid = self._load(key, bbox) if version else None
+        if grid is None:
+            grid = self._build(bbox, rows, cols, has_dem=bool(version))
+            if grid.source != "flat":
+                self._save(key, grid)
+        grid.key = key
+        with self._lock:
+            self._grids[key] = grid
+            while len(self._grids) > self._max_memory_entries:
+                self._grids.popitem(last=False)
+        return grid
+
+    def _build(self, bbox, rows: int, cols: int, has_dem: bool) -> ElevationGrid:
+        west, south, east, north = bbox
+        grid = ElevationGrid(west, south, east, north, np.zeros((rows, cols), dtype=np.float32), "flat")
+        if not has_dem:
+            return grid
+        lons, lats = grid.cell_centers()
+        heights = self.dem.sample(lons, lats)
+        if np.all(np.isnan(heights)):
+            return grid
+        # 无数据与瓦片缺失处用平均高程填充
+        heights = np.where(np.isnan(heights), np.nanmean(heights), heights)
+        return ElevationGrid(west, south, east, north, heights.astype(np.float32), "srtm")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _load(self, key: str, bbox) -> Optional[ElevationGrid]:
+        try:
+            heights = np.load(self._path(key), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return ElevationGrid(*bbox, heights=heights, source="srtm")
+
+    def _save(self, key: str, grid: ElevationGrid):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = self._path(key) + f".{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, grid.heights)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"写入高程网格缓存失败: {e}")
+
+
+@dataclass
+class BattleTerrain:
+    """一场战役的高程网格与关键位置视域"""
+    grid: ElevationGrid
+    key_positions: List[Dict[str, Any]]
+    viewsheds: List[np.ndarray]
+
+    def to_dict(self, include_heights: bool = True) -> Dict[str, Any]:
+        elevation = self.grid.encode() if include_heights else self.grid.summary()
+        positions = []
+        for position, visible in zip(self.key_positions, self.viewsheds):
+            positions.append({
+                **position,
+                "visible_fraction": round(float(visible.mean()), 4),
+                # 视域按行优先打包为位图（np.packbits，高位在前）
+                "viewshed": base64.b64encode(np.packbits(visible).tobytes()).decode("ascii"),
+            })
+        return {"elevation": elevation, "key_positions": positions}
+
+
+def key_positions(battle_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """关键位置：参战方初始位置与时间线事件地点"""
+    positions = []
+    for participant in battle_data.get("participants", []):
+        if participant.get("initial_position"):
+            lon, lat = participant["initial_position"][:2]
+            positions.append({"id": participant["force_id"], "type": "deployment", "position": [lon, lat]})
+    for event in battle_data.get("battle_timeline", []):
+        loc = event.get("location")
+        if isinstance(loc, (list, tuple)) and len(loc) >= 2:
+            positions.append({"id": event.get("event_id", ""), "type": "event", "position": [loc[0], loc[1]]})
+    return positions
+
+
+def build_battle_terrain(battle_data: Dict[str, Any], service: "TerrainService" = None,
+                         size: int = DEFAULT_GRID_SIZE) -> BattleTerrain:
+    """生成战役高程网格，并预先计算关键位置的视域"""
+    service = service or get_terrain_service()
+    grid = service.elevation_grid(battle_bbox(battle_data), size)
+    positions = key_positions(battle_data)
+    for position in positions:
+        position["elevation"] = round(float(grid.heights_at(*position["position"])), 1)
+    viewsheds = [grid.viewshed(*p["position"]) for p in positions]
+    return BattleTerrain(grid=grid, key_positions=positions, viewsheds=viewsheds)
+
+
+_terrain_service: Optional[TerrainService] = None
+_terrain_service_lock = threading.Lock()
+
+
+def get_terrain_service() -> TerrainService:
+    """获取地形服务（进程内单例，DEM 瓦片映射与高程网格在请求间复用）"""
+    global _terrain_service
+    if _terrain_service is None:
+        with _terrain_service_lock:
+            if _terrain_service is None:
+                _terrain_service = TerrainService()
+    return _terrain_service
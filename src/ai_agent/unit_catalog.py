@@ -0,0 +1,232 @@
+# src/ai_agent/unit_catalog.py
+"""
+兵种目录编译器
+从前端的 static/js/unit-system.js 中解析兵种定义，编译为带索引的 Python 兵种目录，
+供服务端模拟与分析使用。编译结果按源文件哈希缓存在磁盘上，源文件不变时直接读取缓存。
+
+构建时预编译:
+    python -m src.ai_agent.unit_catalog
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.cache import atomic_write_json, stable_hash
+from src.core.json_repair import parse_json_lenient
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+UNIT_SYSTEM_JS = os.path.join(BASE_DIR, "static", "js", "unit-system.js")
+DEFAULT_CATALOG_CACHE = os.path.join(BASE_DIR, "generated_content", "cache", "unit_catalog.json")
+
+# 编译格式版本，解析逻辑变化时递增以作废旧缓存
+CATALOG_FORMAT_VERSION = 1
+
+# JS 常量名 -> 历史时期
+PERIOD_CONSTANTS = {
+    "ancientUnits": "ancient",
+    "medievalUnits": "medieval",
+    "modernUnits": "modern",
+}
+EXTRA_CONSTANTS = {
+    "unitEnums": "unit_enums",
+    "battleConfigurations": "battle_configurations",
+}
+
+
+class UnitCatalogError(ValueError):
+    """unit-system.js 无法解析"""
+    pass
+
+
+@dataclass(frozen=True)
+class UnitDefinition:
+    """单个兵种的定义"""
+    unit_id: str
+    period: str
+    category: str
+    name: str
+    era: str
+    speed: float
+    attack_power: float
+    defense_rating: float
+    range: float
+    charge_bonus: float
+    morale: float
+    cost_influence: float
+    formation_compatibility: Tuple[str, ...] = ()
+    special_abilities: Tuple[str, ...] = ()
+    historical_accuracy: str = ""
+    description: str = ""
+    visual_attributes: Dict[str, Any] = field(default_factory=dict, compare=False, hash=False)
+
+    @classmethod
+    def from_js(cls, unit_id: str, period: str, category: str, data: Dict[str, Any]) -> "UnitDefinition":
+        props = data.get("tactical_properties", {})
+        return cls(
+            unit_id=unit_id,
+            period=period,
+            category=category,
+            name=data.get("name", unit_id),
+            era=data.get("period", ""),
+            speed=float(props.get("speed", 0)),
+            attack_power=float(props.get("attack_power", 0)),
+            defense_rating=float(props.get("defense_rating", 0)),
+            range=float(props.get("range", 0)),
+            charge_bonus=float(props.get("charge_bonus", 0)),
+            morale=float(props.get("morale", 0)),
+            cost_influence=float(data.get("cost_influence", 1.0)),
+            formation_compatibility=tuple(data.get("formation_compatibility", [])),
+            special_abilities=tuple(data.get("special_abilities", [])),
+            historical_accuracy=data.get("historical_accuracy", ""),
+            description=data.get("description", ""),
+            visual_attributes=dict(data.get("visual_attributes", {}))
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def extract_js_constants(source: str, names: List[str]) -> Dict[str, Any]:
+    """
+    从 JS 源码中提取 `const NAME = {...};` 形式的对象字面量
+
+    Raises:
+        UnitCatalogError: 常量不存在或对象字面量无法完整解析
+    """
+    constants = {}
+    for name in names:
+        match = re.search(r"\bconst\s+" + re.escape(name) + r"\s*=\s*", source)
+        if match is None:
+            raise UnitCatalogError(f"unit-system.js 中未找到常量 {name}")
+        try:
+            value, fixes = parse_json_lenient(source[match.end():])
+        except ValueError as e:
+            raise UnitCatalogError(f"解析常量 {name} 失败: {e}") from e
+        if "truncated" in fixes or not isinstance(value, dict):
+            raise UnitCatalogError(f"常量 {name} 不是完整的对象字面量")
+        constants[name] = value
+    return constants
+
+
+def compile_unit_catalog(source: str) -> Dict[str, Any]:
+    """把 unit-system.js 源码编译为可 JSON 序列化的兵种目录"""
+    constants = extract_js_constants(source, list(PERIOD_CONSTANTS) + list(EXTRA_CONSTANTS))
+
+    units = []
+    for const_name, period in PERIOD_CONSTANTS.items():
+        for category, category_units in constants[const_name].items():
+            for unit_id, data in category_units.items():
+                units.append(UnitDefinition.from_js(unit_id, period, category, data).to_dict())
+
+    compiled = {"format_version": CATALOG_FORMAT_VERSION, "units": units}
+    for const_name, key in EXTRA_CONSTANTS.items():
+        compiled[key] = constants[const_name]
+    return compiled
+
+
+class UnitCatalog:
+    """带索引的兵种目录"""
+
+    def __init__(self, compiled: Dict[str, Any], source_hash: str = ""):
+        self.source_hash = source_hash
+        self.unit_enums: Dict[str, Any] = compiled.get("unit_enums", {})
+        self.battle_configurations: Dict[str, Any] = compiled.get("battle_configurations", {})
+
+        self.units: List[UnitDefinition] = []
+        self._by_key: Dict[Tuple[str, str], UnitDefinition] = {}
+        self._by_id: Dict[str, UnitDefinition] = {}
+        self._by_period: Dict[str, List[UnitDefinition]] = {}
+        self._by_formation: Dict[str, List[UnitDefinition]] = {}
+
+        for data in compiled.get("units", []):
+            data = dict(data)
+            data["formation_compatibility"] = tuple(data.get("formation_compatibility", ()))
+            data["special_abilities"] = tuple(data.get("special_abilities", ()))
+            unit = UnitDefinition(**data)
+            self.units.append(unit)
+            self._by_key[(unit.period, unit.unit_id)] = unit
+            # 同名兵种以先出现（较早时期）的为准
+            self._by_id.setdefault(unit.unit_id, unit)
+            self._by_period.setdefault(unit.period, []).append(unit)
+            for formation in unit.formation_compatibility:
+                self._by_formation.setdefault(formation, []).append(unit)
+
+    def get(self, unit_id: str, period: Optional[str] = None) -> Optional[UnitDefinition]:
+        """按兵种 ID 查找，可指定历史时期"""
+        if period is not None:
+            unit = self._by_key.get((period, unit_id))
+            if unit is not None:
+                return unit
+        return self._by_id.get(unit_id)
+
+    def units_for_period(self, period: str) -> List[UnitDefinition]:
+        return list(self._by_period.get(period, []))
+
+    def units_for_formation(self, formation: str) -> List[UnitDefinition]:
+        return list(self._by_formation.get(formation, []))
+
+    def period_tree(self, period: str) -> Dict[str, Dict[str, Any]]:
+        """按 {类别: {兵种ID: 定义}} 组织某一时期的兵种，与前端数据结构一致"""
+        tree: Dict[str, Dict[str, Any]] = {}
+        for unit in self._by_period.get(period, []):
+            tree.setdefault(unit.category, {})[unit.unit_id] = unit.to_dict()
+        return tree
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+
+def load_unit_catalog(js_path: str = UNIT_SYSTEM_JS, cache_path: str = None) -> UnitCatalog:
+    """
+    加载兵种目录：源文件哈希与磁盘缓存一致时直接读缓存，否则重新编译并写回缓存
+
+    Raises:
+        OSError: 源文件无法读取
+        UnitCatalogError: 源文件无法解析
+    """
+    cache_path = cache_path or os.getenv("UNIT_CATALOG_CACHE", DEFAULT_CATALOG_CACHE)
+    with open(js_path, "rb") as f:
+        raw = f.read()
+    source_hash = stable_hash(CATALOG_FORMAT_VERSION, raw)
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("source_hash") == source_hash:
+            return UnitCatalog(cached["catalog"], source_hash)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"兵种目录缓存无效，重新编译: {e}")
+
+    compiled = compile_unit_catalog(raw.decode("utf-8"))
+    catalog = UnitCatalog(compiled, source_hash)
+    try:
+        atomic_write_json(cache_path, {"source_hash": source_hash, "catalog": compiled})
+    except OSError as e:
+        logger.warning(f"写入兵种目录缓存失败: {e}")
+    logger.info(f"兵种目录编译完成: {len(catalog)} 个兵种")
+    return catalog
+
+
+def main(argv: List[str] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        catalog = load_unit_catalog()
+    except (OSError, UnitCatalogError) as e:
+        logger.error(f"兵种目录编译失败: {e}")
+        return 1
+    summary = {period: len(catalog.units_for_period(period)) for period in PERIOD_CONSTANTS.values()}
+    print(json.dumps({"source_hash": catalog.source_hash, "units": summary}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,27 @@ import os
 import logging
 import asyncio
 import json
+import time
 from typing import Optional
-from zhipuai import ZhipuAI
 import httpx
+from src.core.cache import get_cache
+from src.core.loop_monitor import run_blocking
+from src.core.metrics import REGISTRY
+from src.core.tracing import current_span, span
 
 logger = logging.getLogger(__name__)
 
+# 提交任务到拿到结果（或放弃）的轮询总耗时，视频生成通常需要数分钟
+VIDEO_POLL_DURATION = REGISTRY.histogram(
+    "video_poll_duration_seconds", "视频生成任务轮询耗时", ("outcome",),
+    buckets=(10, 30, 60, 90, 120, 180, 240, 300, 450, 600)
+)
+
+class VideoTaskFailedError(Exception):
+    """视频任务已终止且没有结果（状态为 FAIL，或成功但没有视频地址），无需继续轮询"""
+    pass
+
+
 class VideoGenerationService:
     """
     视频生成服务 - 使用智谱清影 (CogVideoX-Flash)
@@ -20,7 +35,12 @@ class VideoGenerationService:
             logger.warning("ZHIPUAI_API_KEY environment variable not set. Video generation will fail.")
             self.client = None
         else:
-            self.client = ZhipuAI(api_key=self.api_key)
+            # SDK 导入较慢，只在确实需要时导入
+            from zhipuai import ZhipuAI
+            self.client = ZhipuAI(api_key=self.api_key, base_url=os.getenv("ZHIPUAI_BASE_URL"))
+
+        # 视频生成耗时数分钟，成功结果在所有 worker 间共享
+        self.cache = get_cache("video", ttl=float(os.getenv("VIDEO_CACHE_TTL", "43200")))
 
     async def generate_video_from_text(self, text: str) -> str:
         """
@@ -39,6 +59,11 @@ class VideoGenerationService:
             try:
                 # Construct the prompt
                 prompt = f"史诗般的战争场景，{text[:300]}，电影质感，高清晰度，写实风格"
+
+                cached_url = await self.cache.aget(prompt)
+                if cached_url:
+                    logger.info(f"命中视频缓存: {cached_url}")
+                    return cached_url
                 
                 # 提交视频生成任务
                 def submit_task():
@@ -52,15 +77,26 @@ class VideoGenerationService:
                         logger.error(f"ZhipuAI submission failed: {e}")
                         raise e
 
-                # Run blocking SDK call in thread pool
-                response = await asyncio.to_thread(submit_task)
+                # Run blocking SDK call in thread pool（VIDEO_EXECUTOR_WORKERS 设置时使用专用线程池）
+                with span("video.submit", model="cogvideox-flash"):
+                    response = await run_blocking("video", submit_task)
 
                 # Get task ID (ZhipuAI SDK usually returns an object with 'id')
                 if hasattr(response, 'id'):
                     task_id = response.id
                     logger.info(f"Video generation task submitted. Task ID: {task_id}")
                     # Poll for result
-                    return await self._poll_for_result(task_id)
+                    poll_start = time.perf_counter()
+                    try:
+                        with span("video.poll", task_id=task_id):
+                            video_url = await self._poll_for_result(task_id)
+                    except Exception as e:
+                        outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+                        VIDEO_POLL_DURATION.observe(time.perf_counter() - poll_start, outcome=outcome)
+                        raise
+                    VIDEO_POLL_DURATION.observe(time.perf_counter() - poll_start, outcome="success")
+                    await self.cache.aset(prompt, video_url)
+                    return video_url
                 else:
                     logger.warning(f"Unexpected response structure: {response}")
                     return await self._generate_mock_video(text)
@@ -109,14 +145,20 @@ class VideoGenerationService:
         logger.info(f"视频生成完成: {video_url}")
         return video_url
 
-    async def _poll_for_result(self, task_id: str, max_retries=60, delay=5) -> str:
+    async def _poll_for_result(self, task_id: str, max_retries=60, delay: float = None) -> str:
         """
         轮询任务结果
+
+        Args:
+            delay: 轮询间隔（秒），缺省取 VIDEO_POLL_INTERVAL
         """
+        if delay is None:
+            delay = float(os.getenv("VIDEO_POLL_INTERVAL", "5"))
         for i in range(max_retries):
             try:
                 # 使用 SDK 查询结果
-                response = await asyncio.to_thread(
+                response = await run_blocking(
+                    "video",
                     self.client.videos.retrieve_videos_result,
                     id=task_id
                 )
@@ -126,6 +168,7 @@ class VideoGenerationService:
                 if hasattr(response, 'task_status'):
                     status = response.task_status
                     logger.debug(f"Task {task_id} status: {status}")
+                    current_span().add_event("poll", attempt=i + 1, status=str(status))
 
                     if status == 'SUCCESS':
                         # Get video URL
@@ -135,10 +178,10 @@ class VideoGenerationService:
                             return video_url
                         else:
                             logger.warning(f"Task succeeded but no video result: {response}")
-                            raise Exception("Task succeeded but no video URL found.")
+                            raise VideoTaskFailedError("Task succeeded but no video URL found.")
                     
                     elif status == 'FAIL':
-                        raise Exception(f"Video generation failed. Task ID: {task_id}")
+                        raise VideoTaskFailedError(f"Video generation failed. Task ID: {task_id}")
                     
                     # If QUEUEING or PROCESSING, wait and retry
                     await asyncio.sleep(delay)
@@ -146,8 +189,21 @@ class VideoGenerationService:
                      logger.warning(f"Response missing task_status: {response}")
                      await asyncio.sleep(delay)
 
+            except VideoTaskFailedError:
+                raise
             except Exception as e:
                 logger.warning(f"Error polling task status (attempt {i+1}/{max_retries}): {e}")
                 await asyncio.sleep(delay)
 
         raise TimeoutError("Video generation timed out.")
+
+
+_video_service: Optional[VideoGenerationService] = None
+
+
+def get_video_service() -> VideoGenerationService:
+    """获取视频生成服务实例（进程内单例，复用 SDK 客户端连接）"""
+    global _video_service
+    if _video_service is None:
+        _video_service = VideoGenerationService()
+    return _video_service
@@ -0,0 +1,85 @@
+# src/api/admin_api.py
+"""
+管理接口：线上诊断用的采样分析、asyncio 任务快照与事件循环 / 线程池状态
+
+只有设置了 ADMIN_TOKEN 时才启用，请求需携带 X-Admin-Token 或 Authorization: Bearer 头；
+未设置时所有接口返回 404，不暴露接口是否存在。
+"""
+
+import os
+import hmac
+import logging
+import threading
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from src.core.loop_monitor import snapshot as runtime_snapshot
+from src.core.profiler import MAX_PROFILE_SECONDS, ProfilerBusyError, dump_asyncio_tasks, run_profile
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None), authorization: Optional[str] = Header(None)):
+    """校验管理令牌（常数时间比较）"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = x_admin_token
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token or not hmac.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS, description="采样时长（秒）"),
+    mode: str = Query("wall", pattern="^(wall|cpu)$", description="wall: 墙钟时间；cpu: 按线程 CPU 时间加权"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="采样间隔（毫秒）"),
+    threads: str = Query("all", pattern="^(all|loop)$", description="all: 所有线程；loop: 仅事件循环线程"),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+):
+    """
+    对当前 worker 进程做限时采样
+
+    Returns:
+        collapsed: flamegraph.pl / speedscope 可直接读取的折叠栈文本
+        json: 采样概要（自耗时排行）与折叠栈
+    """
+    # 处理函数运行在事件循环线程中，loop 模式只采样这个线程
+    thread_ids = [threading.get_ident()] if threads == "loop" else None
+    logger.info(f"开始采样: mode={mode} seconds={seconds} interval_ms={interval_ms} threads={threads}")
+    try:
+        profiler = await run_profile(seconds, mode=mode, interval=interval_ms / 1000, thread_ids=thread_ids)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "json":
+        return {**profiler.summary(), "collapsed": profiler.collapsed()}
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{mode}.collapsed"'},
+    )
+
+
+@router.get("/tasks")
+async def asyncio_tasks(details: bool = Query(False, description="是否逐个列出任务")):
+    """
+    事件循环中所有未完成任务的 await 链，按挂起位置分组（例如大量卡在 _poll_for_result 的视频任务）
+    """
+    dump = dump_asyncio_tasks()
+    if not details:
+        dump.pop("tasks")
+    return {"pid": os.getpid(), **dump}
+
+
+@router.get("/runtime")
+async def runtime():
+    """
+    事件循环延迟与各线程池的排队情况，用于区分瓶颈在事件循环、线程池还是上游
+    """
+    return {"pid": os.getpid(), **runtime_snapshot()}
@@ -1,12 +1,39 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import os
-import json
+import asyncio
+import logging
 from typing import List, Dict, Any
 
+from src.ai_agent.terrain import bbox_around, get_terrain_service
+from src.core.document_store import JSONDocumentStore
+
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 BATTLE_CACHE_DIR = "generated_content/battles"
+# terrain_data.elevation 的网格边长（随战役数据一起缓存，比 /game/battle/{id}/terrain 的网格小）
+BATTLE_ELEVATION_GRID_SIZE = 128
+
+# 战役数据缓存：热点在内存，磁盘读写在线程池中进行，索引避免未命中时访问文件系统
+battle_store = JSONDocumentStore(
+    BATTLE_CACHE_DIR,
+    max_memory_entries=int(os.getenv("BATTLE_CACHE_MEMORY_ENTRIES", "512")),
+    metrics_name="battle_store"
+)
+
+def build_elevation(battle_data: Dict[str, Any]) -> Dict[str, Any]:
+    """按战役地点、部署位置与事件地点的范围生成高程网格（base64 编码的 float32，行 0 为北边缘）"""
+    location = battle_data["battle_metadata"]["location"]
+    points = [(location["lon"], location["lat"])]
+    for force in battle_data.get("military_forces", []):
+        points.extend(force.get("initial_deployment", []))
+    for event in battle_data.get("battle_timeline", []):
+        if isinstance(event.get("location"), dict):
+            points.append((event["location"]["lon"], event["location"]["lat"]))
+    grid = get_terrain_service().elevation_grid(bbox_around(points), BATTLE_ELEVATION_GRID_SIZE)
+    return grid.encode()
+
 
 class BattleResponse(BaseModel):
     battle_metadata: Dict[str, Any]
@@ -17,11 +44,9 @@ class BattleResponse(BaseModel):
 @router.get("/battle/{battle_name}", response_model=BattleResponse)
 async def get_battle_data(battle_name: str):
     normalized_name = battle_name.lower().replace(" ", "_").replace("之战", "")
-    cache_path = os.path.join(BATTLE_CACHE_DIR, f"{normalized_name}.json")
-    
-    if os.path.exists(cache_path):
-        with open(cache_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+    cached = await battle_store.get(normalized_name)
+    if cached is not None:
+        return cached
 
     # 内置示例：赤壁之战
     if "chibi" in normalized_name or "赤壁" in battle_name:
@@ -71,9 +96,12 @@ async def get_battle_data(battle_name: str):
             }
         }
 
-        os.makedirs(BATTLE_CACHE_DIR, exist_ok=True)
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump(sample_data, f, ensure_ascii=False, indent=2)
+        try:
+            sample_data["terrain_data"]["elevation"] = await asyncio.to_thread(build_elevation, sample_data)
+        except Exception as e:
+            logger.warning(f"生成战役高程网格失败: {e}")
+
+        await battle_store.put(normalized_name, sample_data)
 
         return sample_data
 
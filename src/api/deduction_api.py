@@ -4,15 +4,51 @@ Deduction API: Handles the "Battle Deduction" mode.
 Uses LLM to generate structured JSON data for frontend animation.
 """
 
+import os
+import time
+import asyncio
 import logging
 import json
-from fastapi import APIRouter, Request
+from typing import Any, Dict, List
+from fastapi import APIRouter, HTTPException, Request
 from src.ai_agent.model_service import get_model_service
+from src.ai_agent.deduction_library import (
+    DeductionParseError,
+    build_deduction_messages,
+    get_deduction_library,
+    parse_deduction_content,
+    validate_deduction
+)
+from src.ai_agent.geo_validation import validate_coordinates
+from src.ai_agent.pathfinding import deduction_routes, get_pathfinding_service
+from src.core.cache import get_cache
+from src.core.metrics import REGISTRY
+from src.core.spatial_mapper import is_valid_coordinate
+from src.core.tracing import span
+from src.core.wire_format import NegotiatedRoute
 
 # Configure Logger
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/v1/deduction", tags=["deduction"])
+router = APIRouter(prefix="/api/v1/deduction", tags=["deduction"], route_class=NegotiatedRoute)
+
+# 推演结果缓存：同一查询在所有 worker 间只需调用一次 LLM
+deduction_cache = get_cache("deduction", ttl=float(os.getenv("DEDUCTION_CACHE_TTL", "604800")))
+
+# 大模型输出解析结果：ok（直接解析）/ repaired（修复后解析）/ failed（回退到模拟推演）
+DEDUCTION_PARSE = REGISTRY.counter(
+    "deduction_parse_total", "推演输出 JSON 解析次数（失败率 = failed / 总数）", ("outcome",)
+)
+# 坐标校验：按问题类型（swapped / snapped / clamped / flagged）计数，以及每次推演的质量分分布
+DEDUCTION_GEO_FIXES = REGISTRY.counter(
+    "deduction_geo_fixes_total", "推演坐标校验发现的问题数", ("reason",)
+)
+DEDUCTION_GEO_SCORE = REGISTRY.histogram(
+    "deduction_geo_quality_score", "推演坐标质量分（1 为全部有效）",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+)
+# 质量分低于该值的推演只返回不缓存
+GEO_MIN_CACHE_SCORE = float(os.getenv("GEO_MIN_CACHE_SCORE", "0.5"))
 
 @router.post("/simulate")
 async def simulate_battle(request: Request):
@@ -27,79 +63,130 @@ async def simulate_battle(request: Request):
         if not query:
             return {"error": "Please provide a battle name or query."}
 
-        # Construct Prompt for Structured Output
-        system_prompt = (
-            "你是一个专业的军事历史战役推演引擎。"
-            "你的目标是生成一个结构化的JSON序列，用于在3D地图上可视化战役过程。"
-            "输出必须是有效的JSON格式。不要包含markdown格式（如 ```json ... ```）。"
-            "请基于真实的历史史料进行推演，确保地理位置、部队动向和时间节点的准确性。"
-            "【重要】阵营分类规则：\n"
-            "   - 必须将对战双方严格区分为【红方】（Red）和【蓝方】（Blue）。\n"
-            "   - 进攻方、侵略者或北方势力（如曹军、日军、国民党军）通常标记为 'color': 'red'。\n"
-            "   - 防守方、抵抗者或南方势力（如联军、大清、解放军）通常标记为 'color': 'blue'。\n"
-            "   - 第三方或中立势力可以使用 'orange' 或 'green'。\n"
-            "JSON结构如下：\n"
-            "{\n"
-            "  'title': '战役名称',\n"
-            "  'location': [经度, 纬度], // 战役中心点\n"
-            "  'zoom': 11,\n"
-            "  'steps': [\n"
-            "    {\n"
-            "      'time': '阶段 N: [时间/阶段名]',\n"
-            "      'description': '该阶段的详细战况描述(100-200字)，引用历史背景、兵力部署、关键决策和地理环境影响。',\n"
-            "      'actions': [\n"
-            "        {\n"
-            "          'type': 'marker', // 或 'path', 'arrow', 'circle'\n"
-            "          'label': '部队/地点名称',\n"
-            "          'coordinate': [经度, 纬度],\n"
-            "          'color': 'red', // 必须明确指定颜色: red, blue, green, orange\n"
-            "          'radius': 1000 // 仅适用于 circle\n"
-            "        }\n"
-            "      ]\n"
-            "    }\n"
-            "  ]\n"
-            "}"
-            "要求：\n"
-            "1. 生成至少 8-12 个详细步骤，完整覆盖战役的前奏、发展、高潮和结局。\n"
-            "2. 描述要生动、专业，体现军事战略和战术细节。\n"
-            "3. 充分利用地图动作(actions)来展示部队移动(path/arrow)、交战点(marker)和影响范围(circle)。\n"
-        )
+        # 经典战役直接返回离线预生成的推演
+        curated = await asyncio.to_thread(get_deduction_library().lookup, query)
+        if curated is not None:
+            logger.info(f"命中预生成推演库: {query}")
+            return curated
 
-        user_prompt = f"请根据历史史料，详细推演这场战役：{query}。请模拟“正在检索历史数据库”的过程，并在生成的描述中体现史料依据。"
+        cache_key = " ".join(query.split())
+        cached = await deduction_cache.aget(cache_key)
+        if cached is not None:
+            logger.info(f"命中推演缓存: {query}")
+            return cached
 
         logger.info(f"正在进行战役推演: {query}...")
 
         # 获取模型服务 (主备切换)
         model_service = get_model_service()
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        messages = build_deduction_messages(query)
 
         # 调用模型 (增加 max_tokens 以容纳长 JSON)
         content = await model_service.chat_completion(messages, max_tokens=4000)
         
-        # Clean up potential markdown code blocks
-        content = content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        elif content.startswith("```"):
-                content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        
         try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse LLM output as JSON. Output: {content[:100]}...")
-            return get_mock_deduction(query) 
+            with span("deduction.parse", content_length=len(content)) as parse_span:
+                result, fixes = parse_deduction_content(content)
+                parse_span.set_attribute("fixes", ",".join(fixes))
+        except DeductionParseError as e:
+            DEDUCTION_PARSE.inc(outcome="failed")
+            logger.error(f"Failed to parse LLM output as JSON ({e}). Output: {content[:100]}...")
+            return get_mock_deduction(query)
+
+        DEDUCTION_PARSE.inc(outcome="repaired" if fixes else "ok")
+        if fixes:
+            logger.warning(f"推演输出已修复: {', '.join(fixes)}")
+
+        # 坐标校验：就地修正颠倒 / 离群坐标，比重新调用大模型便宜得多
+        with span("deduction.geo_validate") as geo_span:
+            # 首次调用会读取数据文件构建地名表，放到线程池执行
+            geo_report = await asyncio.to_thread(validate_coordinates, result, query)
+            geo_span.set_attribute("score", geo_report["score"])
+        result["geo_validation"] = geo_report
+        DEDUCTION_GEO_SCORE.observe(geo_report["score"])
+        for fix in geo_report["fixes"]:
+            DEDUCTION_GEO_FIXES.inc(reason=fix["reason"])
+        if geo_report["fixes"]:
+            logger.warning(f"推演坐标已校验: 修正 {geo_report['fixed']} 个，标记 {geo_report['flagged']} 个，质量分 {geo_report['score']}")
+
+        # 残缺（如被截断后抢救）或坐标质量过低的结果只返回不缓存，下次请求仍有机会拿到完整推演
+        if ("truncated" not in fixes and geo_report["score"] >= GEO_MIN_CACHE_SCORE
+                and not validate_deduction(result)):
+            await deduction_cache.aset(cache_key, result)
+        return result
 
     except Exception as e:
         logger.exception("Error in deduction simulation")
         # 最后的兜底
         return get_mock_deduction(query)
 
+def _parse_waypoints(route: Any) -> List[List[float]]:
+    """路线请求：{"waypoints": [[lon, lat], ...]} 或 {"from": [lon, lat], "to": [lon, lat]}"""
+    if not isinstance(route, dict):
+        raise ValueError("路线必须是对象")
+    waypoints = route.get("waypoints") or ([route.get("from"), route.get("to")] if "from" in route else route.get("path"))
+    if not isinstance(waypoints, list) or len(waypoints) < 2:
+        raise ValueError("路线至少需要两个途经点")
+    try:
+        points = [[float(p[0]), float(p[1])] for p in waypoints]
+    except (TypeError, ValueError, IndexError, KeyError):
+        raise ValueError("途经点格式应为 [经度, 纬度]")
+    for lon, lat in points:
+        if not is_valid_coordinate(lon, lat):
+            raise ValueError(f"途经点 [{lon}, {lat}] 超出经纬度范围")
+    return points
+
+@router.post("/routes")
+async def compute_routes(request: Request):
+    """
+    批量计算行军路线（绕开陡坡、尽量不涉渡河流、优先走道路），相邻的路线共用一张代价网格
+
+    请求体:
+        routes: [{id, waypoints: [[lon, lat], ...]} 或 {id, from, to}]
+        deduction: 推演结果；给出时计算其中全部 path / arrow 动作的路线（结果带 step / action 序号）
+        terrain_type: 地形类型（plains / river_bank / hill_plains ...），决定基础移动代价
+        terrain_data: {rivers: [{path: [[lon, lat], ...]}], roads: [...]}，格式同 /api/battle/{name}
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="请求体不是合法的 JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="请求体必须是 JSON 对象")
+    try:
+        items = []
+        if isinstance(data.get("deduction"), dict):
+            for item in deduction_routes(data["deduction"]):
+                items.append({**item, "waypoints": _parse_waypoints(item)})
+        if not isinstance(data.get("routes") or [], list):
+            raise ValueError("routes 必须是数组")
+        for i, route in enumerate(data.get("routes") or []):
+            items.append({"id": route.get("id", i) if isinstance(route, dict) else i,
+                          "waypoints": _parse_waypoints(route)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"路线参数无效: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="需要 routes 或 deduction")
+
+    start = time.perf_counter()
+    try:
+        # A* 搜索是 CPU 密集操作，放到线程池执行
+        results = await asyncio.to_thread(
+            get_pathfinding_service().route_batch,
+            [item["waypoints"] for item in items],
+            str(data.get("terrain_type") or ""),
+            data.get("terrain_data") if isinstance(data.get("terrain_data"), dict) else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"路线参数无效: {e}")
+
+    routes: List[Dict[str, Any]] = []
+    for item, result in zip(items, results):
+        # 不可达（如被陡坡完全隔断）时保留原始直线
+        routes.append({**item, "reachable": result is not None, **(result or {"path": item["waypoints"]})})
+    return {"routes": routes, "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)}
+
 def get_mock_deduction(query):
     """
     Returns a detailed mock deduction sequence for demonstration.
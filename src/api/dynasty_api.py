@@ -4,20 +4,20 @@
 """
 
 import logging
+from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException
-import json
-import os
 from typing import List, Dict, Any
 
+from src.ai_agent.knowledge_index import get_dynasty_index, peek_dynasty_index
+from src.core.wire_format import NegotiatedRoute
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 初始化 FastAPI 路由
-router = APIRouter()
+# 初始化 FastAPI 路由（支持按 Accept 返回 MessagePack）
+router = APIRouter(route_class=NegotiatedRoute)
 
-# 数据文件路径
-DYNASTIES_FILE = "knowledge_base/dynasties.json"
-CITY_MAPPINGS_FILE = "knowledge_base/city_mappings.json"
+# 数据文件在启动预热时解析为内存索引（见 src/ai_agent/knowledge_index.py）
 
 @router.get("/dynasty/{dynasty_id}")
 async def get_dynasty_data(dynasty_id: str):
@@ -33,16 +33,12 @@ async def get_dynasty_data(dynasty_id: str):
     try:
         logger.info(f"获取朝代数据: {dynasty_id}")
         
-        # 检查文件是否存在
-        if not os.path.exists(DYNASTIES_FILE):
-            raise HTTPException(status_code=500, detail="朝代数据文件不存在")
-        
-        # 读取朝代数据
-        with open(DYNASTIES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        index = get_dynasty_index()
+        if not index.dynasties_loaded:
+            raise HTTPException(status_code=500, detail="朝代数据文件不存在或格式错误")
         
         # 查找指定朝代
-        dynasty = next((d for d in data["dynasties"] if d["id"] == dynasty_id), None)
+        dynasty = index.get_dynasty(dynasty_id)
         
         if not dynasty:
             raise HTTPException(status_code=404, detail=f"朝代 '{dynasty_id}' 未找到")
@@ -52,10 +48,6 @@ async def get_dynasty_data(dynasty_id: str):
         
     except HTTPException:
         raise
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="朝代数据文件不存在")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="朝代数据文件格式错误")
     except Exception as e:
         logger.error(f"获取朝代数据时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
@@ -71,13 +63,11 @@ async def get_all_dynasties():
     try:
         logger.info("获取所有朝代列表")
         
-        if not os.path.exists(DYNASTIES_FILE):
-            raise HTTPException(status_code=500, detail="朝代数据文件不存在")
-        
-        with open(DYNASTIES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        index = get_dynasty_index()
+        if not index.dynasties_loaded:
+            raise HTTPException(status_code=500, detail="朝代数据文件不存在或格式错误")
         
-        dynasties = data["dynasties"]
+        dynasties = index.all_dynasties()
         logger.info(f"成功获取 {len(dynasties)} 个朝代数据")
         
         return {
@@ -138,15 +128,16 @@ async def get_city_mappings():
     try:
         logger.info("获取城市名称映射")
         
-        if not os.path.exists(CITY_MAPPINGS_FILE):
-            raise HTTPException(status_code=500, detail="城市映射文件不存在")
-        
-        with open(CITY_MAPPINGS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        index = get_dynasty_index()
+        index.refresh_if_changed()
+        if not index.mappings_loaded:
+            raise HTTPException(status_code=500, detail="城市映射文件不存在或格式错误")
         
         logger.info("成功获取城市名称映射")
-        return data
+        return index.mappings
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取城市映射时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
@@ -165,46 +156,12 @@ async def search_historical_city(city_name: str):
     try:
         logger.info(f"搜索历史城市: {city_name}")
         
-        if not os.path.exists(DYNASTIES_FILE):
-            raise HTTPException(status_code=500, detail="朝代数据文件不存在")
-        
-        # 读取朝代数据
-        with open(DYNASTIES_FILE, "r", encoding="utf-8") as f:
-            dynasties_data = json.load(f)
-        
-        results = []
-        search_term = city_name.strip()
-        
-        # 在所有朝代中搜索城市
-        for dynasty in dynasties_data["dynasties"]:
-            for city in dynasty.get("majorCities", []):
-                # 模糊匹配逻辑
-                is_match = (
-                    search_term.lower() in city["name"].lower() or
-                    city["name"].lower() in search_term.lower() or
-                    search_term.lower() in city.get("modernName", "").lower() or
-                    city.get("modernName", "").lower() in search_term.lower()
-                )
-                
-                if is_match:
-                    results.append({
-                        "cityName": city["name"],
-                        "modernName": city["modernName"],
-                        "dynasty": dynasty["name"],
-                        "dynastyId": dynasty["id"],
-                        "position": city["position"],
-                        "type": city["type"],
-                        "importance": city["importance"],
-                        "period": dynasty["period"]
-                    })
+        index = get_dynasty_index()
+        if not index.dynasties_loaded:
+            raise HTTPException(status_code=500, detail="朝代数据文件不存在或格式错误")
         
-        # 去重（按城市名称去重，保留第一个匹配）
-        unique_results = []
-        seen_names = set()
-        for result in results:
-            if result["cityName"] not in seen_names:
-                unique_results.append(result)
-                seen_names.add(result["cityName"])
+        # 在所有朝代中模糊匹配，按城市名称去重（保留第一个匹配）
+        unique_results = index.search_cities(city_name)
         
         logger.info(f"搜索到 {len(unique_results)} 个匹配的城市")
         
@@ -241,8 +198,8 @@ async def get_historical_events(dynasty_id: str):
         # 提取历史事件
         events = dynasty.get("historicalEvents", [])
         
-        # 按时间排序
-        events.sort(key=lambda x: x["year"])
+        # 按时间排序（不修改索引中的原始数据）
+        events = sorted(events, key=lambda x: x["year"])
         
         result = {
             "dynastyId": dynasty_id,
@@ -272,13 +229,12 @@ async def get_dynasty_categories():
     try:
         logger.info("获取朝代分类信息")
         
-        if not os.path.exists(CITY_MAPPINGS_FILE):
-            raise HTTPException(status_code=500, detail="城市映射文件不存在")
-        
-        with open(CITY_MAPPINGS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        index = get_dynasty_index()
+        index.refresh_if_changed()
+        if not index.mappings_loaded:
+            raise HTTPException(status_code=500, detail="城市映射文件不存在或格式错误")
         
-        categories = data.get("dynastyCategories", {})
+        categories = index.mappings.get("dynastyCategories", {})
         
         logger.info(f"成功获取 {len(categories)} 个朝代分类")
         return {
@@ -286,6 +242,8 @@ async def get_dynasty_categories():
             "count": len(categories)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取朝代分类时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
@@ -364,48 +322,28 @@ async def quick_search(query: str):
 @router.get("/health")
 async def health_check():
     """
-    朝代API健康检查
+    朝代API健康检查（只读取内存中的索引状态，不访问数据文件，可用于高频探针）
     
     Returns:
         API状态信息
     """
-    try:
-        # 检查数据文件是否存在
-        dynasties_exists = os.path.exists(DYNASTIES_FILE)
-        mappings_exists = os.path.exists(CITY_MAPPINGS_FILE)
-        
-        # 尝试读取数据
-        dynasty_count = 0
-        city_count = 0
-        
-        if dynasties_exists:
-            with open(DYNASTIES_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                dynasty_count = len(data.get("dynasties", []))
-        
-        if mappings_exists:
-            with open(CITY_MAPPINGS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                city_count = len(data.get("allHistoricalCities", []))
-        
+    timestamp = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+    index = peek_dynasty_index()
+    if index is None:
+        # 索引尚在启动预热中
         return {
-            "status": "healthy",
-            "timestamp": "2025-12-26T06:44:00Z",
-            "data_files": {
-                "dynasties": dynasties_exists,
-                "city_mappings": mappings_exists
-            },
-            "data_counts": {
-                "dynasties": dynasty_count,
-                "historical_cities": city_count
-            },
+            "status": "loading",
+            "timestamp": timestamp,
             "version": "1.0.0"
         }
-        
-    except Exception as e:
-        logger.error(f"健康检查时发生错误: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": "2025-12-26T06:44:00Z"
-        }
\ No newline at end of file
+    
+    stats = index.stats()
+    healthy = stats["data_files"]["dynasties"] and stats["data_files"]["city_mappings"]
+    return {
+        "status": "healthy" if healthy else "unhealthy",
+        "timestamp": timestamp,
+        "data_files": stats["data_files"],
+        "data_counts": stats["data_counts"],
+        "index_loaded_at": datetime.fromtimestamp(stats["loaded_at"], timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        "version": "1.0.0"
+    }
@@ -3,13 +3,30 @@
 游戏化战役API - 专门为《全面战争》风格的战役可视化提供支持
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from typing import Dict, Any, Optional, List
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass, field
+import asyncio
+import base64
+import copy
 import json
 import os
+import threading
+import time
 from pathlib import Path
 import logging
 
+from src.ai_agent.battle_engine import WEATHER_MODIFIERS, SimulationConfig, SimulationResult, simulate_battle
+from src.ai_agent.battle_lod import BattleLOD, LOD_TIERS, MAX_ZOOM, cluster_units, filter_bbox, tier_for_zoom
+from src.ai_agent.battle_sweep import SweepUnavailableError, parse_sweep_parameters, run_sweep
+from src.ai_agent.battle_tracks import DEFAULT_SAMPLES, MAX_SAMPLES, TrackSet, compile_tracks
+from src.ai_agent.formations import FORMATIONS
+from src.ai_agent.terrain import BattleTerrain, build_battle_terrain
+from src.ai_agent.unit_catalog import UnitCatalogError, load_unit_catalog
+from src.core.cache import MemoryLRUCache, stable_hash
+from src.core import wire_format
+from src.core.http_cache import conditional_response, make_etag
+
 router = APIRouter(prefix="/api/v1/game", tags=["game-battle"])
 logger = logging.getLogger(__name__)
 
@@ -18,47 +35,292 @@ BASE_DIR = Path(__file__).parent.parent.parent
 BATTLES_DB_PATH = BASE_DIR / "knowledge_base" / "military_data" / "historical_battles.json"
 UNITS_DB_PATH = BASE_DIR / "static" / "js" / "unit-system.js"
 
+# 检查战役数据文件是否更新的最小间隔（秒）
+DATA_VERSION_CHECK_INTERVAL = 5.0
+# LOD 接口的默认缩放级别（启动预热按此级别预先计算）
+DEFAULT_LOD_ZOOM = 10
+# 单次模拟允许的最长游戏时间（秒）与最多 tick 数
+MAX_SIMULATION_SECONDS = 24 * 3600
+MAX_SIMULATION_TICKS = 20000
+# 战役详情响应的浏览器缓存时间
+BATTLE_VIEW_CACHE_CONTROL = f"public, max-age={os.getenv('BATTLE_VIEW_MAX_AGE', '300')}"
+
+
+@dataclass
+class BattleView:
+    """预计算的战役详情视图（含游戏化派生数据）"""
+    data: Dict[str, Any]
+    body: bytes
+    etag: str
+    # 其他传输格式的响应体，首次请求时生成
+    alt_bodies: Dict[str, bytes] = field(default_factory=dict)
+
+    def encoded(self, fmt: str) -> Tuple[bytes, str]:
+        """按传输格式返回 (响应体, ETag)"""
+        if fmt == "json":
+            return self.body, self.etag
+        body = self.alt_bodies.get(fmt)
+        if body is None:
+            body = wire_format.encode(self.data, fmt)
+            self.alt_bodies[fmt] = body
+        return body, make_etag(self.etag, fmt)
+
+
+@dataclass
+class TrackView:
+    """编译好的回放轨迹及其按输出格式懒序列化的响应体"""
+    tracks: TrackSet
+    etag: str
+    bodies: Dict[str, bytes]
+
+
+@dataclass
+class TerrainView:
+    """战役高程网格、关键位置视域及其懒序列化的响应体"""
+    terrain: BattleTerrain
+    etag: str
+    bodies: Dict[str, bytes]
+
+
 class GameBattleAPI:
     """游戏化战役API服务"""
     
     def __init__(self):
+        self.data_version = ""
+        self._battles_mtime = None
+        self._last_version_check = time.monotonic()
+        self._views: Dict[str, BattleView] = {}
+        self._lods: Dict[str, BattleLOD] = {}
+        self._lod_views: Dict[Tuple[str, int, int], BattleView] = {}
+        self._terrains: Dict[str, TerrainView] = {}
+        # 键中包含数据版本，数据更新后旧条目自然被淘汰
+        self._track_views = MemoryLRUCache(
+            max_entries=int(os.getenv("TRACK_CACHE_ENTRIES", "64")),
+            metrics_name="battle_tracks"
+        )
+        # 模拟结果按 (数据版本, 战役, 场景修改, 模拟参数) 缓存，模拟是确定性的
+        self._simulations = MemoryLRUCache(
+            max_entries=int(os.getenv("SIMULATION_CACHE_ENTRIES", "32")),
+            metrics_name="battle_simulations"
+        )
+        # 参数扫描结果按 (数据版本, 战役, 参数网格, 模拟参数) 缓存
+        self.sweep_results = MemoryLRUCache(
+            max_entries=int(os.getenv("SWEEP_CACHE_ENTRIES", "32")),
+            metrics_name="battle_sweeps"
+        )
         self.battles_data = self._load_battles_data()
         self.units_data = self._load_units_data()
     
     def _load_battles_data(self) -> Dict[str, Any]:
         """加载战役数据"""
         try:
-            with open(BATTLES_DB_PATH, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            self._battles_mtime = BATTLES_DB_PATH.stat().st_mtime_ns
+            raw = BATTLES_DB_PATH.read_bytes()
+            self.data_version = stable_hash(raw)
+            return json.loads(raw)
         except Exception as e:
             logger.error(f"加载战役数据失败: {e}")
             return {"battles": {}}
+
+    def _refresh_if_changed(self):
+        """战役数据文件变化时重新加载并作废所有派生视图"""
+        now = time.monotonic()
+        if now - self._last_version_check < DATA_VERSION_CHECK_INTERVAL:
+            return
+        self._last_version_check = now
+        try:
+            mtime = BATTLES_DB_PATH.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._battles_mtime:
+            logger.info("战役数据已更新，重新加载")
+            self.battles_data = self._load_battles_data()
+            self._views.clear()
+            self._lods.clear()
+            self._lod_views.clear()
+            self._terrains.clear()
+
+    def find_battle(self, battle_id: str) -> Optional[Dict[str, Any]]:
+        """在所有历史时期中查找战役原始数据"""
+        self._refresh_if_changed()
+        for period_battles in self.battles_data.get("battles", {}).values():
+            if battle_id in period_battles:
+                return period_battles[battle_id]
+        return None
+
+    def get_battle_view(self, battle_id: str) -> Optional[BattleView]:
+        """
+        获取战役详情视图，每个数据版本只计算一次
+
+        视图是原始数据的深拷贝，调用方不得修改 view.data
+        """
+        battle_data = self.find_battle(battle_id)
+        if battle_data is None:
+            return None
+
+        view = self._views.get(battle_id)
+        if view is None:
+            data = build_battle_view(battle_data)
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            view = BattleView(data=data, body=body, etag=make_etag(self.data_version, battle_id, body))
+            self._views[battle_id] = view
+        return view
     
+    def get_battle_lod(self, battle_id: str) -> Optional[BattleLOD]:
+        """获取战役的 LOD 数据（团级单位逐帧布局），每个数据版本只计算一次"""
+        battle_data = self.find_battle(battle_id)
+        if battle_data is None:
+            return None
+        lod = self._lods.get(battle_id)
+        if lod is None:
+            lod = BattleLOD(battle_data)
+            self._lods[battle_id] = lod
+        return lod
+
+    def get_lod_view(self, battle_id: str, zoom: int, frame: int) -> BattleView:
+        """获取某一帧在指定缩放级别下的聚合视图（已序列化并带 ETag）"""
+        key = (battle_id, zoom, frame)
+        view = self._lod_views.get(key)
+        if view is None:
+            lod = self._lods[battle_id]
+            tier = tier_for_zoom(zoom)
+            units = lod.aggregate(frame, tier, self.unit_display_name)
+            event = lod.events[frame - 1] if frame > 0 else None
+            data = {
+                "battle_id": battle_id,
+                "zoom": zoom,
+                "tier": tier,
+                "frame": frame,
+                "frame_count": len(lod.frames),
+                "event": {
+                    "event_id": event.get("event_id"),
+                    "timestamp": event.get("timestamp"),
+                    "description": event.get("description")
+                } if event else None,
+                "units": units,
+                "clusters": cluster_units(units, zoom)
+            }
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            view = BattleView(data=data, body=body, etag=make_etag(self.data_version, *key, body))
+            self._lod_views[key] = view
+        return view
+
+    def get_track_view(self, battle_id: str, tier: str, samples: int) -> Optional[TrackView]:
+        """获取战役在某一细节层次下的稠密回放轨迹，按 (数据版本, 战役, 层次, 采样数) 缓存"""
+        lod = self.get_battle_lod(battle_id)
+        if lod is None:
+            return None
+        key = f"{self.data_version}:{battle_id}:{tier}:{samples}"
+        view = self._track_views.get(key)
+        if view is None:
+            tracks = compile_tracks(lod, tier, samples, self.unit_display_name)
+            view = TrackView(tracks=tracks, etag=make_etag(key, tracks.data), bodies={})
+            self._track_views.set(key, view)
+        return view
+
+    def get_terrain_view(self, battle_id: str) -> Optional[TerrainView]:
+        """
+        获取战役范围的高程网格与关键位置视域（首次请求时计算）
+
+        高程网格本身另有按 DEM 版本的磁盘缓存，重启后不需要重新采样 DEM
+        """
+        battle_data = self.find_battle(battle_id)
+        if battle_data is None:
+            return None
+        view = self._terrains.get(battle_id)
+        if view is None:
+            terrain = build_battle_terrain(battle_data)
+            etag = make_etag(self.data_version, battle_id, terrain.grid.source, terrain.grid.heights.tobytes())
+            view = TerrainView(terrain=terrain, etag=etag, bodies={})
+            self._terrains[battle_id] = view
+        return view
+
+    def get_simulation(self, battle_id: str, modifications: Dict[str, Any],
+                       config: SimulationConfig) -> Optional[SimulationResult]:
+        """运行（或从缓存取出）一次战役模拟"""
+        battle_data = self.find_battle(battle_id)
+        if battle_data is None:
+            return None
+        key = stable_hash(self.data_version, battle_id, json.dumps(modifications, sort_keys=True), config)
+        result = self._simulations.get(key)
+        if result is None:
+            scenario = apply_scenario_modifications(battle_data, modifications)
+            result = simulate_battle(scenario, config, unit_stats=self.unit_stats, unit_name=self.unit_display_name,
+                                     elevation=self.get_terrain_view(battle_id).terrain.grid)
+            self._simulations.set(key, result)
+        return result
+
+    def prime_caches(self, limit: int) -> int:
+        """
+        预先计算前 limit 个战役的详情视图、默认缩放级别的初始帧 LOD 视图与默认回放轨迹
+
+        Returns:
+            已预热的战役数量
+        """
+        battle_ids = [
+            battle_id
+            for period_battles in self.battles_data.get("battles", {}).values()
+            for battle_id in period_battles
+        ][:max(limit, 0)]
+        for battle_id in battle_ids:
+            self.get_battle_view(battle_id)
+            self.get_battle_lod(battle_id)
+            self.get_lod_view(battle_id, DEFAULT_LOD_ZOOM, 0)
+            self.get_track_view(battle_id, "corps", DEFAULT_SAMPLES)
+        return len(battle_ids)
+
+    def unit_display_name(self, unit_type: str) -> str:
+        """兵种的显示名称，兵种目录中没有时返回原始类型"""
+        unit = self.unit_catalog.get(unit_type) if self.unit_catalog else None
+        return unit.name if unit else unit_type
+
+    def unit_stats(self, unit_type: str):
+        """兵种目录中的兵种定义（模拟引擎使用），没有时返回 None"""
+        return self.unit_catalog.get(unit_type) if self.unit_catalog else None
+
+    def unit_table(self) -> Dict[str, Any]:
+        """兵种类型 -> 兵种定义（传给参数扫描的工作进程）"""
+        if not self.unit_catalog:
+            return {}
+        return {
+            unit.unit_id: unit
+            for period in ("ancient", "medieval", "modern")
+            for unit in self.unit_catalog.units_for_period(period)
+        }
+
     def _load_units_data(self) -> Dict[str, Any]:
-        """加载兵种数据"""
+        """加载兵种数据（由 unit-system.js 编译的兵种目录）"""
         try:
-            # 从JavaScript文件中提取数据
-            with open(UNITS_DB_PATH, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # 简单的数据提取，实际应用中可以使用更复杂的方法
-                return {
-                    "ancient_units": {},
-                    "medieval_units": {},
-                    "modern_units": {},
-                    "unit_enums": {}
-                }
-        except Exception as e:
+            self.unit_catalog = load_unit_catalog(str(UNITS_DB_PATH))
+        except (OSError, UnitCatalogError) as e:
             logger.error(f"加载兵种数据失败: {e}")
+            self.unit_catalog = None
             return {}
 
-game_api = GameBattleAPI()
+        catalog = self.unit_catalog
+        units_data = {f"{period}_units": catalog.period_tree(period) for period in ("ancient", "medieval", "modern")}
+        units_data["unit_enums"] = catalog.unit_enums
+        units_data["battle_configurations"] = catalog.battle_configurations
+        return units_data
+
+_game_api: Optional[GameBattleAPI] = None
+_game_api_lock = threading.Lock()
+
+def get_game_api() -> GameBattleAPI:
+    """获取游戏化战役API服务（首次调用时加载战役数据与兵种目录，通常由启动后的后台预热完成）"""
+    global _game_api
+    if _game_api is None:
+        with _game_api_lock:
+            if _game_api is None:
+                _game_api = GameBattleAPI()
+    return _game_api
 
 @router.get("/battles")
 async def get_available_battles():
     """获取所有可用战役"""
     try:
         battles = []
-        for period, period_battles in game_api.battles_data.get("battles", {}).items():
+        for period, period_battles in get_game_api().battles_data.get("battles", {}).items():
             for battle_id, battle_info in period_battles.items():
                 battles.append({
                     "battle_id": battle_id,
@@ -74,23 +336,37 @@ async def get_available_battles():
         logger.error(f"获取战役列表失败: {e}")
         raise HTTPException(status_code=500, detail="获取战役列表失败")
 
+def build_battle_view(battle_data: Dict[str, Any]) -> Dict[str, Any]:
+    """构建战役详情视图：原始数据 + 游戏化派生数据"""
+    view = copy.deepcopy(battle_data)
+    view["game_info"] = get_game_info(battle_data)
+    view["unit_info"] = get_unit_info_for_battle(battle_data)
+    view["tactical_analysis"] = get_tactical_analysis(battle_data)
+    return view
+
+def get_battle_view_data(battle_id: str) -> Dict[str, Any]:
+    """获取战役详情视图数据（只读），不存在时抛出 404"""
+    view = get_game_api().get_battle_view(battle_id)
+    if view is None:
+        raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+    return view.data
+
 @router.get("/battle/{battle_id}")
-async def get_battle_details(battle_id: str):
-    """获取特定战役的详细信息"""
+async def get_battle_details(battle_id: str, request: Request):
+    """获取特定战役的详细信息（支持 ETag / 304）"""
     try:
-        # 在所有历史时期中搜索战役
-        for period, period_battles in game_api.battles_data.get("battles", {}).items():
-            if battle_id in period_battles:
-                battle_data = period_battles[battle_id]
-                
-                # 添加游戏化数据
-                battle_data["game_info"] = get_game_info(battle_data)
-                battle_data["unit_info"] = get_unit_info_for_battle(battle_data)
-                battle_data["tactical_analysis"] = get_tactical_analysis(battle_data)
-                
-                return battle_data
-        
-        raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+        view = get_game_api().get_battle_view(battle_id)
+        if view is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+
+        fmt = wire_format.negotiate_format(request)
+        body, etag = view.encoded(fmt)
+        return conditional_response(
+            request, body, etag,
+            media_type=wire_format.media_type_for(fmt),
+            cache_control=BATTLE_VIEW_CACHE_CONTROL,
+            extra_headers={"Vary": "Accept"}
+        )
         
     except HTTPException:
         raise
@@ -98,6 +374,168 @@ async def get_battle_details(battle_id: str):
         logger.error(f"获取战役详情失败: {e}")
         raise HTTPException(status_code=500, detail="获取战役详情失败")
 
+@router.get("/battle/{battle_id}/lod")
+async def get_battle_lod(
+    battle_id: str,
+    request: Request,
+    zoom: int = Query(DEFAULT_LOD_ZOOM, ge=0, le=MAX_ZOOM, description="地图缩放级别，决定返回 army / corps / regiment 层次"),
+    event: Optional[str] = Query(None, description="时间线事件 ID 或帧序号，缺省为初始部署"),
+    bbox: Optional[str] = Query(None, description="可视范围 west,south,east,north")
+):
+    """获取按缩放级别聚合的部队位置与兵力团块（大规模军队渲染用）"""
+    try:
+        lod = get_game_api().get_battle_lod(battle_id)
+        if lod is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+        frame = lod.frame_index(event)
+        if frame is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 中不存在事件 {event}")
+
+        view = get_game_api().get_lod_view(battle_id, zoom, frame)
+        if bbox is None:
+            return conditional_response(request, view.body, view.etag, cache_control=BATTLE_VIEW_CACHE_CONTROL)
+
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(","))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="bbox 格式应为 west,south,east,north")
+        bounds = (west, south, east, north)
+        data = dict(view.data)
+        data["units"] = filter_bbox(view.data["units"], bounds)
+        data["clusters"] = filter_bbox(view.data["clusters"], bounds)
+        return data
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取战役LOD数据失败: {e}")
+        raise HTTPException(status_code=500, detail="获取战役LOD数据失败")
+
+@router.get("/battle/{battle_id}/tracks")
+async def get_battle_tracks(
+    battle_id: str,
+    request: Request,
+    tier: str = Query("corps", description="细节层次: army / corps / regiment"),
+    samples: int = Query(DEFAULT_SAMPLES, ge=1, le=MAX_SAMPLES, description="固定时间步长的采样点数"),
+    format: str = Query("base64", description="base64（JSON 内嵌）/ binary（application/octet-stream）/ meta（仅元数据）")
+):
+    """获取战役时间线编译出的稠密回放轨迹（float32 打包，回放时按时间直接索引）"""
+    try:
+        if tier not in LOD_TIERS:
+            raise HTTPException(status_code=400, detail=f"不支持的细节层次: {tier}")
+        if format not in ("base64", "binary", "meta"):
+            raise HTTPException(status_code=400, detail=f"不支持的输出格式: {format}")
+
+        # 首次编译是 CPU 密集操作，放到线程池执行
+        view = await asyncio.to_thread(get_game_api().get_track_view, battle_id, tier, samples)
+        if view is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+
+        tracks = view.tracks
+        etag = make_etag(view.etag, format)
+        if format == "binary":
+            shape = tracks.metadata()["shape"]
+            return conditional_response(
+                request, tracks.data, etag,
+                media_type="application/octet-stream",
+                cache_control=BATTLE_VIEW_CACHE_CONTROL,
+                extra_headers={
+                    "X-Track-Shape": ",".join(str(n) for n in shape),
+                    "X-Track-Origin": ",".join(str(v) for v in tracks.origin),
+                    "X-Track-Time-Step": str(tracks.time_step_seconds)
+                }
+            )
+
+        body = view.bodies.get(format)
+        if body is None:
+            data = {"battle_id": battle_id, "tier": tier, **tracks.metadata()}
+            if format == "base64":
+                data["data"] = base64.b64encode(tracks.data).decode("ascii")
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            view.bodies[format] = body
+        return conditional_response(request, body, etag, cache_control=BATTLE_VIEW_CACHE_CONTROL)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取战役回放轨迹失败: {e}")
+        raise HTTPException(status_code=500, detail="获取战役回放轨迹失败")
+
+@router.get("/battle/{battle_id}/terrain")
+async def get_battle_terrain(
+    battle_id: str,
+    request: Request,
+    heights: bool = Query(True, description="是否返回 base64 编码的 float32 高程数据")
+):
+    """
+    获取战役范围的高程网格与关键位置（部署位置、事件地点）的预计算视域
+
+    elevation.data 为小端 float32，行优先、行 0 为北边缘；key_positions[].viewshed 为同形状的
+    np.packbits 位图（高位在前），1 表示从该位置可见
+    """
+    try:
+        view = await asyncio.to_thread(get_game_api().get_terrain_view, battle_id)
+        if view is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+
+        fmt = "full" if heights else "meta"
+        body = view.bodies.get(fmt)
+        if body is None:
+            data = {"battle_id": battle_id, **view.terrain.to_dict(include_heights=heights)}
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            view.bodies[fmt] = body
+        return conditional_response(request, body, make_etag(view.etag, fmt), cache_control=BATTLE_VIEW_CACHE_CONTROL)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取战役地形失败: {e}")
+        raise HTTPException(status_code=500, detail="获取战役地形失败")
+
+@router.get("/battle/{battle_id}/los")
+async def get_line_of_sight(
+    battle_id: str,
+    from_: str = Query(..., alias="from", description="观察点 lon,lat"),
+    to: str = Query(..., description="目标点 lon,lat；多个目标用 ; 分隔"),
+    observer_height: float = Query(2.0, ge=0, le=500, description="观察者离地高度（米）"),
+    target_height: float = Query(2.0, ge=0, le=500, description="目标离地高度（米）")
+):
+    """查询观察点到一个或多个目标点是否通视（在战役高程网格上计算）"""
+    try:
+        try:
+            origin = [float(v) for v in from_.split(",")]
+            targets = [[float(v) for v in item.split(",")] for item in to.split(";") if item.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="坐标格式应为 lon,lat")
+        if len(origin) != 2 or not targets or any(len(t) != 2 for t in targets) or len(targets) > 1000:
+            raise HTTPException(status_code=400, detail="坐标格式应为 lon,lat（目标最多 1000 个）")
+
+        view = await asyncio.to_thread(get_game_api().get_terrain_view, battle_id)
+        if view is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+
+        grid = view.terrain.grid
+        lons = [t[0] for t in targets]
+        lats = [t[1] for t in targets]
+        visible = grid.line_of_sight(origin[0], origin[1], lons, lats,
+                                     height_a=observer_height, height_b=target_height)
+        elevations = grid.heights_at(lons, lats)
+        return {
+            "battle_id": battle_id,
+            "source": grid.source,
+            "from": {"position": origin, "elevation": round(float(grid.heights_at(*origin)), 1)},
+            "targets": [
+                {"position": t, "elevation": round(float(h), 1), "visible": bool(v)}
+                for t, h, v in zip(targets, elevations, visible)
+            ]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"通视查询失败: {e}")
+        raise HTTPException(status_code=500, detail="通视查询失败")
+
 @router.get("/units/{period}")
 async def get_units_by_period(period: str):
     """根据历史时期获取兵种信息"""
@@ -107,7 +545,7 @@ async def get_units_by_period(period: str):
             raise HTTPException(status_code=400, detail=f"不支持的历史时期: {period}")
         
         units_key = f"{period}_units"
-        return game_api.units_data.get(units_key, {})
+        return get_game_api().units_data.get(units_key, {})
         
     except HTTPException:
         raise
@@ -119,7 +557,7 @@ async def get_units_by_period(period: str):
 async def analyze_battle_tactics(battle_id: str, analysis_request: Dict[str, Any]):
     """分析战役战术"""
     try:
-        battle_data = await get_battle_details(battle_id)
+        battle_data = get_battle_view_data(battle_id)
         
         analysis_type = analysis_request.get("type", "general")
         focus_areas = analysis_request.get("focus_areas", [])
@@ -129,10 +567,13 @@ async def analyze_battle_tactics(battle_id: str, analysis_request: Dict[str, Any
         elif analysis_type == "formation":
             return analyze_formations(battle_data)
         elif analysis_type == "terrain":
-            return analyze_terrain_advantage(battle_data)
+            view = await asyncio.to_thread(get_game_api().get_terrain_view, battle_id)
+            return analyze_terrain_advantage(battle_data, view.terrain)
         else:
             return analyze_general_tactics(battle_data)
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"战术分析失败: {e}")
         raise HTTPException(status_code=500, detail="战术分析失败")
@@ -141,85 +582,13 @@ async def analyze_battle_tactics(battle_id: str, analysis_request: Dict[str, Any
 async def get_formation_animation(formation_name: str, battle_id: str):
     """获取队形动画数据"""
     try:
-        battle_data = await get_battle_details(battle_id)
-        
-        formations = {
-            "phalanx": {
-                "description": "希腊方阵 - 密集的重装步兵队形",
-                "animation_data": {
-                    "setup_time": 30,
-                    "movement_speed": 2,
-                    "combat_bonus": {"defense": 3, "melee": 2},
-                    "terrain_requirements": ["flat", "open"]
-                },
-                "visual_effects": [
-                    "shield_wall_formation",
-                    "spear_pikes_display",
-                    "coordinated_movement"
-                ]
-            },
-            "shield_wall": {
-                "description": "盾牌墙 - 防御性密集队形",
-                "animation_data": {
-                    "setup_time": 20,
-                    "movement_speed": 1,
-                    "combat_bonus": {"defense": 5, "ranged": 2},
-                    "terrain_requirements": ["defensive_position"]
-                },
-                "visual_effects": [
-                    "shield_formation",
-                    "defensive_posture",
-                    "counter_attack_ready"
-                ]
-            },
-            "cavalry_wedge": {
-                "description": "骑兵楔形阵 - 突击队形",
-                "animation_data": {
-                    "setup_time": 15,
-                    "movement_speed": 8,
-                    "combat_bonus": {"charge": 8, "speed": 5},
-                    "terrain_requirements": ["open", "flat"]
-                },
-                "visual_effects": [
-                    "charging_movement",
-                    "dust_cloud",
-                    "lance_charge"
-                ]
-            },
-            "linear_formation": {
-                "description": "线列阵 - 拿破仑时代的标准阵型",
-                "animation_data": {
-                    "setup_time": 25,
-                    "movement_speed": 3,
-                    "combat_bonus": {"volley_fire": 4, "discipline": 3},
-                    "terrain_requirements": ["open"]
-                },
-                "visual_effects": [
-                    "drill_movement",
-                    "volley_fire",
-                    "bayonet_charge"
-                ]
-            },
-            "volley": {
-                "description": "齐射 - 弓箭手或火枪兵的攻击",
-                "animation_data": {
-                    "setup_time": 10,
-                    "movement_speed": 2,
-                    "combat_bonus": {"ranged": 6, "area_damage": 3},
-                    "terrain_requirements": ["elevated", "clear_los"]
-                },
-                "visual_effects": [
-                    "projectile_rain",
-                    "reload_animation",
-                    "aim_adjustment"
-                ]
-            }
-        }
+        battle_data = get_battle_view_data(battle_id)
         
-        if formation_name not in formations:
+        if formation_name not in FORMATIONS:
             raise HTTPException(status_code=404, detail=f"队形 {formation_name} 不存在")
         
-        formation_data = formations[formation_name]
+        # FORMATIONS 与模拟引擎共用，返回副本
+        formation_data = copy.deepcopy(FORMATIONS[formation_name])
         formation_data["battle_context"] = {
             "battle_name": battle_data["name"],
             "period": battle_data["historical_period"],
@@ -238,7 +607,7 @@ async def get_formation_animation(formation_name: str, battle_id: str):
 async def get_battle_effects(battle_id: str):
     """获取战役特效配置"""
     try:
-        battle_data = await get_battle_details(battle_id)
+        battle_data = get_battle_view_data(battle_id)
         
         effects_config = {
             "particle_effects": get_particle_effects_config(battle_data),
@@ -255,9 +624,17 @@ async def get_battle_effects(battle_id: str):
 
 @router.post("/battle/{battle_id}/simulate")
 async def simulate_battle_scenario(battle_id: str, scenario_request: Dict[str, Any]):
-    """模拟战役场景"""
+    """
+    模拟战役场景
+
+    请求体:
+        type: 场景类型
+        modifications: 场景修改（unit_modifications / morale_changes / weather_changes）
+        engine: 模拟参数 {time_step, max_duration, samples, seed, weather}
+        replay: 是否返回回放轨迹（base64 编码的 float32 数据，格式同 /tracks），默认 true
+    """
     try:
-        battle_data = await get_battle_details(battle_id)
+        battle_data = get_battle_view_data(battle_id)
         
         scenario_type = scenario_request.get("type", "default")
         modifications = scenario_request.get("modifications", {})
@@ -267,13 +644,63 @@ async def simulate_battle_scenario(battle_id: str, scenario_request: Dict[str, A
         
         # 生成模拟结果
         simulation_result = generate_battle_simulation(modified_battle, scenario_type)
+
+        # 逐 tick 模拟是 CPU 密集操作，放到线程池执行
+        config = parse_simulation_config(scenario_request.get("engine") or {})
+        result = await asyncio.to_thread(get_game_api().get_simulation, battle_id, modifications, config)
+        simulation_result["simulation"] = result.summary()
+        if scenario_request.get("replay", True):
+            simulation_result["replay"] = {
+                **result.tracks.metadata(),
+                "data": base64.b64encode(result.tracks.data).decode("ascii")
+            }
         
         return simulation_result
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"模拟参数无效: {e}")
     except Exception as e:
         logger.error(f"战役模拟失败: {e}")
         raise HTTPException(status_code=500, detail="战役模拟失败")
 
+@router.post("/battle/{battle_id}/sweep")
+async def sweep_battle_parameters(battle_id: str, sweep_request: Dict[str, Any]):
+    """
+    参数扫描：对一到两个参数的取值网格并行运行模拟，返回热力图矩阵
+
+    请求体:
+        parameters: [{name: composition / morale / weather, force_id, unit_type, values 或 range{start, stop, steps}}]
+        engine: 模拟参数 {time_step, max_duration, seed}
+    """
+    try:
+        api = get_game_api()
+        battle_data = api.find_battle(battle_id)
+        if battle_data is None:
+            raise HTTPException(status_code=404, detail=f"战役 {battle_id} 不存在")
+
+        parameters = parse_sweep_parameters(sweep_request.get("parameters") or [], battle_data)
+        config = parse_simulation_config(sweep_request.get("engine") or {})
+        key = stable_hash(api.data_version, battle_id, [p.label() for p in parameters], config)
+        result = api.sweep_results.get(key)
+        if result is None:
+            view = await asyncio.to_thread(api.get_terrain_view, battle_id)
+            result = await run_sweep(battle_data, parameters, config, api.unit_table(), view.terrain.grid)
+            api.sweep_results.set(key, result)
+        return {"battle_id": battle_id, **result}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"扫描参数无效: {e}")
+    except SweepUnavailableError as e:
+        logger.error(f"参数扫描不可用: {e}")
+        raise HTTPException(status_code=503, detail="参数扫描暂时不可用，请缩小网格后重试")
+    except Exception as e:
+        logger.error(f"参数扫描失败: {e}")
+        raise HTTPException(status_code=500, detail="参数扫描失败")
+
 # 辅助函数
 
 def get_game_info(battle_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -412,13 +839,26 @@ def analyze_formations(battle_data: Dict[str, Any]) -> Dict[str, Any]:
         "recommended_formations": ["default_analysis"]
     }
 
-def analyze_terrain_advantage(battle_data: Dict[str, Any]) -> Dict[str, Any]:
-    """分析地形优势"""
-    return {
+def analyze_terrain_advantage(battle_data: Dict[str, Any], terrain: Optional[BattleTerrain] = None) -> Dict[str, Any]:
+    """分析地形优势；提供高程网格时按各参战方部署位置的高程与视域评估"""
+    result = {
         "terrain_type": battle_data.get("location", {}).get("terrain_type"),
         "terrain_impact": analyze_terrain_impact(battle_data),
         "advantage_distribution": "待评估"
     }
+    if terrain is None:
+        return result
+
+    result["elevation"] = terrain.grid.summary()
+    deployments = {
+        p["id"]: {"elevation": p["elevation"], "visible_fraction": round(float(visible.mean()), 4)}
+        for p, visible in zip(terrain.key_positions, terrain.viewsheds)
+        if p["type"] == "deployment"
+    }
+    if deployments and terrain.grid.source != "flat":
+        result["advantage_distribution"] = deployments
+        result["high_ground"] = max(deployments, key=lambda fid: deployments[fid]["elevation"])
+    return result
 
 def analyze_general_tactics(battle_data: Dict[str, Any]) -> Dict[str, Any]:
     """通用战术分析"""
@@ -499,7 +939,8 @@ def get_visual_effects_config(battle_data: Dict[str, Any]) -> Dict[str, Any]:
 
 def apply_scenario_modifications(battle_data: Dict[str, Any], modifications: Dict[str, Any]) -> Dict[str, Any]:
     """应用场景修改"""
-    modified_battle = battle_data.copy()
+    # 深拷贝：battle_data 是共享的只读视图
+    modified_battle = copy.deepcopy(battle_data)
     
     # 应用兵力修改
     if "unit_modifications" in modifications:
@@ -508,6 +949,16 @@ def apply_scenario_modifications(battle_data: Dict[str, Any], modifications: Dic
                 if participant["force_id"] == force_id:
                     for unit_type, count in changes.items():
                         participant["composition"][unit_type] = count
+                        # 同名兵种编成一并修改，模拟引擎按 unit_types 部署
+                        for unit in participant.get("unit_types", []):
+                            if unit.get("type") == unit_type:
+                                unit["count"] = count
+    
+    # 应用士气修改
+    if "morale_changes" in modifications:
+        for participant in modified_battle["participants"]:
+            if participant["force_id"] in modifications["morale_changes"]:
+                participant["morale"] = modifications["morale_changes"][participant["force_id"]]
     
     # 应用天气修改
     if "weather_changes" in modifications:
@@ -517,6 +968,27 @@ def apply_scenario_modifications(battle_data: Dict[str, Any], modifications: Dic
     
     return modified_battle
 
+def parse_simulation_config(engine: Dict[str, Any]) -> SimulationConfig:
+    """解析请求中的模拟参数，超出范围时抛出 ValueError"""
+    config = SimulationConfig(
+        time_step=float(engine.get("time_step", SimulationConfig.time_step)),
+        max_duration=float(engine.get("max_duration", SimulationConfig.max_duration)),
+        samples=int(engine.get("samples", DEFAULT_SAMPLES)),
+        seed=int(engine.get("seed", 0)),
+        weather=engine.get("weather")
+    )
+    if not 0.5 <= config.time_step <= 60:
+        raise ValueError("time_step 应在 0.5 ~ 60 秒之间")
+    if not 0 < config.max_duration <= MAX_SIMULATION_SECONDS:
+        raise ValueError(f"max_duration 应在 0 ~ {MAX_SIMULATION_SECONDS} 秒之间")
+    if config.max_duration / config.time_step > MAX_SIMULATION_TICKS:
+        raise ValueError(f"max_duration / time_step 不能超过 {MAX_SIMULATION_TICKS} 个 tick")
+    if not 1 <= config.samples <= MAX_SAMPLES:
+        raise ValueError(f"samples 应在 1 ~ {MAX_SAMPLES} 之间")
+    if config.weather is not None and (not isinstance(config.weather, str) or config.weather not in WEATHER_MODIFIERS):
+        raise ValueError(f"未知天气: {config.weather}（可选 {', '.join(WEATHER_MODIFIERS)}）")
+    return config
+
 def generate_battle_simulation(battle_data: Dict[str, Any], scenario_type: str) -> Dict[str, Any]:
     """生成战役模拟结果"""
     # 简化的模拟逻辑
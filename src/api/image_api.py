@@ -3,10 +3,13 @@
 图像生成 HTTP API 接口
 """
 
+import logging
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from src.ai_agent.image_generation_service import ImageGenerationService
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Image Generation API")
 service = ImageGenerationService()  # 全局实例
 
@@ -3,9 +3,11 @@
 LLM API 模块：提供统一的军事历史分析接口（支持主备模型切换）
 """
 
+import os
 import logging
 from fastapi import FastAPI, Request
 from src.ai_agent.model_service import get_model_service
+from src.core.cache import get_cache
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -13,6 +15,9 @@ logger = logging.getLogger(__name__)
 # 初始化 FastAPI 子应用
 app = FastAPI(title="LLM Military Analysis API")
 
+# 分析结果缓存（相同问题直接复用回答）
+analysis_cache = get_cache("analysis", ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "86400")))
+
 @app.post("/military-analysis")
 async def military_analysis(request: Request):
     """
@@ -27,6 +32,11 @@ async def military_analysis(request: Request):
         if not prompt:
             return {"response": "请输入您的军事历史问题。"}
 
+        cached = await analysis_cache.aget(prompt)
+        if cached is not None:
+            logger.info("命中分析缓存")
+            return {"response": cached}
+
         logger.info(f"正在进行军事分析: {prompt[:50]}...")
 
         # 获取模型服务（已配置为主备切换）
@@ -43,6 +53,8 @@ async def military_analysis(request: Request):
         # 调用模型
         content = await model_service.chat_completion(messages)
         
+        await analysis_cache.aset(prompt, content)
+
         logger.info("分析完成")
         return {"response": content}
 
@@ -9,12 +9,17 @@ import asyncio
 from src.ai_agent.model_service import get_model_service
 from src.ai_agent.military_knowledge_base import MilitaryKnowledgeBase
 from src.api.image_api import ImageGenerationService
-from src.ai_agent.video_generation_service import VideoGenerationService
+from src.ai_agent.video_generation_service import get_video_service
+from src.core.cache import get_cache
+from src.core.tracing import span
 
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="多模态军事AI API")
 
+# 推演步骤 -> 优化后的视频提示词；同样的步骤得到同样的提示词，视频缓存才能命中
+video_prompt_cache = get_cache("video_prompts", ttl=43200)
+
 async def get_battle_map_data(query: str) -> Dict[str, Any]:
     """
     获取战役地图数据
@@ -76,10 +81,15 @@ async def generate_video(request: VideoGenerationRequest):
     try:
         # 获取模型服务和视频生成服务实例
         model_service = get_model_service()
-        video_service = VideoGenerationService()
+        video_service = get_video_service()
         
         # Prompt optimization using LLM
-        if request.steps:
+        steps_key = json.dumps(request.steps, ensure_ascii=False, sort_keys=True) if request.steps else None
+        cached_prompt = await video_prompt_cache.aget(steps_key) if steps_key else None
+
+        if cached_prompt:
+            video_input_text = cached_prompt
+        elif request.steps:
             try:
                 # Construct context from deduction steps
                 steps_text = "\n".join([f"Step {i+1}: {step.get('description', '')}" for i, step in enumerate(request.steps)])
@@ -113,11 +123,13 @@ async def generate_video(request: VideoGenerationRequest):
                 {actions_text}
                 """
                 
-                optimized_prompt = await model_service.generate_text(llm_prompt)
+                with span("video.prompt_optimization", steps=len(request.steps)):
+                    optimized_prompt = await model_service.generate_text(llm_prompt)
                 # Remove quotes if present
                 optimized_prompt = optimized_prompt.strip('"').strip("'")
                 logger.info(f"Optimized Video Prompt: {optimized_prompt}")
                 video_input_text = optimized_prompt
+                await video_prompt_cache.aset(steps_key, optimized_prompt)
             except Exception as e:
                 logger.warning(f"Video prompt optimization failed: {e}. Falling back to raw text.")
                 # Fallback to a simple combination if LLM fails
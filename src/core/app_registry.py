@@ -0,0 +1,150 @@
+# src/core/app_registry.py
+"""
+应用启动注册表
+
+- 子应用（大模型 / 图像 / 多模态）以 LazyASGIApp 挂载，首次请求或后台预热时才导入模块
+- 路由模块在启动时导入（模块本身不做重活），导入失败只记录不影响其他模块
+- 重量级数据集与 SDK 在服务开始接收请求后由后台任务预热
+- 记录每一步耗时，生成启动报告；预热完成前就绪探针返回未就绪
+"""
+
+import time
+import asyncio
+import logging
+import importlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """启动耗时报告"""
+
+    def __init__(self, started_at: float = None):
+        # 传入进程入口处记录的时间，计入 FastAPI 等依赖的导入耗时
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.steps: List[Dict[str, Any]] = []
+        self.ready_after: Optional[float] = None
+        self.warmup_after: Optional[float] = None
+        self.pending: List[str] = []
+
+    def record(self, phase: str, name: str, seconds: float, status: str = "ok", detail: str = None):
+        step = {"phase": phase, "name": name, "ms": round(seconds * 1000, 1), "status": status}
+        if detail:
+            step["detail"] = detail
+        self.steps.append(step)
+
+    def mark_ready(self):
+        """服务开始接收请求"""
+        self.ready_after = time.perf_counter() - self.started_at
+        logger.info(f"服务就绪，启动耗时 {self.ready_after * 1000:.0f} ms")
+        for step in self.steps:
+            logger.info(f"  [{step['phase']}] {step['name']}: {step['ms']} ms ({step['status']})")
+
+    def mark_warm(self):
+        """后台预热完成"""
+        self.warmup_after = time.perf_counter() - self.started_at
+        logger.info(f"后台预热完成，距进程启动 {self.warmup_after * 1000:.0f} ms")
+
+    @property
+    def warm(self) -> bool:
+        return self.warmup_after is not None
+
+    def readiness(self) -> Dict[str, Any]:
+        """就绪状态（只读取内存中的记录，供探针高频调用）"""
+        return {
+            "ready": self.warm,
+            "pending": list(self.pending),
+            "failed": [step["name"] for step in self.steps if step["phase"] == "warmup" and step["status"] != "ok"]
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ready_ms": round(self.ready_after * 1000, 1) if self.ready_after is not None else None,
+            "warm_ms": round(self.warmup_after * 1000, 1) if self.warmup_after is not None else None,
+            "pending": list(self.pending),
+            "steps": self.steps
+        }
+
+
+class LazyASGIApp:
+    """首次使用时才导入的 ASGI 子应用"""
+
+    def __init__(self, module: str, attr: str = "app", report: StartupReport = None):
+        self.module = module
+        self.attr = attr
+        self.report = report
+        self._app = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    @property
+    def routes(self) -> List:
+        """已加载子应用的路由表（未加载时为空，不触发导入）"""
+        return getattr(self._app, "routes", []) if self._app is not None else []
+
+    async def load(self):
+        if self._app is not None:
+            return self._app
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._app is None:
+                start = time.perf_counter()
+                # 导入 SDK 可能耗时数百毫秒，放到线程中执行，不阻塞事件循环
+                module = await asyncio.to_thread(importlib.import_module, self.module)
+                self._app = getattr(module, self.attr)
+                if self.report is not None:
+                    self.report.record("lazy", self.module, time.perf_counter() - start)
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        app = await self.load()
+        await app(scope, receive, send)
+
+
+def include_routers(app, specs: Sequence[Tuple[str, Optional[str]]], report: StartupReport):
+    """
+    导入并注册路由模块
+
+    Args:
+        specs: [(模块路径, 路由前缀或 None)]，模块需导出 router
+    """
+    for module_name, prefix in specs:
+        start = time.perf_counter()
+        try:
+            module = importlib.import_module(module_name)
+            if prefix:
+                app.include_router(module.router, prefix=prefix)
+            else:
+                app.include_router(module.router)
+            report.record("router", module_name, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"路由模块 {module_name} 加载失败: {e}")
+            report.record("router", module_name, time.perf_counter() - start, status="failed", detail=str(e))
+
+
+WarmupTask = Tuple[str, Callable[[], Union[Any, Awaitable[Any]]]]
+
+
+async def run_warmup(tasks: Sequence[WarmupTask], report: StartupReport):
+    """
+    依次执行预热任务；同步函数在线程池中执行。单个任务失败不影响其他任务
+    """
+    report.pending = [name for name, _ in tasks]
+    for name, func in tasks:
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func()
+            else:
+                await asyncio.to_thread(func)
+            report.record("warmup", name, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"预热任务 {name} 失败: {e}")
+            report.record("warmup", name, time.perf_counter() - start, status="failed", detail=str(e))
+        report.pending.remove(name)
+    report.mark_warm()
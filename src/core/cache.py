@@ -0,0 +1,426 @@
+# src/core/cache.py
+"""
+缓存基础设施：稳定内容哈希与可插拔的缓存后端
+
+- MemoryLRUCache: 进程内 LRU（最快，但每个 worker 各有一份）
+- SQLiteCache / RedisCache / DiskCache: 同一主机上多个 worker 共享
+- TieredCache: 进程内 LRU + 共享层，命中共享层时回填本地
+
+业务代码统一通过 get_cache(namespace) 获取缓存实例。
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.core.metrics import record_cache_lookup
+from src.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def stable_hash(*parts: Any, digest_size: int = 16) -> str:
+    """
+    计算内容的 BLAKE2b 哈希（十六进制）
+
+    与内置 hash() 不同，结果不受 PYTHONHASHSEED 影响，
+    在不同进程、不同 worker 以及重启之间保持一致。
+    """
+    hasher = hashlib.blake2b(digest_size=digest_size)
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        # 分隔符避免 ("ab", "c") 与 ("a", "bc") 冲突
+        hasher.update(b"\x1f")
+    return hasher.hexdigest()
+
+
+def stable_bucket(text: str, buckets: int = 1000) -> int:
+    """把文本稳定地映射到 [0, buckets) 区间"""
+    return int(stable_hash(text, digest_size=8), 16) % buckets
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """
+    原子写入文件：先写临时文件再 rename，
+    并发读取方只会看到旧文件或完整的新文件
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: str, data: Any):
+    """原子写入 JSON 文件"""
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+class CacheBackend(ABC):
+    """缓存后端抽象基类，值必须可 JSON 序列化"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期返回 None"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存，ttl 为 None 时使用实例默认过期时间"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """删除缓存"""
+        pass
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """异步读取：阻塞型后端在线程池中执行，避免阻塞事件循环"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        """异步写入"""
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+
+class MemoryLRUCache(CacheBackend):
+    """进程内 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None, metrics_name: Optional[str] = None):
+        """
+        Args:
+            metrics_name: 指定时在 cache_requests_total 中按该名称记录命中 / 未命中
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.metrics_name = metrics_name
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # 可能同时被事件循环与线程池访问
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._get(key)
+        if self.metrics_name is not None:
+            record_cache_lookup(self.metrics_name, value is not None)
+        return value
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.set(key, value, ttl)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    SQLite (WAL 模式) 共享缓存
+    多个 uvicorn worker 打开同一个数据库文件，读操作互不阻塞
+    """
+
+    # 每写入多少次顺带清理一次过期条目
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str, namespace: str, ttl: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程各自持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, stable_hash(key))
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取 SQLite 缓存失败: {e}")
+            return None
+
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, stable_hash(key), json.dumps(value, ensure_ascii=False), time.time() + ttl if ttl else None)
+            )
+            if random.randrange(self.PURGE_EVERY) == 0:
+                conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"写入 SQLite 缓存失败: {e}")
+
+    def delete(self, key: str):
+        try:
+            self._connect().execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, stable_hash(key))
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"删除 SQLite 缓存失败: {e}")
+
+
+class RedisCache(CacheBackend):
+    """Redis 共享缓存（需要安装 redis 包）"""
+
+    def __init__(self, url: str, namespace: str, ttl: Optional[float] = None):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"mrzhuge:{self.namespace}:{stable_hash(key)}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning(f"读取 Redis 缓存失败: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            self.client.set(
+                self._key(key),
+                json.dumps(value, ensure_ascii=False),
+                ex=int(ttl) if ttl else None
+            )
+        except Exception as e:
+            logger.warning(f"写入 Redis 缓存失败: {e}")
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.warning(f"删除 Redis 缓存失败: {e}")
+
+
+class TieredCache(CacheBackend):
+    """
+    两级缓存：进程内 LRU 在前，共享层在后
+    共享层命中后回填本地层，写入时两层同时写
+    """
+
+    def __init__(self, local: MemoryLRUCache, shared: CacheBackend, metrics_name: Optional[str] = None):
+        """
+        Args:
+            metrics_name: 指定时按该名称记录命中率（本地层与共享层分别计入 cache 与 cache:shared）
+        """
+        self.local = local
+        self.shared = shared
+        self.metrics_name = metrics_name
+
+    def _record(self, local_value: Any, value: Any, lookup_span):
+        lookup_span.set_attribute("hit", "local" if local_value is not None else ("shared" if value is not None else "miss"))
+        if self.metrics_name is None:
+            return
+        record_cache_lookup(self.metrics_name, value is not None)
+        if local_value is None:
+            record_cache_lookup(f"{self.metrics_name}:shared", value is not None)
+
+    def get(self, key: str) -> Optional[Any]:
+        with span("cache.get", cache=self.metrics_name) as lookup_span:
+            value = local_value = self.local.get(key)
+            if value is None:
+                value = self.shared.get(key)
+                if value is not None:
+                    self.local.set(key, value)
+            self._record(local_value, value, lookup_span)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        self.shared.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        with span("cache.get", cache=self.metrics_name) as lookup_span:
+            value = local_value = self.local.get(key)
+            if value is None:
+                value = await self.shared.aget(key)
+                if value is not None:
+                    self.local.set(key, value)
+            self._record(local_value, value, lookup_span)
+            return value
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        await self.shared.aset(key, value, ttl)
+
+
+class DiskCache(CacheBackend):
+    """
+    文件型持久缓存
+    每个键一个 JSON 文件（按哈希前缀分目录），写入为原子操作，
+    因此可以安全地被同一主机上的多个 uvicorn worker 共享。
+    """
+
+    def __init__(self, directory: str, ttl: Optional[float] = None):
+        """
+        Args:
+            directory: 缓存目录
+            ttl: 过期时间（秒），None 表示永不过期
+        """
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        digest = stable_hash(key)
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取缓存失败 {path}: {e}")
+            return None
+
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        entry = {
+            "key": key,
+            "value": value,
+            "expires_at": time.time() + ttl if ttl else None
+        }
+        try:
+            atomic_write_json(self._path(key), entry)
+        except OSError as e:
+            logger.warning(f"写入缓存失败: {e}")
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除缓存失败: {e}")
+
+
+_caches: Dict[str, CacheBackend] = {}
+_caches_lock = threading.Lock()
+
+
+def _create_shared_backend(namespace: str, ttl: Optional[float]) -> Optional[CacheBackend]:
+    backend = os.getenv("CACHE_BACKEND", "sqlite").lower()
+    cache_dir = os.getenv("CACHE_DIR", "generated_content/cache")
+
+    if backend == "redis":
+        try:
+            return RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379"), namespace, ttl)
+        except ImportError:
+            logger.warning("未安装 redis 包，共享缓存回退到 SQLite")
+            backend = "sqlite"
+    if backend == "sqlite":
+        path = os.getenv("CACHE_SQLITE_PATH", os.path.join(cache_dir, "shared.sqlite3"))
+        return SQLiteCache(path, namespace, ttl)
+    if backend == "disk":
+        return DiskCache(os.path.join(cache_dir, namespace), ttl)
+    if backend != "memory":
+        logger.warning(f"未知的缓存后端: {backend}，仅使用进程内缓存")
+    return None
+
+
+def get_cache(namespace: str, ttl: Optional[float] = None, local_max_entries: int = 256) -> CacheBackend:
+    """
+    获取指定命名空间的缓存实例（进程内单例）
+
+    通过 CACHE_BACKEND 选择共享层：sqlite（默认）/ redis / disk / memory（仅进程内）
+
+    Args:
+        namespace: 缓存命名空间，如 "deduction"、"images"
+        ttl: 默认过期时间（秒）
+        local_max_entries: 进程内 LRU 层的最大条目数
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            shared = _create_shared_backend(namespace, ttl)
+            if shared is not None:
+                local = MemoryLRUCache(max_entries=local_max_entries, ttl=ttl)
+                cache = TieredCache(local, shared, metrics_name=namespace)
+            else:
+                cache = MemoryLRUCache(max_entries=local_max_entries, ttl=ttl, metrics_name=namespace)
+            _caches[namespace] = cache
+        return cache
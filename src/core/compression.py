@@ -0,0 +1,196 @@
+# src/core/compression.py
+"""
+响应压缩中间件（纯 ASGI 实现）
+
+按 Accept-Encoding 选择 brotli（需安装 brotli 包）或 gzip，压缩 JSON / MessagePack / 文本类响应。
+- 小于 minimum_size 的单块响应不压缩
+- 已带 Content-Encoding 的响应（如预压缩的静态文件）、304/206 响应、SSE 流不做处理
+- 压缩后强 ETag 改为弱 ETag，并追加 Vary: Accept-Encoding
+"""
+
+import os
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/x-msgpack",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    encodings = {}
+    for item in header.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        encodings[parts[0].lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, available: Sequence[str] = None) -> Optional[str]:
+    """
+    根据 Accept-Encoding 选择压缩算法，优先 brotli
+
+    Args:
+        available: 可用的编码；缺省为本进程能在线压缩的编码
+    """
+    if not accept_encoding:
+        return None
+    if available is None:
+        available = ("br", "gzip") if brotli is not None else ("gzip",)
+    encodings = _accepted_encodings(accept_encoding)
+    wildcard = encodings.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding in available and encodings.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._obj.process
+            self._flush = self._obj.finish
+        else:
+            # wbits=31: 带 gzip 头的 deflate 流
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._obj.compress
+            self._flush = self._obj.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._flush()
+
+
+class CompressionMiddleware:
+    """gzip / brotli 响应压缩中间件"""
+
+    def __init__(self, app, minimum_size: int = None, gzip_level: int = None, brotli_quality: int = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        self.gzip_level = gzip_level if gzip_level is not None else int(os.getenv("GZIP_LEVEL", "6"))
+        # 在线压缩使用中等质量，兼顾压缩率与 CPU 开销
+        self.brotli_quality = brotli_quality if brotli_quality is not None else int(os.getenv("BROTLI_QUALITY", "4"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, config: CompressionMiddleware):
+        self._send = send
+        self.encoding = encoding
+        self.config = config
+        self.start_message: Optional[dict] = None
+        # None: 尚未决定；True: 压缩；False: 原样透传
+        self.active: Optional[bool] = None
+        self.compressor: Optional[_Compressor] = None
+
+    def _should_compress(self, headers: List) -> bool:
+        status = self.start_message["status"]
+        if status < 200 or status in (204, 206, 304):
+            return False
+        content_type = ""
+        for name, value in headers:
+            if name in (b"content-encoding", b"content-range"):
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        if content_type.startswith("text/event-stream"):
+            return False
+        return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            if not self._should_compress(message.get("headers", [])):
+                self.active = False
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.active is False:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            if not more_body and len(body) < self.config.minimum_size:
+                self.active = False
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            self.active = True
+            self.compressor = _Compressor(self.encoding, self.config.gzip_level, self.config.brotli_quality)
+            if not more_body:
+                compressed = self.compressor.compress(body) + self.compressor.finish()
+                await self._send(self._compressed_start(len(compressed)))
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self._compressed_start(None))
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        if chunk or not more_body:
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def _compressed_start(self, content_length: Optional[int]) -> dict:
+        headers = []
+        vary = []
+        for name, value in self.start_message.get("headers", []):
+            if name == b"content-length":
+                continue
+            if name == b"etag" and not value.startswith(b"W/"):
+                # 压缩后的表示与原始字节不同，只能作为弱校验器
+                value = b"W/" + value
+            if name == b"vary":
+                vary.append(value)
+                continue
+            headers.append((name, value))
+        if not any(b"accept-encoding" in v.lower() for v in vary):
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        message = dict(self.start_message)
+        message["headers"] = headers
+        return message
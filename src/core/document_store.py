@@ -0,0 +1,203 @@
+# src/core/document_store.py
+"""
+基于目录的 JSON 文档存储
+
+- 热点文档保存在进程内 LRU 中，命中时不访问文件系统
+- 目录下的 .index.json 记录所有已存在的文档，不存在的文档直接判定未命中，无需 stat
+- 读写都在线程池中执行，不阻塞事件循环
+- 文档与索引均以临时文件 + rename 原子写入
+- 多个 worker 共用同一目录时，按间隔检查索引文件是否被其他进程更新；
+  写入索引时持有目录下 .index.lock 的文件锁，重新读取磁盘上的索引合并后再写，避免互相覆盖条目
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只保证单进程内的写入顺序
+    fcntl = None
+
+from src.core.cache import MemoryLRUCache, atomic_write_bytes, stable_hash
+from src.core.metrics import record_cache_lookup
+from src.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".index.json"
+INDEX_LOCK_NAME = ".index.lock"
+INDEX_VERSION = 1
+# 可以直接作为文件名的文档名，其余名称使用哈希作为文件名
+_SAFE_NAME_RE = re.compile(r"^[\w\-]{1,100}$")
+
+
+class JSONDocumentStore:
+    """带内存缓存与索引的 JSON 文档目录"""
+
+    def __init__(self, directory: str, max_memory_entries: int = 512, index_check_interval: float = 5.0,
+                 metrics_name: Optional[str] = None):
+        """
+        Args:
+            metrics_name: 指定时在 cache_requests_total 中记录命中率（内存层另计为 <名称>:memory）
+        """
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.lock_path = os.path.join(directory, INDEX_LOCK_NAME)
+        self.metrics_name = metrics_name
+        self.memory = MemoryLRUCache(
+            max_entries=max_memory_entries,
+            metrics_name=f"{metrics_name}:memory" if metrics_name else None
+        )
+        self.index_check_interval = index_check_interval
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._index_mtime: Optional[int] = None
+        self._last_index_check = 0.0
+        self._write_lock = asyncio.Lock()
+
+    @staticmethod
+    def filename_for(name: str) -> str:
+        """文档名对应的文件名（防止路径穿越）"""
+        if _SAFE_NAME_RE.match(name):
+            return f"{name}.json"
+        return f"{stable_hash(name)}.json"
+
+    def _scan_directory(self) -> Dict[str, Dict[str, Any]]:
+        """索引缺失或损坏时扫描目录重建（兼容没有索引的旧缓存目录）"""
+        documents = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return documents
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            name = entry.name[:-len(".json")]
+            documents[name] = {"file": entry.name, "size": entry.stat().st_size}
+        return documents
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            stat = os.stat(self.index_path)
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self._index_mtime = stat.st_mtime_ns
+                return data.get("documents", {})
+            logger.warning(f"文档索引版本不匹配，重新扫描: {self.directory}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"文档索引损坏，重新扫描: {e}")
+
+        documents = self._scan_directory()
+        if documents:
+            self._write_index(documents)
+        return documents
+
+    def _write_index(self, documents: Dict[str, Dict[str, Any]]):
+        payload = {"version": INDEX_VERSION, "documents": documents}
+        atomic_write_bytes(self.index_path, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        try:
+            self._index_mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            self._index_mtime = None
+
+    @contextmanager
+    def _index_file_lock(self):
+        """跨进程的索引写锁（阻塞等待）"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _index_changed_on_disk(self) -> bool:
+        try:
+            return os.stat(self.index_path).st_mtime_ns != self._index_mtime
+        except FileNotFoundError:
+            return False
+
+    async def _ensure_index(self, recheck: bool = False) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = await asyncio.to_thread(self._read_index)
+            self._last_index_check = time.monotonic()
+        elif recheck and time.monotonic() - self._last_index_check >= self.index_check_interval:
+            # 未命中时才检查其他 worker 是否写入了新文档，且有最小间隔
+            self._last_index_check = time.monotonic()
+            if await asyncio.to_thread(self._index_changed_on_disk):
+                self._index = await asyncio.to_thread(self._read_index)
+        return self._index
+
+    def _read_document(self, filename: str) -> Optional[Any]:
+        try:
+            with open(os.path.join(self.directory, filename), "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    async def get(self, name: str) -> Optional[Any]:
+        """读取文档，不存在时返回 None"""
+        cached = self.memory.get(name)
+        if cached is not None:
+            self._record(True)
+            return cached
+
+        with span("document_store.get", store=self.metrics_name or self.directory) as load_span:
+            document = await self._load(name)
+            load_span.set_attribute("hit", document is not None)
+        self._record(document is not None)
+        return document
+
+    def _record(self, hit: bool):
+        if self.metrics_name is not None:
+            record_cache_lookup(self.metrics_name, hit)
+
+    async def _load(self, name: str) -> Optional[Any]:
+        index = await self._ensure_index()
+        entry = index.get(name)
+        if entry is None:
+            index = await self._ensure_index(recheck=True)
+            entry = index.get(name)
+            if entry is None:
+                return None
+
+        try:
+            document = await asyncio.to_thread(self._read_document, entry["file"])
+        except (OSError, ValueError) as e:
+            logger.error(f"读取文档失败 {name}: {e}")
+            return None
+        if document is None:
+            # 文件已被外部删除
+            index.pop(name, None)
+            return None
+        self.memory.set(name, document)
+        return document
+
+    async def put(self, name: str, document: Any):
+        """写入文档并更新索引"""
+        filename = self.filename_for(name)
+        body = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        async with self._write_lock:
+            def write():
+                atomic_write_bytes(os.path.join(self.directory, filename), body)
+                # 持锁期间重新读取磁盘上的索引，合并其他 worker 写入的条目后再落盘
+                with self._index_file_lock():
+                    documents = self._read_index()
+                    documents[name] = {"file": filename, "size": len(body), "updated_at": time.time()}
+                    self._write_index(documents)
+                return documents
+
+            self._index = await asyncio.to_thread(write)
+        self.memory.set(name, document)
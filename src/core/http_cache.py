@@ -0,0 +1,50 @@
+# src/core/http_cache.py
+"""
+HTTP 条件请求工具：ETag / If-None-Match / Cache-Control
+"""
+
+from typing import Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+from src.core.cache import stable_hash
+
+
+def make_etag(*parts) -> str:
+    """根据内容生成强 ETag"""
+    return f'"{stable_hash(*parts)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否与 ETag 匹配（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def conditional_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    media_type: str = "application/json",
+    cache_control: str = "public, max-age=300",
+    extra_headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    返回预序列化的响应体；客户端缓存仍然有效时返回 304
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if extra_headers:
+        headers.update(extra_headers)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
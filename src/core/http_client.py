@@ -0,0 +1,51 @@
+# src/core/http_client.py
+"""
+进程级共享 HTTP 连接池
+
+对上游模型服务的请求复用同一个 httpx.AsyncClient，保持 keep-alive 连接，
+避免每次调用都重新建立 TCP / TLS 连接。连接池在应用启动时打开、关闭时释放。
+"""
+
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_http_client():
+    """
+    获取共享的 httpx.AsyncClient（不存在或已关闭时创建）
+
+    Returns:
+        httpx.AsyncClient
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+        )
+        _client = httpx.AsyncClient(timeout=60.0, limits=limits)
+        logger.info(f"HTTP 连接池已创建: max_connections={limits.max_connections}")
+    return _client
+
+
+def http_client_open() -> bool:
+    """连接池是否已打开（不触发创建）"""
+    return _client is not None and not _client.is_closed
+
+
+async def close_http_client():
+    """关闭共享连接池"""
+    global _client
+    client: Optional[object] = _client
+    _client = None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        logger.info("HTTP 连接池已关闭")
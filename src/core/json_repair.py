@@ -0,0 +1,362 @@
+# src/core/json_repair.py
+"""
+宽松 JSON 提取与修复
+用于解析大模型输出（以及 JS 对象字面量）中的 JSON 对象。
+
+单次线性扫描，同时完成：
+- 跳过对象前后的说明文字、markdown 代码块标记
+- 单引号字符串转双引号
+- 删除 // 与 /* */ 注释
+- 删除尾随逗号
+- 为未加引号的键名补引号，True/False/None/undefined 转为 JSON 字面量
+- 输出被截断时，回退到最后一个完整的值并补齐括号
+
+说明文字中也可能出现括号（如 "以下是推演 [JSON格式]：{...}"），
+iter_json_values 依次尝试各个候选起点，由调用方决定哪个值符合预期结构。
+"""
+
+import json
+import logging
+from typing import Any, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null",
+    "undefined": "null", "NaN": "null", "Infinity": "null",
+}
+_CLOSERS = {"{": "}", "[": "]"}
+# iter_json_values 最多尝试的起点数
+MAX_START_CANDIDATES = 8
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def _hex4(text: str, pos: int) -> Optional[int]:
+    digits = text[pos:pos + 4]
+    if len(digits) != 4 or any(c not in "0123456789abcdefABCDEF" for c in digits):
+        return None
+    return int(digits, 16)
+
+
+def _unicode_escape(text: str, pos: int) -> Optional[Tuple[str, int]]:
+    """
+    解码 pos 处的 \\uXXXX 转义，返回 (字符, 消耗的字符数)；不是合法转义时返回 None
+
+    高代理项后紧跟低代理项转义（如 \\uD83D\\uDE00）时合并为一个字符；
+    孤立的代理项无法编码为 UTF-8，替换为 U+FFFD
+    """
+    code = _hex4(text, pos + 2)
+    if code is None:
+        return None
+    if 0xD800 <= code <= 0xDBFF:
+        low = _hex4(text, pos + 8) if text.startswith("\\u", pos + 6) else None
+        if low is not None and 0xDC00 <= low <= 0xDFFF:
+            return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+        return "\ufffd", 6
+    if 0xDC00 <= code <= 0xDFFF:
+        return "\ufffd", 6
+    return chr(code), 6
+
+
+class JSONRepairError(ValueError):
+    """无法从文本中提取出 JSON 值"""
+    pass
+
+
+class _Frame:
+    __slots__ = ("opener", "expect")
+
+    def __init__(self, opener: str):
+        self.opener = opener
+        # 对象内: key -> colon -> value -> comma；数组内: value -> comma
+        self.expect = "key" if opener == "{" else "value"
+
+
+class _Repairer:
+    """逐字符扫描并输出规范化的 JSON 文本"""
+
+    def __init__(self, text: str, start: int):
+        self.text = text
+        self.pos = start
+        self.out: List[str] = []
+        self.stack: List[_Frame] = []
+        self.fixes: List[str] = []
+        # 最后一个可以安全截断并补齐括号的位置: (输出长度, 当时的括号栈)
+        self.safe_point: Optional[Tuple[int, List[str]]] = None
+
+    def _note(self, fix: str):
+        if fix not in self.fixes:
+            self.fixes.append(fix)
+
+    def _skip_space_and_comments(self):
+        text = self.text
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch in " \t\r\n":
+                self.pos += 1
+            elif text.startswith("//", self.pos):
+                end = text.find("\n", self.pos)
+                self.pos = len(text) if end == -1 else end + 1
+                self._note("removed_comments")
+            elif text.startswith("/*", self.pos):
+                end = text.find("*/", self.pos + 2)
+                self.pos = len(text) if end == -1 else end + 2
+                self._note("removed_comments")
+            else:
+                break
+
+    def _value_done(self):
+        if self.stack:
+            self.stack[-1].expect = "comma"
+            self.safe_point = (len(self.out), [f.opener for f in self.stack])
+
+    def _read_string(self) -> Optional[str]:
+        """读取一个字符串（单/双引号），返回 JSON 编码后的文本；未闭合返回 None"""
+        text = self.text
+        quote = text[self.pos]
+        if quote == "'":
+            self._note("single_quotes")
+        chars = []
+        i = self.pos + 1
+        while i < len(text):
+            ch = text[i]
+            if ch == "\\" and i + 1 < len(text):
+                nxt = text[i + 1]
+                if nxt == "u":
+                    decoded = _unicode_escape(text, i)
+                    if decoded is not None:
+                        chars.append(decoded[0])
+                        i += decoded[1]
+                        continue
+                chars.append(_ESCAPES.get(nxt, nxt))
+                i += 2
+            elif ch == quote:
+                self.pos = i + 1
+                return json.dumps("".join(chars), ensure_ascii=False)
+            elif ch == "\n" and quote == "'":
+                # 单引号字符串不允许跨行，视为缺少右引号
+                break
+            else:
+                chars.append(ch)
+                i += 1
+        return None
+
+    def _read_bareword(self) -> str:
+        text = self.text
+        start = self.pos
+        while self.pos < len(text) and (text[self.pos].isalnum() or text[self.pos] in "_$.+-"):
+            self.pos += 1
+        return text[start:self.pos]
+
+    def run(self) -> str:
+        text = self.text
+        while True:
+            self._skip_space_and_comments()
+            if self.pos >= len(text):
+                break
+            ch = text[self.pos]
+            frame = self.stack[-1] if self.stack else None
+
+            if ch in "{[":
+                self.out.append(ch)
+                self.stack.append(_Frame(ch))
+                self.pos += 1
+            elif ch in "}]":
+                if not self.stack:
+                    break
+                if _CLOSERS[frame.opener] != ch:
+                    self._note("mismatched_brackets")
+                    if not any(_CLOSERS[f.opener] == ch for f in self.stack):
+                        # 多余的右括号，跳过
+                        self.pos += 1
+                        continue
+                    # 先闭合内层，右括号留给外层处理
+                    self._close_frame()
+                    if not self.stack:
+                        return "".join(self.out)
+                    continue
+                self.pos += 1
+                self._close_frame()
+                if not self.stack:
+                    return "".join(self.out)
+            elif ch == ",":
+                if frame is not None and frame.expect == "comma":
+                    self.out.append(",")
+                    frame.expect = "key" if frame.opener == "{" else "value"
+                else:
+                    self._note("extra_commas")
+                self.pos += 1
+            elif ch == ":":
+                if frame is not None and frame.expect == "colon":
+                    self.out.append(":")
+                    frame.expect = "value"
+                self.pos += 1
+            elif ch in "\"'":
+                encoded = self._read_string()
+                if encoded is None:
+                    break
+                self._emit_scalar(frame, encoded)
+            elif ch.isdigit() or ch in "-+.":
+                token = self._read_bareword()
+                try:
+                    number = json.loads(token.lstrip("+"))
+                    if frame is not None and frame.expect == "key":
+                        encoded = json.dumps(token)
+                    else:
+                        encoded = json.dumps(number)
+                except ValueError:
+                    encoded = json.dumps(token, ensure_ascii=False)
+                    self._note("invalid_numbers")
+                if self.pos >= len(text):
+                    # 数字可能被截断，不作为完整值
+                    break
+                self._emit_scalar(frame, encoded)
+            elif ch.isalpha() or ch in "_$":
+                token = self._read_bareword()
+                if frame is not None and frame.expect == "key":
+                    encoded = json.dumps(token, ensure_ascii=False)
+                    self._note("unquoted_keys")
+                elif token in _LITERALS:
+                    encoded = _LITERALS[token]
+                else:
+                    encoded = json.dumps(token, ensure_ascii=False)
+                    self._note("bare_words")
+                if self.pos >= len(text):
+                    break
+                self._emit_scalar(frame, encoded)
+            else:
+                # 无法识别的字符（如中文全角标点）直接跳过
+                self._note("stray_characters")
+                self.pos += 1
+
+        return self._close_truncated()
+
+    def _close_frame(self):
+        frame = self.stack[-1]
+        # 删除尾随逗号
+        while self.out and self.out[-1] == ",":
+            self.out.pop()
+            self._note("trailing_commas")
+        if frame.expect == "colon" or (frame.opener == "{" and frame.expect == "value"):
+            # 键后缺值，丢弃残缺的键值对
+            self._drop_dangling_key()
+        self.out.append(_CLOSERS[frame.opener])
+        self.stack.pop()
+        self._value_done()
+
+    def _emit_scalar(self, frame: Optional[_Frame], encoded: str):
+        if frame is None:
+            self.out.append(encoded)
+            return
+        if frame.expect == "comma":
+            # 缺少逗号
+            self.out.append(",")
+            frame.expect = "key" if frame.opener == "{" else "value"
+            self._note("missing_commas")
+        self.out.append(encoded)
+        if frame.opener == "{" and frame.expect == "key":
+            frame.expect = "colon"
+        else:
+            self._value_done()
+
+    def _drop_dangling_key(self):
+        # 输出末尾形如 ,"key": 或 "key"
+        if self.out and self.out[-1] == ":":
+            self.out.pop()
+        if self.out and self.out[-1].startswith('"'):
+            self.out.pop()
+        while self.out and self.out[-1] == ",":
+            self.out.pop()
+        self._note("dangling_keys")
+
+    def _close_truncated(self) -> str:
+        if not self.stack:
+            return "".join(self.out)
+        self._note("truncated")
+        if self.safe_point is None:
+            raise JSONRepairError("JSON 内容被截断，且没有可保留的完整值")
+        length, openers = self.safe_point
+        closers = "".join(_CLOSERS[o] for o in reversed(openers))
+        return "".join(self.out[:length]) + closers
+
+
+def _find_start(text: str, start_chars: str, begin: int = 0) -> int:
+    positions = [p for p in (text.find(c, begin) for c in start_chars) if p != -1]
+    return min(positions) if positions else -1
+
+
+def repair_json_text(text: str, start_chars: str = "{") -> Tuple[str, List[str]]:
+    """
+    从任意文本中提取第一个 JSON 值并修复为合法 JSON 文本
+
+    Returns:
+        (JSON 文本, 应用过的修复列表)
+    """
+    start = _find_start(text, start_chars)
+    if start == -1:
+        raise JSONRepairError("文本中没有 JSON 对象")
+    repairer = _Repairer(text, start)
+    return repairer.run(), repairer.fixes
+
+
+def iter_json_values(text: str, start_chars: str = "{",
+                     max_candidates: int = MAX_START_CANDIDATES) -> Iterator[Tuple[Any, List[str]]]:
+    """
+    依次产出文本中可提取的 JSON 值
+
+    整段文本是合法 JSON 时只产出这一个值；否则从前往后逐个候选起点提取并修复，
+    跳过无法解析的起点以及已产出值内部的起点
+
+    Yields:
+        (解析结果, 应用过的修复列表；无需修复时为空)
+
+    Raises:
+        JSONRepairError: 没有任何候选起点能提取出 JSON 值
+    """
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+    except json.JSONDecodeError:
+        pass
+    else:
+        yield value, []
+        return
+
+    start = _find_start(text, start_chars)
+    if start == -1:
+        raise JSONRepairError("文本中没有 JSON 对象")
+    error: Optional[JSONRepairError] = None
+    produced = False
+    for _ in range(max_candidates):
+        repairer = _Repairer(text, start)
+        try:
+            value = json.loads(repairer.run())
+        except JSONRepairError as e:
+            error = e
+            next_begin = start + 1
+        except json.JSONDecodeError as e:
+            error = JSONRepairError(f"修复后仍无法解析 JSON: {e}")
+            next_begin = start + 1
+        else:
+            produced = True
+            yield value, repairer.fixes
+            next_begin = max(repairer.pos, start + 1)
+        start = _find_start(text, start_chars, next_begin)
+        if start == -1:
+            break
+    if not produced:
+        raise error
+
+
+def parse_json_lenient(text: str, start_chars: str = "{") -> Tuple[Any, List[str]]:
+    """
+    宽松解析：合法 JSON 直接解析，否则提取并修复后再解析
+
+    Returns:
+        (解析结果, 应用过的修复列表；无需修复时为空)
+
+    Raises:
+        JSONRepairError: 无法提取出 JSON 值
+    """
+    return next(iter_json_values(text, start_chars))
@@ -0,0 +1,183 @@
+# src/core/load_shedding.py
+"""
+按路由限流与过载保护中间件（纯 ASGI 实现）
+
+- 大模型 / 视频生成等昂贵路由各自有并发上限、排队长度与排队超时
+- 超出排队长度或排队超时的请求立即返回 503 + Retry-After，不占用连接和线程池
+- 未配置的路由（朝代查询、战役数据、静态文件、探针等廉价读接口）不经过限流，
+  昂贵路由过载时地图界面仍能正常响应
+
+配置（LOAD_SHED_LIMITS，覆盖同名路由的默认值）:
+    "/api/v1/multimodal/generate-video=2:4:1,/api/v1/deduction/simulate=8:16:5"
+    即 路由模板=并发上限:排队长度:排队超时秒数
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.core.metrics import REGISTRY, route_template
+
+logger = logging.getLogger(__name__)
+
+LOAD_SHED_REJECTED = REGISTRY.counter(
+    "load_shed_rejected_total", "因过载被拒绝的请求数", ("route", "reason")
+)
+ROUTE_ACTIVE = REGISTRY.gauge("route_concurrency_active", "限流路由正在处理的请求数", ("route",))
+ROUTE_QUEUED = REGISTRY.gauge("route_concurrency_queued", "限流路由排队等待的请求数", ("route",))
+
+
+@dataclass
+class RouteLimit:
+    """单个路由的限流参数"""
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float
+
+
+# 大模型 / 视频 / 图像生成、批量寻路与参数扫描路由的默认限额；视频任务会占用数分钟，并发上限最小
+DEFAULT_ROUTE_LIMITS: Dict[str, RouteLimit] = {
+    "/api/v1/multimodal/generate-video": RouteLimit(max_concurrency=4, max_queue=4, queue_timeout=2.0),
+    "/api/v1/image/generate-image": RouteLimit(max_concurrency=4, max_queue=8, queue_timeout=5.0),
+    "/api/v1/deduction/simulate": RouteLimit(max_concurrency=8, max_queue=16, queue_timeout=5.0),
+    "/api/v1/llm/military-analysis": RouteLimit(max_concurrency=8, max_queue=16, queue_timeout=5.0),
+    # 批量寻路在线程池中做 A* 搜索
+    "/api/v1/deduction/routes": RouteLimit(max_concurrency=4, max_queue=8, queue_timeout=5.0),
+    # 参数扫描本身已在进程池中占满多核
+    "/api/v1/game/battle/{battle_id}/sweep": RouteLimit(max_concurrency=2, max_queue=4, queue_timeout=10.0),
+}
+
+
+def parse_route_limits(spec: str) -> Dict[str, RouteLimit]:
+    """
+    解析 LOAD_SHED_LIMITS
+
+    Args:
+        spec: "路由=并发:排队:超时,..."，排队与超时可省略（默认 0 与 0 秒，即不排队）
+    """
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        route, _, values = item.strip().rpartition("=")
+        parts = values.split(":")
+        if not route or not parts[0]:
+            raise ValueError(f"无法解析的限流配置: {item}")
+        limits[route] = RouteLimit(
+            max_concurrency=int(parts[0]),
+            max_queue=int(parts[1]) if len(parts) > 1 else 0,
+            queue_timeout=float(parts[2]) if len(parts) > 2 else 0.0,
+        )
+    return limits
+
+
+class RouteLimiter:
+    """单个路由的并发控制：信号量 + 有界排队"""
+
+    def __init__(self, route: str, limit: RouteLimit):
+        self.route = route
+        self.limit = limit
+        self.active = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(limit.max_concurrency)
+        # 请求耗时的指数移动平均，用于估算 Retry-After
+        self._avg_duration = 1.0
+        self._active_gauge = ROUTE_ACTIVE.labels(route=route)
+        self._queued_gauge = ROUTE_QUEUED.labels(route=route)
+
+    async def acquire(self) -> Optional[str]:
+        """获取执行名额；成功返回 None，被拒绝时返回原因（queue_full / queue_timeout）"""
+        if self._semaphore.locked():
+            if self.queued >= self.limit.max_queue or self.limit.queue_timeout <= 0:
+                return "queue_full"
+            self.queued += 1
+            self._queued_gauge.inc()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.limit.queue_timeout)
+            except asyncio.TimeoutError:
+                return "queue_timeout"
+            finally:
+                self.queued -= 1
+                self._queued_gauge.dec()
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self._active_gauge.inc()
+        return None
+
+    def release(self, duration: float):
+        self.active -= 1
+        self._active_gauge.dec()
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """按平均耗时估算排在前面的请求处理完所需的秒数"""
+        backlog = (self.active + self.queued) / max(1, self.limit.max_concurrency)
+        return max(1, min(120, math.ceil(self._avg_duration * backlog)))
+
+
+class LoadSheddingMiddleware:
+    """按路由模板限流的 ASGI 中间件"""
+
+    def __init__(self, app, routes: List = None, limits: Dict[str, RouteLimit] = None):
+        """
+        Args:
+            routes: 顶层应用的路由列表（app.router.routes），用于把请求路径解析为路由模板
+            limits: 路由模板 -> 限额；缺省为 DEFAULT_ROUTE_LIMITS 叠加 LOAD_SHED_LIMITS
+        """
+        self.app = app
+        self.routes = routes if routes is not None else []
+        if limits is None:
+            limits = {**DEFAULT_ROUTE_LIMITS, **parse_route_limits(os.getenv("LOAD_SHED_LIMITS", ""))}
+        self.enabled = os.getenv("LOAD_SHEDDING", "1") != "0"
+        self.limiters = {route: RouteLimiter(route, limit) for route, limit in limits.items()}
+        # 路由模板中第一个路径参数之前的部分；不以这些前缀开头的请求直接放行，不做路由匹配
+        self._prefixes = tuple(route.split("{", 1)[0] for route in self.limiters)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not scope["path"].startswith(self._prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters.get(route_template(self.routes, scope) or "")
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await limiter.acquire()
+        if reason is not None:
+            LOAD_SHED_REJECTED.inc(route=limiter.route, reason=reason)
+            logger.warning(f"路由 {limiter.route} 过载，拒绝请求（{reason}，处理中 {limiter.active}，排队 {limiter.queued}）")
+            await self._reject(send, limiter, reason)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+    @staticmethod
+    async def _reject(send, limiter: RouteLimiter, reason: str):
+        body = json.dumps({
+            "detail": "服务繁忙，请稍后重试",
+            "route": limiter.route,
+            "reason": reason,
+        }, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(limiter.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
@@ -0,0 +1,213 @@
+# src/core/loop_monitor.py
+"""
+事件循环延迟与线程池饱和度监控
+
+- LoopLagMonitor 周期性 sleep 固定间隔，实际唤醒时间超出的部分即事件循环延迟（同步代码阻塞循环的时长）
+- InstrumentedThreadPoolExecutor 记录排队数、执行中任务数与排队等待时间；
+  启动时替换事件循环的默认线程池，asyncio.to_thread 的调用同样被统计
+- 阻塞的 SDK 调用可通过 run_blocking(名称, ...) 放到按上游划分的独立线程池
+  （设置 {NAME}_EXECUTOR_WORKERS 启用，未设置时仍使用默认线程池）
+
+判断瓶颈：
+- event_loop_lag_seconds 升高：循环被同步代码阻塞（loop-bound），用 /api/v1/admin/profile?threads=loop 定位
+- executor_queue_depth > 0 且 executor_active_threads 等于 executor_max_workers：线程池饱和，调大线程数或拆分线程池
+- 以上都正常而 model_request_duration_seconds 升高：瓶颈在上游（upstream-bound）
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from src.core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "事件循环调度延迟（定时器实际唤醒时间与预期的差值）",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+EVENT_LOOP_LAG_LAST = REGISTRY.gauge("event_loop_lag_last_seconds", "最近一次测得的事件循环延迟")
+EXECUTOR_MAX_WORKERS = REGISTRY.gauge("executor_max_workers", "线程池最大线程数", ("executor",))
+EXECUTOR_ACTIVE = REGISTRY.gauge("executor_active_threads", "线程池中正在执行任务的线程数", ("executor",))
+EXECUTOR_QUEUE_DEPTH = REGISTRY.gauge("executor_queue_depth", "线程池中排队等待执行的任务数", ("executor",))
+EXECUTOR_QUEUE_WAIT = REGISTRY.histogram(
+    "executor_queue_wait_seconds", "任务从提交到开始执行的等待时间", ("executor",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """记录排队与执行情况的线程池"""
+
+    def __init__(self, name: str, max_workers: Optional[int] = None):
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"{name}-executor")
+        self.name = name
+        self._queued = EXECUTOR_QUEUE_DEPTH.labels(executor=name)
+        self._active = EXECUTOR_ACTIVE.labels(executor=name)
+        self._wait = EXECUTOR_QUEUE_WAIT.labels(executor=name)
+        EXECUTOR_MAX_WORKERS.set(self._max_workers, executor=name)
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def run():
+            self._queued.dec()
+            self._active.inc()
+            self._wait.observe(time.perf_counter() - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._active.dec()
+
+        self._queued.inc()
+        try:
+            return super().submit(run)
+        except Exception:
+            self._queued.dec()
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self._max_workers,
+            "active": int(self._active.value),
+            "queued": int(self._queued.value),
+        }
+
+
+_executors: Dict[str, InstrumentedThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def install_default_executor(loop: asyncio.AbstractEventLoop = None) -> InstrumentedThreadPoolExecutor:
+    """
+    用带统计的线程池替换事件循环的默认线程池（asyncio.to_thread / run_in_executor(None, ...)）
+
+    线程数取 DEFAULT_EXECUTOR_WORKERS，缺省与标准库一致：min(32, CPU 数 + 4)
+    """
+    loop = loop or asyncio.get_running_loop()
+    workers = os.getenv("DEFAULT_EXECUTOR_WORKERS")
+    executor = InstrumentedThreadPoolExecutor("default", int(workers) if workers else None)
+    loop.set_default_executor(executor)
+    with _executors_lock:
+        _executors["default"] = executor
+    return executor
+
+
+def get_executor(name: str) -> Optional[InstrumentedThreadPoolExecutor]:
+    """
+    获取上游专用线程池；{NAME}_EXECUTOR_WORKERS 未设置或为 0 时返回 None（使用默认线程池）
+
+    Args:
+        name: 线程池名称，如 zhipu、video
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        workers = int(os.getenv(f"{name.upper()}_EXECUTOR_WORKERS", "0"))
+        if workers <= 0:
+            return None
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = InstrumentedThreadPoolExecutor(name, workers)
+                logger.info(f"线程池 {name} 已创建: {workers} 个线程")
+    return executor
+
+
+async def run_blocking(name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在名为 name 的专用线程池（未配置时为默认线程池）中执行阻塞调用
+
+    与 asyncio.to_thread 一样复制 contextvars，请求 ID 与追踪 span 在线程中仍然可用
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(name), functools.partial(ctx.run, func, *args, **kwargs))
+
+
+def shutdown_executors():
+    """关闭专用线程池（默认线程池由事件循环关闭时处理）"""
+    with _executors_lock:
+        dedicated = [executor for name, executor in _executors.items() if name != "default"]
+        _executors.clear()
+    for executor in dedicated:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LoopLagMonitor:
+    """周期性测量事件循环延迟"""
+
+    def __init__(self, interval: float = None, warn_threshold: float = None, window: int = 120):
+        """
+        Args:
+            interval: 测量间隔（秒），缺省取 LOOP_LAG_INTERVAL
+            warn_threshold: 超过该延迟（秒）时记录告警日志，缺省取 LOOP_LAG_WARN_MS
+            window: 保留最近多少次测量用于 snapshot()
+        """
+        self.interval = interval if interval is not None else float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+        self.warn_threshold = warn_threshold if warn_threshold is not None else float(os.getenv("LOOP_LAG_WARN_MS", "200")) / 1000
+        self.recent = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.recent.append(lag)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_LAST.set(lag)
+            if lag >= self.warn_threshold:
+                logger.warning(f"事件循环被阻塞 {lag * 1000:.0f} ms（有同步代码占用事件循环线程）")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def lag_stats(self) -> Dict[str, float]:
+        samples = sorted(self.recent)
+        if not samples:
+            return {"samples": 0, "last_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(samples),
+            "last_ms": round(self.recent[-1] * 1000, 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    当前事件循环延迟与各线程池状态，并给出瓶颈判断
+
+    Returns:
+        bottleneck: event_loop（循环被阻塞）/ executor:<名称>（线程池排队）/ none（瓶颈不在本进程，多为上游）
+    """
+    lag = loop_monitor.lag_stats()
+    with _executors_lock:
+        executors = {name: executor.stats() for name, executor in _executors.items()}
+    if lag["p95_ms"] >= loop_monitor.warn_threshold * 1000:
+        bottleneck = "event_loop"
+    else:
+        saturated = [name for name, stats in executors.items() if stats["queued"] > 0]
+        bottleneck = f"executor:{saturated[0]}" if saturated else "none"
+    return {"event_loop_lag": lag, "executors": executors, "bottleneck": bottleneck}
@@ -0,0 +1,233 @@
+# src/core/profiler.py
+"""
+进程内采样分析器与 asyncio 任务快照（供线上诊断使用）
+
+- SamplingProfiler 在独立线程中按固定间隔读取 sys._current_frames()，不使用 sys.setprofile，
+  被测代码不需要任何改动，开销只与采样频率和线程数有关
+- wall 模式：每次采样都计数，反映时间花在哪里（包括等待 I/O、锁）
+- cpu 模式：按线程 CPU 时钟的增量加权，只统计真正占用 CPU 的栈（需要 pthread_getcpuclockid，Linux/macOS）
+- 结果输出为 flamegraph.pl / speedscope 可直接读取的 collapsed stack 格式
+- dump_asyncio_tasks 列出事件循环中的任务及其 await 链，按相同的挂起位置分组
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PROFILE_MODES = ("wall", "cpu")
+MAX_PROFILE_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MIN_INTERVAL_SECONDS = 0.001
+
+
+class ProfilerBusyError(RuntimeError):
+    """同一进程同时只允许一个采样任务"""
+
+
+def _short_filename(filename: str) -> str:
+    # 标准库与第三方包显示为相对解释器前缀的路径，缩短栈帧名称
+    if filename.startswith(sys.prefix):
+        return os.path.relpath(filename, sys.prefix)
+    return filename
+
+
+def _frame_label(code) -> str:
+    # collapsed 格式以分号分隔栈帧，函数名中不应出现分号
+    return f"{code.co_name} ({_short_filename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack_labels(frame) -> List[str]:
+    """从最外层到最内层的栈帧名称"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _thread_cpu_clock(thread_id: int) -> Optional[int]:
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return None
+
+
+class SamplingProfiler:
+    """定时采样所有（或指定）线程的调用栈"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, mode: str = "wall", interval: float = 0.01, thread_ids: Optional[List[int]] = None):
+        """
+        Args:
+            mode: wall / cpu
+            interval: 采样间隔（秒）
+            thread_ids: 只采样这些线程；缺省为除采样线程外的所有线程
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的采样模式: {mode}")
+        self.mode = mode
+        self.interval = max(interval, MIN_INTERVAL_SECONDS)
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._cpu_clocks: Dict[int, Optional[int]] = {}
+        self._cpu_last: Dict[int, int] = {}
+
+    def _cpu_weight(self, thread_id: int) -> int:
+        """线程自上次采样以来消耗的 CPU 时间（微秒）"""
+        if thread_id not in self._cpu_clocks:
+            self._cpu_clocks[thread_id] = _thread_cpu_clock(thread_id)
+        clock = self._cpu_clocks[thread_id]
+        if clock is None:
+            return 0
+        try:
+            now = time.clock_gettime_ns(clock) // 1000
+        except OSError:
+            # 线程已退出
+            return 0
+        last = self._cpu_last.get(thread_id)
+        self._cpu_last[thread_id] = now
+        return now - last if last is not None else 0
+
+    def _sample(self, own_id: int, thread_names: Dict[int, str]):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            weight = 1 if self.mode == "wall" else self._cpu_weight(thread_id)
+            if weight <= 0:
+                continue
+            name = thread_names.get(thread_id) or f"thread-{thread_id}"
+            self.stacks[";".join([name] + _stack_labels(frame))] += weight
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """在当前线程中采样 seconds 秒（阻塞）"""
+        if not SamplingProfiler._lock.acquire(blocking=False):
+            raise ProfilerBusyError("已有采样任务在运行")
+        try:
+            seconds = min(max(seconds, self.interval), MAX_PROFILE_SECONDS)
+            own_id = threading.get_ident()
+            start = time.perf_counter()
+            deadline = start + seconds
+            next_sample = start
+            names_refreshed = 0.0
+            thread_names: Dict[int, str] = {}
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now - names_refreshed > 1.0:
+                    thread_names = {t.ident: t.name for t in threading.enumerate()}
+                    names_refreshed = now
+                self._sample(own_id, thread_names)
+                next_sample += self.interval
+                # 落后时不追赶，避免在负载高时连续采样
+                time.sleep(max(0.0, next_sample - time.perf_counter()))
+                if next_sample < time.perf_counter():
+                    next_sample = time.perf_counter()
+            self.duration = time.perf_counter() - start
+        finally:
+            SamplingProfiler._lock.release()
+
+    def collapsed(self) -> str:
+        """collapsed stack 文本：每行 "帧1;帧2;... 权重"（cpu 模式权重单位为微秒）"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        """按叶子函数汇总的自耗时排行"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(self.stacks.values()) or 1
+        return {
+            "mode": self.mode,
+            "interval_ms": round(self.interval * 1000, 3),
+            "duration_s": round(self.duration, 3),
+            "samples": self.samples,
+            "unit": "samples" if self.mode == "wall" else "cpu_us",
+            "total": sum(self.stacks.values()),
+            "top_self": [
+                {"frame": frame, "weight": count, "percent": round(count * 100 / total, 1)}
+                for frame, count in leaves.most_common(top)
+            ],
+        }
+
+
+async def run_profile(seconds: float, mode: str = "wall", interval: float = 0.01,
+                      thread_ids: Optional[List[int]] = None) -> SamplingProfiler:
+    """
+    在专用线程中采样并等待结果，不占用事件循环，也不占用 asyncio.to_thread 的默认线程池
+    （负载高时线程池可能已被上游调用占满）
+
+    Raises:
+        ProfilerBusyError: 已有采样任务在运行
+    """
+    profiler = SamplingProfiler(mode=mode, interval=interval, thread_ids=thread_ids)
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def target():
+        try:
+            profiler.run(seconds)
+        except BaseException as e:
+            loop.call_soon_threadsafe(lambda error=e: done.done() or done.set_exception(error))
+        else:
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(profiler))
+
+    threading.Thread(target=target, name="sampling-profiler", daemon=True).start()
+    return await done
+
+
+def _await_chain(task: asyncio.Task) -> List[str]:
+    """任务的 await 链：从任务入口协程到最内层挂起位置"""
+    chain = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) \
+            or getattr(awaitable, "ag_frame", None)
+        if frame is not None:
+            chain.append(f"{frame.f_code.co_name} ({_short_filename(frame.f_code.co_filename)}:{frame.f_lineno})")
+        else:
+            chain.append(type(awaitable).__qualname__)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) \
+            or getattr(awaitable, "ag_await", None)
+    return chain
+
+
+def dump_asyncio_tasks(loop: asyncio.AbstractEventLoop = None) -> Dict[str, Any]:
+    """
+    当前事件循环中所有任务的快照（必须在事件循环线程中调用）
+
+    Returns:
+        {"total": 任务数, "groups": [按挂起位置分组的任务], "tasks": [逐个任务]}
+    """
+    loop = loop or asyncio.get_running_loop()
+    current = asyncio.current_task(loop)
+    tasks = []
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for task in asyncio.all_tasks(loop):
+        if task is current:
+            continue
+        chain = _await_chain(task)
+        entry = {
+            "name": task.get_name(),
+            "coroutine": getattr(task.get_coro(), "__qualname__", repr(task.get_coro())),
+            "state": "cancelling" if getattr(task, "cancelling", lambda: 0)() else "pending",
+            "await_chain": chain,
+        }
+        tasks.append(entry)
+        # 挂起位置（含行号）完全相同的任务归为一组，便于发现大量卡在同一处的请求
+        key = tuple(chain)
+        group = groups.setdefault(key, {"count": 0, "await_chain": chain, "coroutine": entry["coroutine"]})
+        group["count"] += 1
+    return {
+        "total": len(tasks),
+        "groups": sorted(groups.values(), key=lambda g: g["count"], reverse=True),
+        "tasks": tasks,
+    }
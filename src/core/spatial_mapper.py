@@ -0,0 +1,116 @@
+# src/core/spatial_mapper.py
+"""
+经纬度空间索引
+
+按固定经纬度间隔把点分桶（均匀网格），查询时只检查查询点附近的桶：
+- nearest: 由内向外逐圈扩大搜索，找到的最近点比下一圈可能的最小距离更近时停止
+- within: 只检查与查询圆相交的桶
+
+距离为球面大圆距离（千米）。
+"""
+
+import math
+from collections import defaultdict
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+T = TypeVar("T")
+
+
+def haversine_km(lon_a: float, lat_a: float, lon_b: float, lat_b: float) -> float:
+    """两点之间的大圆距离（千米）"""
+    phi_a, phi_b = math.radians(lat_a), math.radians(lat_b)
+    d_phi = phi_b - phi_a
+    d_lambda = math.radians(lon_b - lon_a)
+    h = math.sin(d_phi / 2) ** 2 + math.cos(phi_a) * math.cos(phi_b) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def is_valid_coordinate(lon: Any, lat: Any) -> bool:
+    """经纬度是否为有限数值且在合法范围内"""
+    return (isinstance(lon, (int, float)) and isinstance(lat, (int, float))
+            and math.isfinite(lon) and math.isfinite(lat)
+            and -180 <= lon <= 180 and -90 <= lat <= 90)
+
+
+class GridSpatialIndex(Generic[T]):
+    """均匀经纬度网格上的点索引"""
+
+    def __init__(self, cell_degrees: float = 0.5):
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, T]]] = defaultdict(list)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        return int(math.floor(lon / self.cell_degrees)), int(math.floor(lat / self.cell_degrees))
+
+    def insert(self, lon: float, lat: float, value: T):
+        self._cells[self._cell(lon, lat)].append((lon, lat, value))
+        self._size += 1
+
+    def _ring(self, center: Tuple[int, int], radius: int):
+        cx, cy = center
+        if radius == 0:
+            yield center
+            return
+        for dx in range(-radius, radius + 1):
+            yield cx + dx, cy - radius
+            yield cx + dx, cy + radius
+        for dy in range(-radius + 1, radius):
+            yield cx - radius, cy + dy
+            yield cx + radius, cy + dy
+
+    def nearest(self, lon: float, lat: float, max_km: float = None,
+                predicate: Callable[[T], bool] = None) -> Optional[Tuple[T, float]]:
+        """
+        最近的点
+
+        Args:
+            max_km: 搜索半径上限，缺省不限
+            predicate: 只考虑满足条件的点
+
+        Returns:
+            (值, 距离千米)；范围内没有点时返回 None
+        """
+        if not self._size:
+            return None
+        center = self._cell(lon, lat)
+        # 一圈桶在纬向上的最小跨度；经向跨度随纬度缩小，按高纬度保守估计
+        ring_km = self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat) + self.cell_degrees, 89.0))), 0.01)
+        max_rings = int(180 / self.cell_degrees) + 1
+        if max_km is not None:
+            max_rings = min(max_rings, int(max_km / ring_km) + 1)
+        best: Optional[Tuple[T, float]] = None
+        for radius in range(max_rings + 1):
+            for cell in self._ring(center, radius):
+                for p_lon, p_lat, value in self._cells.get(cell, ()):
+                    if predicate is not None and not predicate(value):
+                        continue
+                    distance = haversine_km(lon, lat, p_lon, p_lat)
+                    if (max_km is None or distance <= max_km) and (best is None or distance < best[1]):
+                        best = (value, distance)
+            # 更外圈的点至少相距 radius 圈
+            if best is not None and best[1] <= radius * ring_km:
+                break
+        return best
+
+    def within(self, lon: float, lat: float, radius_km: float) -> List[Tuple[T, float]]:
+        """半径内的全部点，按距离排序"""
+        d_lat = radius_km / KM_PER_DEGREE
+        d_lon = d_lat / max(math.cos(math.radians(min(abs(lat) + d_lat, 89.0))), 0.01)
+        x0, y0 = self._cell(lon - d_lon, lat - d_lat)
+        x1, y1 = self._cell(lon + d_lon, lat + d_lat)
+        results = []
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                for p_lon, p_lat, value in self._cells.get((x, y), ()):
+                    distance = haversine_km(lon, lat, p_lon, p_lat)
+                    if distance <= radius_km:
+                        results.append((value, distance))
+        results.sort(key=lambda item: item[1])
+        return results
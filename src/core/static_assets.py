@@ -0,0 +1,330 @@
+# src/core/static_assets.py
+"""
+静态资源流水线
+
+构建阶段（python -m src.core.static_assets）:
+- 为 JS / CSS / HTML / JSON 等文本资源生成 .br / .gz 预压缩副本（比原文件小时才保留）
+- 计算每个文件的内容哈希，写入 static/asset-manifest.json
+
+运行阶段（PrecompressedStaticFiles）:
+- 按 Accept-Encoding 直接返回预压缩副本，不在请求时压缩
+- 指纹化地址（如 /static/js/unit-system.3f2a9c1d07.js）映射回原文件，返回 immutable 长缓存
+- HTML 中引用的 /static/ 子资源（脚本、样式、图片、字体等，不含页面与 Cesium 目录）在返回时改写为指纹化地址
+- 支持单段 Range 请求
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import logging
+import argparse
+import mimetypes
+from typing import Dict, Optional, Tuple
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+
+from src.core.cache import atomic_write_json, stable_hash
+from src.core.compression import brotli, choose_encoding
+from src.core.http_cache import conditional_response, make_etag
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "asset-manifest.json"
+MANIFEST_VERSION = 1
+SIDECAR_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_EXTENSIONS = {
+    ".js", ".cjs", ".mjs", ".css", ".html", ".json", ".svg", ".xml",
+    ".txt", ".md", ".wasm", ".glsl", ".czml", ".gltf", ".map",
+}
+# 小于该大小的文件压缩收益不足以抵消额外的请求头与解压开销
+MIN_COMPRESS_SIZE = 1024
+FINGERPRINT_LENGTH = 10
+# 不改写为指纹化地址的资源：Cesium 在未设置 CESIUM_BASE_URL 时按 script 标签中的 Cesium.js 文件名
+# 推断基础地址，Workers / Assets / Widgets 也在运行时按原始路径加载
+NO_FINGERPRINT_PREFIXES = ("cesium/",)
+# 只有页面引用的子资源改写为指纹化地址；页面（.html）地址要保持稳定，书签与分享链接才不会失效
+FINGERPRINT_EXTENSIONS = {
+    ".js", ".mjs", ".css", ".json", ".wasm", ".map",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico",
+    ".woff", ".woff2", ".ttf", ".otf", ".mp3", ".ogg", ".wav", ".mp4", ".webm",
+}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HTML_CACHE_CONTROL = "no-cache"
+DEFAULT_CACHE_CONTROL = f"public, max-age={os.getenv('STATIC_MAX_AGE', '86400')}"
+
+_HTML_REF_RE = re.compile(r"""((?:src|href)\s*=\s*["'])/static/([^"'?#]+)(["'])""")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def fingerprinted_name(rel_path: str, digest: str) -> str:
+    """js/app.js -> js/app.<hash>.js"""
+    root, ext = os.path.splitext(rel_path)
+    return f"{root}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def _iter_assets(static_dir: str):
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith(".") or filename == MANIFEST_NAME:
+                continue
+            if any(filename.endswith(suffix) for suffix in SIDECAR_SUFFIXES.values()):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            yield full_path, os.path.relpath(full_path, static_dir).replace(os.sep, "/")
+
+
+def _write_sidecar(path: str, data: bytes, source_mtime: float) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    # 副本与原文件同一修改时间，便于判断是否需要重建
+    os.utime(path, (source_mtime, source_mtime))
+
+
+def build_static_assets(static_dir: str, brotli_quality: int = 11, gzip_level: int = 9,
+                        force: bool = False) -> Dict:
+    """
+    生成预压缩副本与资源清单
+
+    Returns:
+        资源清单 {version, files: {相对路径: {hash, fingerprinted, size, mtime, encodings}}}
+    """
+    files = {}
+    stats = {"files": 0, "compressed": 0, "skipped": 0}
+    for full_path, rel_path in _iter_assets(static_dir):
+        with open(full_path, "rb") as f:
+            data = f.read()
+        source_stat = os.stat(full_path)
+        digest = stable_hash(data)
+        entry = {
+            "hash": digest,
+            "fingerprinted": fingerprinted_name(rel_path, digest),
+            "size": len(data),
+            "mtime": source_stat.st_mtime,
+            "encodings": []
+        }
+        stats["files"] += 1
+
+        ext = os.path.splitext(rel_path)[1].lower()
+        if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+            for encoding, suffix in SIDECAR_SUFFIXES.items():
+                sidecar = full_path + suffix
+                if encoding == "br" and brotli is None:
+                    continue
+                try:
+                    sidecar_stat = os.stat(sidecar)
+                    up_to_date = sidecar_stat.st_mtime == source_stat.st_mtime
+                except FileNotFoundError:
+                    up_to_date = False
+                if up_to_date and not force:
+                    entry["encodings"].append(encoding)
+                    stats["skipped"] += 1
+                    continue
+
+                if encoding == "br":
+                    compressed = brotli.compress(data, quality=brotli_quality)
+                else:
+                    compressed = gzip.compress(data, compresslevel=gzip_level, mtime=0)
+                if len(compressed) >= len(data):
+                    if os.path.exists(sidecar):
+                        os.remove(sidecar)
+                    continue
+                _write_sidecar(sidecar, compressed, source_stat.st_mtime)
+                entry["encodings"].append(encoding)
+                stats["compressed"] += 1
+
+        files[rel_path] = entry
+
+    manifest = {"version": MANIFEST_VERSION, "files": files}
+    atomic_write_json(os.path.join(static_dir, MANIFEST_NAME), manifest)
+    logger.info(
+        f"静态资源构建完成: {stats['files']} 个文件，新压缩 {stats['compressed']} 份，"
+        f"复用 {stats['skipped']} 份{'（未安装 brotli，仅生成 gzip）' if brotli is None else ''}"
+    )
+    return manifest
+
+
+class AssetManifest:
+    """资源清单：原始路径 <-> 指纹化路径"""
+
+    def __init__(self, directory: str, files: Dict[str, Dict] = None):
+        self.directory = directory
+        self.files = files or {}
+        self.by_fingerprint = {entry["fingerprinted"]: rel for rel, entry in self.files.items()}
+        self.version = stable_hash(*sorted(entry["hash"] for entry in self.files.values())) if self.files else ""
+
+    @classmethod
+    def load(cls, static_dir: str) -> "AssetManifest":
+        path = os.path.join(static_dir, MANIFEST_NAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return cls(static_dir, data.get("files", {}))
+            logger.warning("静态资源清单版本不匹配，已忽略，请重新构建")
+        except FileNotFoundError:
+            logger.info("未找到静态资源清单，不启用指纹化地址（可运行 python -m src.core.static_assets 生成）")
+        except (OSError, ValueError) as e:
+            logger.warning(f"静态资源清单无效: {e}")
+        return cls(static_dir)
+
+    def resolve(self, rel_path: str) -> Tuple[str, bool]:
+        """把请求路径解析为原始路径；返回 (原始路径, 是否为指纹化地址)"""
+        original = self.by_fingerprint.get(rel_path)
+        if original is not None:
+            return original, True
+        return rel_path, False
+
+    def is_fresh(self, rel_path: str, stat_result: os.stat_result) -> bool:
+        """文件在构建清单之后是否未被修改（修改过的文件不能再使用旧指纹）"""
+        entry = self.files.get(rel_path)
+        return entry is not None and entry.get("mtime") == stat_result.st_mtime
+
+    def rewrite_html(self, html: str) -> str:
+        """
+        把 HTML 中 src/href 引用的 /static/ 子资源改写为指纹化地址
+
+        只改写 FINGERPRINT_EXTENSIONS 中的类型（页面链接保持原地址），NO_FINGERPRINT_PREFIXES 下的资源除外
+        """
+        def replace(match):
+            rel_path = match.group(2)
+            entry = self.files.get(rel_path)
+            if (entry is None or rel_path.startswith(NO_FINGERPRINT_PREFIXES)
+                    or os.path.splitext(rel_path)[1].lower() not in FINGERPRINT_EXTENSIONS):
+                return match.group(0)
+            try:
+                if not self.is_fresh(rel_path, os.stat(os.path.join(self.directory, rel_path))):
+                    return match.group(0)
+            except OSError:
+                return match.group(0)
+            return f"{match.group(1)}/static/{entry['fingerprinted']}{match.group(3)}"
+        return _HTML_REF_RE.sub(replace, html)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """支持预压缩副本、指纹化地址与 Range 请求的静态文件服务"""
+
+    def __init__(self, *, directory: str, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest = AssetManifest.load(directory)
+        # 改写后的 HTML: 路径 -> (源文件修改时间, 响应体, ETag)
+        self._html_cache: Dict[str, Tuple[float, bytes, str]] = {}
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        rel_path, immutable = self.manifest.resolve(path.replace(os.sep, "/"))
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, rel_path)
+        if stat_result is None or not os.path.isfile(full_path):
+            # 目录、html 模式与 404 仍由 StaticFiles 处理
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        if rel_path.endswith(".html"):
+            return await self.html_response(rel_path, Request(scope))
+
+        media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        immutable = immutable and self.manifest.is_fresh(rel_path, stat_result)
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+        headers = {"Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+        entry = self.manifest.files.get(rel_path)
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_ok(request_headers, full_path, stat_result):
+            # Range 始终针对原始字节
+            return await self._range_response(full_path, stat_result, range_header, media_type, headers)
+
+        if entry and entry["encodings"]:
+            headers["Vary"] = "Accept-Encoding"
+            encoding = choose_encoding(request_headers.get("accept-encoding", ""), entry["encodings"])
+            if encoding is not None:
+                sidecar = full_path + SIDECAR_SUFFIXES[encoding]
+                try:
+                    sidecar_stat = await anyio.to_thread.run_sync(os.stat, sidecar)
+                except FileNotFoundError:
+                    sidecar_stat = None
+                # 原文件更新后副本失效，退回原文件
+                if sidecar_stat is not None and sidecar_stat.st_mtime == stat_result.st_mtime:
+                    headers["Content-Encoding"] = encoding
+                    full_path, stat_result = sidecar, sidecar_stat
+
+        response = FileResponse(full_path, stat_result=stat_result, media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _if_range_ok(self, request_headers: Headers, full_path: str, stat_result) -> bool:
+        if_range = request_headers.get("if-range")
+        if not if_range:
+            return True
+        validator = FileResponse(full_path, stat_result=stat_result).headers
+        return if_range in (validator.get("etag"), validator.get("last-modified"))
+
+    async def _range_response(self, full_path: str, stat_result, range_header: str,
+                              media_type: str, headers: Dict[str, str]) -> Response:
+        size = stat_result.st_size
+        match = _RANGE_RE.match(range_header.strip())
+        if match is None or match.group(1) == match.group(2) == "":
+            # 多段或无法识别的 Range：返回完整内容
+            return FileResponse(full_path, stat_result=stat_result, media_type=media_type, headers=headers)
+        first, last = match.group(1), match.group(2)
+        if first == "":
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+        def read_slice() -> bytes:
+            with open(full_path, "rb") as f:
+                f.seek(start)
+                return f.read(end - start + 1)
+
+        body = await anyio.to_thread.run_sync(read_slice)
+        headers = dict(headers, **{"Content-Range": f"bytes {start}-{end}/{size}"})
+        return Response(content=body, status_code=206, media_type=media_type, headers=headers)
+
+    async def html_response(self, rel_path: str, request: Request) -> Response:
+        """返回改写了资源引用的 HTML（不缓存，凭 ETag 重新验证）"""
+        full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, rel_path)
+        if stat_result is None:
+            return Response(status_code=404)
+        cached = self._html_cache.get(rel_path)
+        if cached is None or cached[0] != stat_result.st_mtime:
+            def render() -> bytes:
+                with open(full_path, "r", encoding="utf-8") as f:
+                    return self.manifest.rewrite_html(f.read()).encode("utf-8")
+            body = await anyio.to_thread.run_sync(render)
+            cached = (stat_result.st_mtime, body, make_etag(self.manifest.version, rel_path, body))
+            self._html_cache[rel_path] = cached
+        _, body, etag = cached
+        return conditional_response(request, body, etag, media_type="text/html; charset=utf-8",
+                                    cache_control=HTML_CACHE_CONTROL)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="生成静态资源的预压缩副本与指纹清单")
+    parser.add_argument("--static-dir", default="static", help="静态资源目录")
+    parser.add_argument("--force", action="store_true", help="重新生成所有预压缩副本")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not os.path.isdir(args.static_dir):
+        logger.error(f"静态资源目录不存在: {args.static_dir}")
+        return 1
+    build_static_assets(args.static_dir, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
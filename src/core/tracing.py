@@ -0,0 +1,382 @@
+# src/core/tracing.py
+"""
+请求链路追踪
+
+- span(name, **attributes) 记录一个阶段的耗时；父子关系通过 contextvars 传递，
+  asyncio 任务与 asyncio.to_thread 中的代码自动挂到当前请求下
+- TracingMiddleware 为每个 HTTP 请求创建根 span，接受 W3C traceparent 与 X-Request-ID 请求头，
+  并在响应中回写 X-Request-ID
+- 日志记录自动带上 request_id / trace_id（install_log_context）
+- span 以 OpenTelemetry（OTLP JSON）的结构导出：
+    TRACING_EXPORTER=file  追加写入 JSON Lines 文件（TRACE_FILE）
+    TRACING_EXPORTER=otlp  批量 POST 到 OTLP/HTTP 采集器（OTEL_EXPORTER_OTLP_ENDPOINT）
+    TRACING_EXPORTER=none  只传播 request_id，不记录 span（默认）
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import logging
+import secrets
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.core.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mr-zhuge")
+REQUEST_ID_HEADER = b"x-request-id"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# OTLP 状态码
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """一个计时阶段"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "events",
+                 "start_ns", "end_ns", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.events: List[Dict[str, Any]] = []
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"timeUnixNano": str(time.time_ns()), "name": name, "attributes": _otlp_attributes(attributes)})
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.add_event("exception", **{"exception.type": type(error).__name__, "exception.message": str(error)})
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status_message else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = self.events
+        return span
+
+
+class _NoopSpan:
+    """未启用追踪或未被采样时使用，所有操作为空"""
+
+    trace_id = None
+    span_id = None
+    recording = False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _BatchExporter:
+    """后台线程批量导出 span，请求路径上只做入队"""
+
+    def __init__(self, kind: str, max_batch: int = 256, interval: float = 1.0):
+        self.kind = kind
+        self.max_batch = max_batch
+        self.interval = interval
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=int(os.getenv("TRACE_QUEUE_SIZE", "10000")))
+        self.dropped = 0
+        self.file_path = os.getenv("TRACE_FILE", "generated_content/traces/spans.jsonl")
+        endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://127.0.0.1:4318").rstrip("/")
+        self.otlp_url = endpoint if endpoint.endswith("/v1/traces") else f"{endpoint}/v1/traces"
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            # 导出跟不上时丢弃，不拖慢请求
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._export(batch)
+                except Exception as e:
+                    logger.warning(f"导出追踪数据失败（{len(batch)} 个 span）: {e}")
+            if stop:
+                return
+
+    def _export(self, batch: List[Span]):
+        spans = [span.to_otlp() for span in batch]
+        if self.kind == "file":
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(self.file_path, "a", encoding="utf-8") as f:
+                for span in spans:
+                    f.write(json.dumps(span, ensure_ascii=False, separators=(",", ":")) + "\n")
+            return
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": "mr_zhuge"}, "spans": spans}]
+            }]
+        }
+        request = urllib.request.Request(
+            self.otlp_url, data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def shutdown(self, timeout: float = 5.0):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+class Tracer:
+    """span 的创建、采样与导出"""
+
+    def __init__(self, exporter: str = None, sample_rate: float = None):
+        self.exporter_kind = (exporter if exporter is not None else os.getenv("TRACING_EXPORTER", "none")).lower()
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+        self.enabled = self.exporter_kind in ("file", "otlp")
+        if self.exporter_kind not in ("file", "otlp", "none"):
+            logger.warning(f"未知的 TRACING_EXPORTER: {self.exporter_kind}，不记录 span")
+        self._exporter: Optional[_BatchExporter] = None
+        self._exporter_lock = threading.Lock()
+
+    def _export(self, span: Span):
+        if self._exporter is None:
+            with self._exporter_lock:
+                if self._exporter is None:
+                    self._exporter = _BatchExporter(self.exporter_kind)
+        self._exporter.submit(span)
+
+    @contextmanager
+    def start_span(self, name: str, trace_id: str = None, parent_id: str = None,
+                   **attributes) -> Iterator[Any]:
+        """
+        创建 span 并设为当前 span；退出时记录结束时间与异常
+
+        Args:
+            trace_id / parent_id: 延续上游传入的链路（根 span 使用）；缺省时挂在当前 span 下
+        """
+        parent = _current_span.get()
+        if not self.enabled or parent is NOOP_SPAN:
+            yield NOOP_SPAN
+            return
+        if parent is None and trace_id is None:
+            # 根 span 决定整条链路是否采样
+            if random.random() >= self.sample_rate:
+                token = _current_span.set(NOOP_SPAN)
+                try:
+                    yield NOOP_SPAN
+                finally:
+                    _current_span.reset(token)
+                return
+
+        if parent is not None and trace_id is None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(name, trace_id or secrets.token_hex(16), parent_id, attributes)
+        request_id = request_id_var.get()
+        if request_id and parent is None:
+            span.attributes["request.id"] = request_id
+        token = _current_span.set(span)
+        try:
+            yield span
+            if span.status == STATUS_UNSET:
+                span.status = STATUS_OK
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._export(span)
+
+    def shutdown(self):
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """在当前链路下记录一个阶段：with span("model.chat", backend="zhipu") as s: ..."""
+    return tracer.start_span(name, **attributes)
+
+
+def current_span():
+    """当前 span（未启用追踪时为空操作对象）"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def configure_tracing(exporter: str = None, sample_rate: float = None) -> Tracer:
+    """按参数（缺省读环境变量）重新创建全局 tracer"""
+    global tracer
+    tracer.shutdown()
+    tracer = Tracer(exporter, sample_rate)
+    return tracer
+
+
+def shutdown_tracing():
+    """导出剩余的 span（应用关闭时调用）"""
+    tracer.shutdown()
+
+
+def parse_traceparent(header: str) -> Optional[tuple]:
+    """解析 W3C traceparent: 00-<trace_id>-<parent_id>-<flags>"""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+class TracingMiddleware:
+    """为每个 HTTP 请求设置 request_id 并创建根 span 的 ASGI 中间件"""
+
+    def __init__(self, app, routes: List = None):
+        """
+        Args:
+            routes: 顶层应用的路由列表，用于以路由模板命名根 span
+        """
+        self.app = app
+        self.routes = routes if routes is not None else []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        traceparent = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+            elif name == b"traceparent":
+                traceparent = parse_traceparent(value.decode("latin-1"))
+        request_id = request_id or secrets.token_hex(8)
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                if root.recording:
+                    root.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.status = STATUS_ERROR
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        trace_id, parent_id = traceparent if traceparent else (None, None)
+        try:
+            with tracer.start_span(f"HTTP {scope['method']}", trace_id=trace_id, parent_id=parent_id,
+                                   **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+                try:
+                    await self.app(scope, receive, send_with_request_id)
+                finally:
+                    if root.recording:
+                        route = route_template(self.routes, scope) or "unmatched"
+                        root.name = f"HTTP {scope['method']} {route}"
+                        root.set_attribute("http.route", route)
+        finally:
+            request_id_var.reset(token)
+
+
+_record_factory_installed = False
+
+
+def install_log_context(level: str = None):
+    """
+    为所有日志记录注入 request_id / trace_id；根 logger 尚未配置时按带 request_id 的格式配置
+    """
+    global _record_factory_installed
+    if not _record_factory_installed:
+        base_factory = logging.getLogRecordFactory()
+
+        def record_factory(*args, **kwargs):
+            record = base_factory(*args, **kwargs)
+            record.request_id = request_id_var.get() or "-"
+            record.trace_id = current_span().trace_id or "-"
+            return record
+
+        logging.setLogRecordFactory(record_factory)
+        _record_factory_installed = True
+
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig(
+            level=(level or os.getenv("LOG_LEVEL", "INFO")).upper(),
+            format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+        )
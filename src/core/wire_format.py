@@ -0,0 +1,192 @@
+# src/core/wire_format.py
+"""
+紧凑传输格式协商
+
+客户端在 Accept 中声明 application/msgpack（或 application/x-msgpack）时，
+以 MessagePack 返回同样的数据结构，其中坐标字段（COORDINATE_KEYS）的数值数组打包为 float32 类型缓冲区：
+- 扩展类型 1（点）：[经度, 纬度(, 高度)]，载荷为小端 float32 序列，解码为列表
+- 扩展类型 2（路径）：[[经度, 纬度], ...]，载荷首字节为每点的分量数，其后为按点顺序排列的小端 float32，
+  解码为二维列表
+float32 在经度 ±180 处的精度约为 1 米。未安装 msgpack 包时始终返回 JSON。
+
+体积收益主要来自坐标：推演与战役详情以文本为主，未压缩时比 JSON 小 13%~17%，
+经 gzip 压缩后反而略大（约 3%）；坐标密集的路径数据（如批量寻路结果）未压缩约为 JSON 的 1/5，
+gzip 后仍不到 JSON 的一半。
+"""
+
+import json
+import struct
+import logging
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+# 坐标缓冲区的 MessagePack 扩展类型编号
+POINT_EXT_TYPE = 1
+PATH_EXT_TYPE = 2
+# 值为 [经度, 纬度] 或其列表的字段名；只打包这些字段，其余数值保持原精度
+COORDINATE_KEYS = frozenset({
+    "coordinate", "coordinates", "position", "initial_position", "location",
+    "center", "from", "to", "path", "route",
+})
+
+
+def _parse_accept(accept: str) -> Dict[str, float]:
+    """解析 Accept 请求头为 {媒体类型: q 值}"""
+    result = {}
+    for item in accept.split(","):
+        parts = [p.strip() for p in item.split(";")]
+        media_type = parts[0].lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        result[media_type] = max(q, result.get(media_type, 0.0))
+    return result
+
+
+def negotiate_format(request: Request) -> str:
+    """
+    根据 Accept 请求头选择输出格式
+
+    Returns:
+        "msgpack" 或 "json"
+    """
+    if msgpack is None:
+        return "json"
+    accept = request.headers.get("accept")
+    if not accept:
+        return "json"
+    weights = _parse_accept(accept)
+    msgpack_q = max(weights.get(t, 0.0) for t in MSGPACK_MEDIA_TYPES)
+    if msgpack_q <= 0:
+        return "json"
+    json_q = max(weights.get(JSON_MEDIA_TYPE, 0.0), weights.get("application/*", 0.0), weights.get("*/*", 0.0))
+    # 同权重时以客户端显式列出的 msgpack 优先
+    return "msgpack" if msgpack_q >= json_q else "json"
+
+
+def _is_point(value: Any) -> bool:
+    return (isinstance(value, list) and 2 <= len(value) <= 3
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value))
+
+
+def _pack_coordinates(value: Any) -> Any:
+    """坐标字段的值转为 float32 扩展类型；不是数值点或点列表时原样返回"""
+    if _is_point(value):
+        return msgpack.ExtType(POINT_EXT_TYPE, struct.pack(f"<{len(value)}f", *value))
+    if isinstance(value, list) and value and all(_is_point(p) for p in value):
+        width = len(value[0])
+        if all(len(p) == width for p in value):
+            flat = [v for p in value for v in p]
+            return msgpack.ExtType(PATH_EXT_TYPE, bytes([width]) + struct.pack(f"<{len(flat)}f", *flat))
+    return value
+
+
+def _with_coordinate_buffers(data: Any) -> Any:
+    """递归替换 COORDINATE_KEYS 字段中的坐标数组"""
+    if isinstance(data, dict):
+        return {
+            key: _pack_coordinates(value) if key in COORDINATE_KEYS and isinstance(value, list)
+            else _with_coordinate_buffers(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [_with_coordinate_buffers(item) for item in data]
+    return data
+
+
+def _unpack_coordinates(code: int, payload: bytes) -> Any:
+    if code == POINT_EXT_TYPE:
+        return list(struct.unpack(f"<{len(payload) // 4}f", payload))
+    if code == PATH_EXT_TYPE:
+        width = payload[0]
+        flat = struct.unpack(f"<{(len(payload) - 1) // 4}f", payload[1:])
+        return [list(flat[i:i + width]) for i in range(0, len(flat), width)]
+    return msgpack.ExtType(code, payload)
+
+
+def encode(data: Any, fmt: str) -> bytes:
+    """按格式序列化数据"""
+    if fmt == "msgpack":
+        return msgpack.packb(_with_coordinate_buffers(data), use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(body: bytes, fmt: str) -> Any:
+    """按格式反序列化（坐标缓冲区还原为列表，精度为 float32）"""
+    if fmt == "msgpack":
+        return msgpack.unpackb(body, raw=False, ext_hook=_unpack_coordinates)
+    return json.loads(body)
+
+
+def media_type_for(fmt: str) -> str:
+    return MSGPACK_MEDIA_TYPE if fmt == "msgpack" else JSON_MEDIA_TYPE
+
+
+def negotiated_response(request: Request, data: Any, status_code: int = 200,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """按 Accept 协商的格式返回数据"""
+    fmt = negotiate_format(request)
+    response_headers = {"Vary": "Accept"}
+    if headers:
+        response_headers.update(headers)
+    return Response(
+        content=encode(data, fmt),
+        status_code=status_code,
+        media_type=media_type_for(fmt),
+        headers=response_headers
+    )
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    支持 MessagePack 协商的路由类
+
+    端点照常返回 dict；请求方接受 msgpack 时把 FastAPI 生成的 JSONResponse 转为 MessagePack。
+    端点自行构造的其他 Response（如带 ETag 的预序列化响应）不做处理。
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        original_handler = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            response = await original_handler(request)
+            if type(response) is not JSONResponse:
+                return response
+            response.headers.append("Vary", "Accept")
+            if negotiate_format(request) != "msgpack":
+                return response
+            data = json.loads(response.body)
+            msgpack_response = Response(
+                content=encode(data, "msgpack"),
+                status_code=response.status_code,
+                media_type=MSGPACK_MEDIA_TYPE,
+                background=response.background
+            )
+            # 按原始列表复制其余响应头，重复的头（如多个 Set-Cookie）不会被合并
+            msgpack_response.raw_headers.extend(
+                (name, value) for name, value in response.raw_headers
+                if name not in (b"content-length", b"content-type")
+            )
+            return msgpack_response
+
+        return handler
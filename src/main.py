@@ -1,6 +1,12 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+import time
+
+_process_start = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import os
 import sys
 from dotenv import load_dotenv
@@ -14,127 +20,167 @@ if project_root not in sys.path:
 # 加载 .env 文件（如果存在）
 load_dotenv()
 
-# 导入各功能模块的子应用或路由
-try:
-    from src.api.llm_api import app as llm_app
-    print("✅ Successfully imported llm_app")
-except ImportError as e:
-    print(f"❌ Error importing llm_app: {e}")
-    llm_app = None
-
-try:
-    from src.api.image_api import app as image_app
-    print("✅ Successfully imported image_app")
-except ImportError as e:
-    print(f"❌ Error importing image_app: {e}")
-    image_app = None
-
-try:
-    from src.api.multimodal_api import app as multimodal_app
-    print("✅ Successfully imported multimodal_app")
-except ImportError as e:
-    print(f"❌ Error importing multimodal_app: {e}")
-    multimodal_app = None
-
-# 👇 新增：战役推演 API 路由（关键！）
-try:
-    # 智能导入：根据Python路径和运行位置决定导入路径
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)  # src的上级目录
-    
-    # 检查Python路径是否包含项目根目录
-    root_in_path = any(path == project_root for path in sys.path[:3])
-    
-    if root_in_path:
-        # Python路径包含项目根目录，应该使用src.api
-        from src.api.battle_api import router as battle_router
+from src.core.app_registry import LazyASGIApp, StartupReport, include_routers, run_warmup
+from src.core.compression import CompressionMiddleware
+from src.core.http_client import close_http_client, get_http_client
+from src.core.load_shedding import LoadSheddingMiddleware
+from src.core.loop_monitor import install_default_executor, loop_monitor, shutdown_executors
+from src.core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY, MetricsMiddleware
+from src.core.tracing import TracingMiddleware, install_log_context, shutdown_tracing
+
+# 日志带上 request_id（未配置日志时按 LOG_LEVEL 配置根 logger）
+install_log_context()
+
+logger = logging.getLogger(__name__)
+
+startup_report = StartupReport(started_at=_process_start)
+
+# 子应用：首次请求（或启动后的后台预热）时才导入，大模型 / 图像 SDK 不拖慢启动
+SUB_APPS = [
+    ("/api/v1/llm", "src.api.llm_api"),
+    ("/api/v1/image", "src.api.image_api"),
+    ("/api/v1/multimodal", "src.api.multimodal_api"),
+]
+
+# 路由模块：(模块, 前缀)。模块导入时只定义路由，数据集在首次使用时加载
+ROUTERS = [
+    ("src.api.battle_api", "/api/v1"),
+    ("src.api.game_battle_api", None),
+    ("src.api.deduction_api", None),
+    ("src.api.dynasty_api", "/api/v1/dynasty"),
+    ("src.api.admin_api", "/api/v1/admin"),
+]
+
+lazy_apps = [LazyASGIApp(module, report=startup_report) for _, module in SUB_APPS]
+
+
+def _warmup_tasks():
+    """服务开始接收请求后在后台执行的预热任务；全部完成后 /readyz 才返回就绪"""
+    from src.api.game_battle_api import get_game_api
+    from src.ai_agent.deduction_library import get_deduction_library
+    from src.ai_agent.geo_validation import get_gazetteer
+    from src.ai_agent.knowledge_index import get_dynasty_index
+    from src.ai_agent.model_service import get_model_service
+
+    async def open_http_pool():
+        get_http_client()
+
+    top_battles = int(os.getenv("WARMUP_TOP_BATTLES", "5"))
+
+    tasks = [(f"import {lazy.module}", lazy.load) for lazy in lazy_apps]
+    tasks.append(("dynasty index", get_dynasty_index))
+    tasks.append(("game battle data + unit catalog", get_game_api))
+    tasks.append(("deduction library index", lambda: get_deduction_library().entries()))
+    tasks.append(("deduction place gazetteer", get_gazetteer))
+    tasks.append(("http connection pool", open_http_pool))
+    tasks.append(("model service clients", get_model_service))
+    tasks.append((f"prime top {top_battles} battles", lambda: get_game_api().prime_caches(top_battles)))
+    return tasks
+
+
+async def _close_connections():
+    """关闭共享连接池与已加载子应用持有的客户端"""
+    await close_http_client()
+    image_api = sys.modules.get("src.api.image_api")
+    if image_api is not None:
+        try:
+            await image_api.service.aclose()
+        except Exception as e:
+            logger.warning(f"关闭图像服务客户端失败: {e}")
+
+
+def _shutdown_sweep_pool():
+    """关闭参数扫描进程池（只在模拟模块已加载时）"""
+    battle_sweep = sys.modules.get("src.ai_agent.battle_sweep")
+    if battle_sweep is not None:
+        battle_sweep.shutdown_sweep_pool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 默认线程池替换为带统计的版本，再开始测量事件循环延迟
+    install_default_executor()
+    if os.getenv("LOOP_MONITOR", "1") != "0":
+        loop_monitor.start()
+    startup_report.mark_ready()
+    warmup_task = None
+    if os.getenv("STARTUP_WARMUP", "1") != "0":
+        warmup_task = asyncio.create_task(run_warmup(_warmup_tasks(), startup_report))
     else:
-        # 其他情况，尝试api直接导入
-        from api.battle_api import router as battle_router
-        
-except ImportError as e:
-    print(f"⚠️  战役推演模块未找到: {e}")
-    battle_router = None
-except Exception as e:
-    print(f"❌ 导入时发生其他错误: {e}")
-    battle_router = None
-
-# 👇 新增：游戏化战役 API 路由
-try:
-    # 智能导入：根据Python路径和运行位置决定导入路径
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)  # src的上级目录
-    
-    # 检查Python路径是否包含项目根目录
-    root_in_path = any(path == project_root for path in sys.path[:3])
-    
-    if root_in_path:
-        # Python路径包含项目根目录，应该使用src.api
-        from src.api.game_battle_api import router as game_battle_router
-    else:
-        # 其他情况，尝试api直接导入
-        from api.game_battle_api import router as game_battle_router
-        
-except ImportError as e:
-    print(f"⚠️  游戏化战役模块未找到: {e}")
-    game_battle_router = None
-except Exception as e:
-    print(f"❌ 游戏化战役API导入时发生错误: {e}")
-    game_battle_router = None
+        # 不预热时数据集在首次请求时加载，服务立即视为就绪
+        startup_report.mark_warm()
+    yield
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await loop_monitor.stop()
+    await _close_connections()
+    shutdown_executors()
+    _shutdown_sweep_pool()
+    shutdown_tracing()
+
 
 # 创建主 FastAPI 应用
 app = FastAPI(
     title="Mr诸葛军事教育AI助手",
     version="2.1",
-    description="基于大语言模型的军事教育AI代理，支持多模态内容生成与战役推演"
+    description="基于大语言模型的军事教育AI代理，支持多模态内容生成与战役推演",
+    lifespan=lifespan
 )
 
+# 响应压缩（brotli / gzip），对挂载的子应用同样生效
+app.add_middleware(CompressionMiddleware)
+# 昂贵路由（大模型 / 视频 / 图像生成）按路由限流，过载时快速返回 503 + Retry-After
+app.add_middleware(LoadSheddingMiddleware, routes=app.router.routes)
+# 请求耗时指标（计入压缩耗时，被限流拒绝的请求记为 503；路由表在之后注册同样可见）
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+# 请求 ID 与链路追踪（最外层，所有日志与 span 都能取到 request_id）
+app.add_middleware(TracingMiddleware, routes=app.router.routes)
+
 # 挂载子应用（API 接口）
-if llm_app:
-    app.mount("/api/v1/llm", llm_app)
-if image_app:
-    app.mount("/api/v1/image", image_app)
-if multimodal_app:
-    app.mount("/api/v1/multimodal", multimodal_app)
-
-# 👇 正确挂载战役推演路由（使用 include_router，不是 mount！）
-if battle_router:
-    app.include_router(battle_router, prefix="/api/v1")
-
-# 👇 挂载游戏化战役路由
-# 👇 挂载游戏化战役路由
-if game_battle_router:
-    app.include_router(game_battle_router)
-
-# 👇 新增：战役推演路由 (Deduction API)
-try:
-    from src.api.deduction_api import router as deduction_router
-    app.include_router(deduction_router)
-except ImportError:
-    try:
-        from api.deduction_api import router as deduction_router
-        app.include_router(deduction_router)
-    except Exception as e:
-        print(f"⚠️  推演模块加载失败: {e}")
-
-# 👇 新增：朝代数据API路由
-try:
-    from src.api.dynasty_api import router as dynasty_router
-    app.include_router(dynasty_router, prefix="/api/v1/dynasty")
-    print("✅ 成功导入朝代API路由")
-except ImportError as e:
-    print(f"❌ 导入朝代API路由失败: {e}")
-except Exception as e:
-    print(f"❌ 导入朝代API路由时发生其他错误: {e}")
-
-# 挂载静态文件目录
+for (path, _), lazy in zip(SUB_APPS, lazy_apps):
+    app.mount(path, lazy)
+
+include_routers(app, ROUTERS, startup_report)
+
+
+@app.get("/api/v1/startup-report")
+async def get_startup_report():
+    """启动耗时报告：路由导入、后台预热与子应用首次加载的耗时"""
+    return startup_report.as_dict()
+
+
+# 探针只读取内存状态，不加载数据、不访问文件系统或上游服务
+@app.get("/healthz")
+async def liveness_probe():
+    """存活探针：事件循环能够响应即视为存活"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readiness_probe():
+    """就绪探针：后台预热（索引、连接池、热门战役缓存）完成前返回 503"""
+    state = startup_report.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标：路由耗时、上游模型调用、主备切换、推演解析、视频轮询与缓存命中"""
+    return Response(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+# 挂载静态文件目录（预压缩副本 / 指纹化地址 / Range，见 src/core/static_assets.py）
 static_dir = "static"
+static_files = None
 if os.path.exists(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    from src.core.static_assets import PrecompressedStaticFiles
+    static_files = PrecompressedStaticFiles(directory=static_dir)
+    app.mount("/static", static_files, name="static")
 
 # 页面路由
 @app.get("/", response_class=FileResponse)
-async def root():
+async def root(request: Request):
+    if static_files is not None:
+        return await static_files.html_response("index.html", request)
     return FileResponse("static/index.html")
 
 # 保留 API 路由，移除旧的页面路由以保持简洁
@@ -0,0 +1,123 @@
+# tests/test_json_repair.py
+"""
+宽松 JSON 提取与修复、推演输出解析的单元测试
+"""
+
+import json
+
+import pytest
+
+from src.ai_agent.deduction_library import DeductionParseError, parse_deduction_content
+from src.core.json_repair import JSONRepairError, iter_json_values, parse_json_lenient, repair_json_text
+
+STEP = {
+    "title": "火攻",
+    "description": "黄盖诈降，顺风纵火",
+    "actions": [{"type": "marker", "coordinate": [113.9, 29.8], "label": "赤壁"}],
+}
+
+
+def _deduction_text(steps=1) -> str:
+    return json.dumps({"title": "赤壁之战推演", "steps": [STEP] * steps}, ensure_ascii=False)
+
+
+def test_valid_json_needs_no_fixes():
+    text = _deduction_text()
+    assert parse_json_lenient(text) == (json.loads(text), [])
+
+
+def test_markdown_fence_and_prose_are_skipped():
+    text = f"好的，推演如下：\n```json\n{_deduction_text()}\n```\n希望对你有帮助。"
+    data, _ = parse_json_lenient(text)
+    assert data == json.loads(_deduction_text())
+
+
+def test_trailing_commas_are_removed():
+    data, fixes = parse_json_lenient('{"a": [1, 2, 3,], "b": {"c": 1,},}')
+    assert data == {"a": [1, 2, 3], "b": {"c": 1}}
+    assert "trailing_commas" in fixes
+
+
+def test_single_quotes_and_python_literals():
+    data, fixes = parse_json_lenient("{'name': '曹操', 'alive': True, 'son': None}")
+    assert data == {"name": "曹操", "alive": True, "son": None}
+    assert "single_quotes" in fixes
+
+
+def test_truncated_output_keeps_complete_values():
+    text = _deduction_text(steps=2)
+    truncated = text[:text.rindex('"description"') + 20]
+    data, fixes = parse_json_lenient(truncated)
+    assert "truncated" in fixes
+    assert data["title"] == "赤壁之战推演"
+    assert data["steps"][0] == STEP
+
+
+def test_text_without_json_raises():
+    with pytest.raises(JSONRepairError):
+        repair_json_text("没有任何结构化内容")
+
+
+def test_iter_json_values_skips_values_inside_previous_ones():
+    values = [value for value, _ in iter_json_values('说明 [注] 然后 {"a": [1, {"b": 2}]} 结束', "{[")]
+    assert values == [["注"], {"a": [1, {"b": 2}]}]
+
+
+def test_deduction_after_bracketed_prose():
+    text = f"好的，以下是推演 [JSON格式]：{_deduction_text()}"
+    data, _ = parse_deduction_content(text)
+    assert data["title"] == "赤壁之战推演"
+    assert len(data["steps"]) == 1
+
+
+def test_deduction_truncated_with_trailing_comma():
+    text = _deduction_text(steps=2)
+    truncated = text[:text.rindex('{"title": "火攻"')].rstrip() + ","
+    data, issues = parse_deduction_content("```json\n" + truncated)
+    assert "truncated" in issues
+    assert len(data["steps"]) == 1
+
+
+def test_deduction_without_steps_raises():
+    with pytest.raises(DeductionParseError):
+        parse_deduction_content('结果 [无]：{"title": "空"}')
+
+
+def test_surrogate_pair_escapes_are_combined():
+    data, fixes = parse_json_lenient(r"{'icon': '\uD83D\uDE00 火攻', 'bad': '\uD83D'}")
+    assert "single_quotes" in fixes
+    assert data == {"icon": "\U0001F600 火攻", "bad": "\ufffd"}
+    json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def test_malformed_actions_are_dropped():
+    text = json.dumps({
+        "title": "推演",
+        "steps": [
+            {"description": "字符串动作", "actions": "marker"},
+            {"description": "非法路径", "actions": [
+                {"type": "path", "path": 5},
+                {"type": "arrow", "from": "a", "to": [1, 2]},
+                "marker",
+                {"type": "marker", "coordinate": [113.9, 29.8]},
+            ]},
+            "不是对象的阶段",
+        ],
+    }, ensure_ascii=False)
+    data, issues = parse_deduction_content(text)
+    assert [len(step["actions"]) for step in data["steps"]] == [0, 1]
+    assert "dropped_actions_in_step_1" in issues
+    assert "dropped_step_3" in issues
+
+
+def test_non_list_steps_raise_parse_error():
+    with pytest.raises(DeductionParseError):
+        parse_deduction_content('{"title": "推演", "steps": 5}')
+
+
+def test_non_string_labels_are_coerced():
+    data, _ = parse_deduction_content(
+        '{"title": "推演", "steps": [{"description": "x", '
+        '"actions": [{"type": "marker", "coordinate": [113.9, 29.8], "label": 1}]}]}'
+    )
+    assert data["steps"][0]["actions"][0]["label"] == "1"